@@ -1,23 +1,110 @@
 import sys
 import os
+import io
+import mmap
+import gzip
+import zlib
+import struct
 import json
+import csv
+import hashlib
+import re
 import requests
+import urllib3
 import ctypes
 import subprocess
 import platform
 import zipfile
 import tarfile
+import tempfile
+import shutil
 import time
-from datetime import datetime
+import random
+import heapq
+import bisect
+import threading
+import locale
+import queue
+import argparse
+import atexit
+import logging
+import logging.handlers
+from collections import deque, OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from urllib.parse import urlparse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QTabWidget, QWidget, QVBoxLayout, QHBoxLayout,
     QLabel, QLineEdit, QPushButton, QTableWidget, QTableWidgetItem,
     QHeaderView, QMessageBox, QTextEdit, QSplitter, QGroupBox, 
-    QCheckBox, QComboBox, QGridLayout, QScrollArea, QFrame
+    QCheckBox, QComboBox, QGridLayout, QScrollArea, QFrame, QFileDialog, QPlainTextEdit,
+    QTableWidgetSelectionRange
 )
-from PyQt5.QtCore import Qt, QTimer, QThread, pyqtSignal, QSize
-from PyQt5.QtGui import QFont, QBrush, QColor, QIcon, QIntValidator
+from PyQt5.QtCore import Qt, QTimer, QThread, QObject, QFileSystemWatcher, pyqtSignal, QSize, QEventLoop, QEvent
+from PyQt5.QtGui import QFont, QBrush, QColor, QIcon, QIntValidator, QTextDocument, QTextCursor
+
+# 日志：各子系统使用 bbdown_gui.* 下的记录器，由 setup_logging 配置输出
+log = logging.getLogger("bbdown_gui")
+api_log = logging.getLogger("bbdown_gui.api")
+relay_log = logging.getLogger("bbdown_gui.relay")
+proxy_log = logging.getLogger("bbdown_gui.proxy")
+task_log = logging.getLogger("bbdown_gui.tasks")
+install_log = logging.getLogger("bbdown_gui.install")
+options_log = logging.getLogger("bbdown_gui.options")
+auth_log = logging.getLogger("bbdown_gui.auth")
+verify_log = logging.getLogger("bbdown_gui.verify")
+library_log = logging.getLogger("bbdown_gui.library")
+disk_log = logging.getLogger("bbdown_gui.disk")
+schedule_log = logging.getLogger("bbdown_gui.schedule")
+replay_log = logging.getLogger("bbdown_gui.replay")
+LOG_LEVELS = ("DEBUG", "INFO", "WARNING", "ERROR")
+
+class JsonLogFormatter(logging.Formatter):
+    """每条日志写为一行JSON，extra传入的字段原样保留"""
+    
+    RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+    
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "msg": record.getMessage(),
+        }
+        entry.update((key, value) for key, value in vars(record).items() if key not in self.RESERVED)
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+def setup_logging(level="INFO", log_dir=None):
+    """日志记录只放入队列，由后台线程写入轮转文件和标准错误，调用线程（包括GUI线程）不做文件I/O"""
+    log_dir = log_dir or os.path.join(get_gui_data_dir(), "logs")
+    os.makedirs(log_dir, exist_ok=True)
+    file_handler = logging.handlers.RotatingFileHandler(
+        os.path.join(log_dir, "bbdown_gui.log"), maxBytes=5 * 1024 * 1024, backupCount=3, encoding="utf-8"
+    )
+    file_handler.setFormatter(JsonLogFormatter())
+    handlers = [file_handler]
+    # 打包为窗口程序时没有控制台，sys.stderr 为 None
+    if sys.stderr:
+        stream_handler = logging.StreamHandler()
+        stream_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s [%(name)s] %(message)s", "%H:%M:%S"))
+        handlers.append(stream_handler)
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, *handlers)
+    log.addHandler(logging.handlers.QueueHandler(log_queue))
+    log.propagate = False
+    set_log_level(level)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+def set_log_level(level):
+    """运行时调整日志级别，低于该级别的调用只做一次级别比较"""
+    log.setLevel(level.upper() if isinstance(level, str) else level)
 
 # 优化事件循环设置
 if sys.platform == "win32":
@@ -27,135 +114,3740 @@ if sys.platform == "win32":
     except:
         pass
 
-class BBDownAPIClient:
-    def __init__(self, host="localhost", port=58682):
-        self.base_url = f"http://{host}:{port}"
+class ServerUnavailable(Exception):
+    """熔断器处于断开状态，请求未发送"""
+
+# 确认超时提交时，允许任务创建时间早于本机提交时间的秒数（两端时钟偏差）
+SUBMIT_CLOCK_SKEW = 120
+
+def request_not_sent(error):
+    """请求是否在建立连接阶段就失败（服务器肯定没有收到请求体）"""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    if not isinstance(error, requests.ConnectionError):
+        return False
+    # 连接被拒绝等情况下requests包装的是urllib3的NewConnectionError（ConnectTimeoutError的子类）
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(reason, urllib3.exceptions.ConnectTimeoutError)
+
+class CircuitBreaker:
+    """连续失败达到阈值后断开，断开期间请求立即失败，由后台探测确认恢复后再闭合"""
+    
+    def __init__(self, failure_threshold=3, probe_interval=1.0, max_probe_interval=30.0):
+        self.failure_threshold = failure_threshold
+        self.probe_interval = probe_interval
+        self.max_probe_interval = max_probe_interval
+        self.failures = 0
+        self.state = "closed"  # closed / open
+        self.opened_at = None
+        self._lock = threading.Lock()
+    
+    def allow_request(self):
+        return self.state == "closed"
+    
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.state = "closed"
+            self.opened_at = None
+    
+    def record_failure(self):
+        """记录一次失败，刚进入断开状态时返回True"""
+        with self._lock:
+            self.failures += 1
+            if self.state == "closed" and self.failures >= self.failure_threshold:
+                self.state = "open"
+                self.opened_at = time.time()
+                return True
+            return False
+
+class ThreadLocalSession(threading.local):
+    """requests.Session不是线程安全的：每个线程各自创建一个Session，同一线程内复用连接"""
+    
+    def __init__(self):
+        self.session = requests.Session()
+
+class BBDownAPIClient:
+    recorder = None  # TrafficRecorder，设置后所有客户端的请求都会被录制
+    
+    def __init__(self, host="localhost", port=58682):
+        self.host = host
+        self.port = port
+        self.server_key = f"{host}:{port}"
+        self.base_url = f"http://{host}:{port}"
+        self.breaker = CircuitBreaker()
+        self._probe_thread = None
+        # 复用连接，并缓存带ETag的响应用于条件请求；客户端会被多个后台线程同时使用
+        self._sessions = ThreadLocalSession()
+        self._etag_cache = {}  # path -> (ETag, 数据)
+    
+    @property
+    def session(self):
+        return self._sessions.session
+    
+    @staticmethod
+    def build_task_payload(url, options=None):
+        """构建提交给 /add-task 的请求体"""
+        data = {"Url": url}
+        if options:
+            data.update(options)
+        return data
+    
+    def _request(self, method, path, timeout, **kwargs):
+        """发送请求；熔断器断开时立即抛出ServerUnavailable，连接失败和5xx计入熔断器"""
+        if not self.breaker.allow_request():
+            raise ServerUnavailable(f"服务器 {self.server_key} 不可用")
+        started = time.monotonic()
+        try:
+            response = self.session.request(method, f"{self.base_url}{path}", timeout=timeout, **kwargs)
+        except requests.RequestException:
+            self._record_failure()
+            if self.recorder:
+                self.recorder.record(self.server_key, method, path, kwargs.get("json"), None, started)
+            raise
+        if self.recorder:
+            self.recorder.record(self.server_key, method, path, kwargs.get("json"), response, started)
+        if response.status_code >= 500:
+            self._record_failure()
+        else:
+            self.breaker.record_success()
+        return response
+    
+    def _record_failure(self):
+        if self.breaker.record_failure():
+            self._probe_thread = threading.Thread(target=self._probe_until_available, daemon=True)
+            self._probe_thread.start()
+    
+    def _probe_until_available(self):
+        """断开期间以指数退避探测服务器，恢复后闭合熔断器"""
+        delay = self.breaker.probe_interval
+        while self.breaker.state == "open":
+            time.sleep(delay)
+            try:
+                requests.get(f"{self.base_url}/get-tasks/running", timeout=2).raise_for_status()
+                self.breaker.record_success()
+            except requests.RequestException:
+                delay = min(delay * 2, self.breaker.max_probe_interval)
+    
+    def is_available(self):
+        return self.breaker.allow_request()
+    
+    def _get_json(self, path, timeout=5):
+        """GET并解析JSON，非200返回None；服务器（如缓存代理）提供ETag时发送条件请求，未变化时复用上次结果"""
+        cached = self._etag_cache.get(path)
+        headers = {"If-None-Match": cached[0]} if cached else {}
+        response = self._request("GET", path, timeout=timeout, headers=headers)
+        if response.status_code == 304 and cached:
+            return cached[1]
+        if response.status_code != 200:
+            return None
+        data = response.json()
+        etag = response.headers.get("ETag")
+        if etag:
+            self._etag_cache[path] = (etag, data)
+        return data
+    
+    def get_tasks(self):
+        try:
+            return self._get_json("/get-tasks/")
+        except ServerUnavailable:
+            return None
+        except Exception as e:
+            api_log.warning("获取任务失败: %s", e)
+            return None
+    
+    def get_running_tasks(self):
+        try:
+            return self._get_json("/get-tasks/running") or []
+        except ServerUnavailable:
+            return []
+        except Exception as e:
+            api_log.warning("获取运行中任务失败: %s", e)
+            return []
+    
+    def get_finished_tasks(self):
+        try:
+            return self._get_json("/get-tasks/finished") or []
+        except ServerUnavailable:
+            return []
+        except Exception as e:
+            api_log.warning("获取已完成任务失败: %s", e)
+            return []
+    
+    def get_task(self, aid):
+        try:
+            return self._get_json(f"/get-tasks/{aid}")
+        except ServerUnavailable:
+            return None
+        except Exception as e:
+            api_log.warning("获取任务详情失败: %s", e)
+            return None
+    
+    def submit_task(self, payload):
+        """提交任务，返回 "ok"、"rejected"（服务器拒绝）、"unavailable"（服务器未收到，可以重新提交）
+        或 "unknown"（请求已发出但没有响应，且无法从任务列表确认服务器是否已接收）"""
+        submitted_at = time.time()
+        try:
+            response = self._request(
+                "POST", "/add-task",
+                json=payload,
+                headers={"Content-Type": "application/json"},
+                timeout=10
+            )
+        except ServerUnavailable:
+            return "unavailable"
+        except requests.RequestException as e:
+            if request_not_sent(e):
+                api_log.warning("添加任务失败，无法连接服务器: %s", e)
+                return "unavailable"
+            # 读超时等情况下服务器可能已经接收了任务，先查任务列表，避免重复下载
+            api_log.warning("添加任务未收到响应，查询任务列表确认: %s", e)
+            found = self.find_submitted_task(payload, submitted_at)
+            if found is None:
+                return "unknown"
+            return "ok" if found else "unavailable"
+        if response.status_code == 200:
+            return "ok"
+        return "unavailable" if response.status_code >= 500 else "rejected"
+    
+    def add_task(self, url, options=None):
+        return self.submit_task(self.build_task_payload(url, options)) == "ok"
+    
+    def find_submitted_task(self, payload, since):
+        """在任务列表中查找提交时间之后创建的同一视频任务；返回是否找到，无法获取任务列表时返回None"""
+        tasks = self.get_tasks()
+        if tasks is None:
+            return None
+        # 允许两端时钟有少量偏差
+        since -= SUBMIT_CLOCK_SKEW
+        for task in (tasks.get("Running") or []) + (tasks.get("Finished") or []):
+            if task.get("Url") == payload.get("Url") and (task.get("TaskCreateTime") or 0) >= since:
+                return True
+        return False
+    
+    def remove_finished_tasks(self):
+        try:
+            response = self._request("GET", "/remove-finished", timeout=5)
+            return response.status_code == 200
+        except ServerUnavailable:
+            return False
+        except Exception as e:
+            api_log.warning("移除已完成任务失败: %s", e)
+            return False
+    
+    def remove_failed_tasks(self):
+        try:
+            response = self._request("GET", "/remove-finished/failed", timeout=5)
+            return response.status_code == 200
+        except ServerUnavailable:
+            return False
+        except Exception as e:
+            api_log.warning("移除失败任务失败: %s", e)
+            return False
+    
+    def remove_task(self, aid):
+        try:
+            response = self._request("GET", f"/remove-finished/{aid}", timeout=5)
+            return response.status_code == 200
+        except ServerUnavailable:
+            return False
+        except Exception as e:
+            api_log.warning("移除特定任务失败: %s", e)
+            return False
+
+# 任务中继：只由中继轮询BBDown，通过SSE向多个GUI推送变化
+def task_key(task):
+    return f"{task.get('Aid')}|{task.get('TaskCreateTime')}"
+
+def diff_task_lists(old, new):
+    """计算两次任务列表之间的变化：{"Running": {"upsert": [...], "remove": [key...]}, ...}"""
+    delta = {}
+    for name in ("Running", "Finished"):
+        old_map = {task_key(task): task for task in old.get(name, [])}
+        new_map = {task_key(task): task for task in new.get(name, [])}
+        upsert = [task for key, task in new_map.items() if old_map.get(key) != task]
+        remove = [key for key in old_map if key not in new_map]
+        if upsert or remove:
+            delta[name] = {"upsert": upsert, "remove": remove}
+    return delta
+
+def apply_task_delta(state, delta):
+    """将变化应用到任务列表，保持原有顺序，新任务追加在末尾"""
+    result = {}
+    for name in ("Running", "Finished"):
+        tasks = {task_key(task): task for task in state.get(name, [])}
+        change = delta.get(name)
+        if change:
+            for key in change["remove"]:
+                tasks.pop(key, None)
+            for task in change["upsert"]:
+                tasks[task_key(task)] = task
+        result[name] = list(tasks.values())
+    return result
+
+class TaskRelay:
+    """轮询上游BBDown并保存权威任务状态，把变化推送给订阅者"""
+    
+    def __init__(self, upstream, interval=2.0, max_pending=100):
+        self.upstream = upstream
+        self.interval = interval
+        self.max_pending = max_pending
+        self.state = None
+        self.seq = 0
+        self.subscribers = set()
+        self.lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+    
+    def poll_once(self):
+        tasks = self.upstream.get_tasks()
+        if tasks is None:
+            return
+        with self.lock:
+            if self.state is None:
+                self.state = tasks
+                self._publish("snapshot", tasks)
+                return
+            delta = diff_task_lists(self.state, tasks)
+            self.state = tasks
+            if delta:
+                self._publish("delta", delta)
+    
+    def run(self):
+        while not self._stopping.is_set():
+            try:
+                self.poll_once()
+            except Exception as e:
+                relay_log.warning("中继轮询失败: %s", e)
+            # 收到提交或移除请求时立即重新轮询
+            self._wake.wait(self.interval)
+            self._wake.clear()
+    
+    def wake(self):
+        self._wake.set()
+    
+    def stop(self):
+        self._stopping.set()
+        self._wake.set()
+    
+    def _publish(self, event, data):
+        self.seq += 1
+        message = f"id: {self.seq}\nevent: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode('utf-8')
+        for subscriber in list(self.subscribers):
+            try:
+                subscriber.put_nowait(message)
+            except queue.Full:
+                # 跟不上推送的客户端断开，重连后重新获取快照
+                self.subscribers.discard(subscriber)
+                with subscriber.mutex:
+                    subscriber.queue.clear()
+                subscriber.put_nowait(None)
+    
+    def subscribe(self):
+        """订阅变化，返回队列，第一条消息是当前完整状态"""
+        subscriber = queue.Queue(self.max_pending)
+        with self.lock:
+            if self.state is not None:
+                subscriber.put(f"id: {self.seq}\nevent: snapshot\ndata: {json.dumps(self.state, ensure_ascii=False)}\n\n".encode('utf-8'))
+            self.subscribers.add(subscriber)
+        return subscriber
+    
+    def unsubscribe(self, subscriber):
+        self.subscribers.discard(subscriber)
+
+class RelayRequestHandler(BaseHTTPRequestHandler):
+    """中继HTTP接口：/events 推送变化，任务列表由中继状态直接返回，其余请求转发给上游"""
+    protocol_version = "HTTP/1.1"
+    relay = None
+    heartbeat = 15
+    
+    def log_message(self, format, *args):
+        pass
+    
+    def _send(self, code, body=b"", content_type="application/json"):
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def do_GET(self):
+        if self.path == "/events":
+            return self.stream_events()
+        state = self.relay.state
+        if state is not None and self.path in ("/get-tasks/", "/get-tasks/running", "/get-tasks/finished"):
+            data = {"/get-tasks/": state, "/get-tasks/running": state["Running"],
+                    "/get-tasks/finished": state["Finished"]}[self.path]
+            return self._send(200, json.dumps(data, ensure_ascii=False).encode('utf-8'))
+        self.forward()
+    
+    def do_POST(self):
+        self.forward()
+    
+    def forward(self):
+        """转发到上游BBDown，修改类请求完成后立即刷新中继状态"""
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length) if length else None
+        try:
+            response = requests.request(
+                self.command, f"{self.relay.upstream.base_url}{self.path}", data=body,
+                headers={"Content-Type": self.headers.get("Content-Type", "application/json")}, timeout=10
+            )
+        except requests.RequestException as e:
+            return self._send(502, str(e).encode('utf-8'), "text/plain; charset=utf-8")
+        if self.path.startswith(("/add-task", "/remove-finished")):
+            self.relay.wake()
+        self._send(response.status_code, response.content, response.headers.get("Content-Type", "application/json"))
+    
+    def stream_events(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        subscriber = self.relay.subscribe()
+        try:
+            while True:
+                try:
+                    message = subscriber.get(timeout=self.heartbeat)
+                except queue.Empty:
+                    message = b": ping\n\n"
+                if message is None:
+                    break
+                self.wfile.write(message)
+                self.wfile.flush()
+        except OSError:
+            pass
+        finally:
+            self.relay.unsubscribe(subscriber)
+            self.close_connection = True
+
+class QuietHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    
+    def handle_error(self, request, client_address):
+        # 客户端断开属于正常情况，不打印堆栈
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+def parse_host_port(text, default_host="localhost"):
+    host, _, port = text.rpartition(":")
+    return host or default_host, int(port)
+
+def run_relay(listen, upstream, interval):
+    """以中继模式运行（无界面）"""
+    upstream_host, upstream_port = parse_host_port(upstream)
+    relay = TaskRelay(BBDownAPIClient(upstream_host, upstream_port), interval)
+    RelayRequestHandler.relay = relay
+    host, port = parse_host_port(listen, "0.0.0.0")
+    server = QuietHTTPServer((host, port), RelayRequestHandler)
+    threading.Thread(target=relay.run, daemon=True).start()
+    relay_log.info("中继已启动: http://%s:%s -> %s（每 %s 秒轮询一次）", host, port, relay.upstream.base_url, interval)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        relay.stop()
+        server.server_close()
+    return 0
+
+# API缓存代理：ETag/304、压缩、合并并发的相同请求
+class CachingProxy:
+    """位于客户端和BBDown之间的缓存层，只缓存只读的 /get-tasks 请求"""
+    
+    CACHEABLE_PREFIX = "/get-tasks"
+    
+    def __init__(self, upstream_url, max_age=1.0, compress_min_size=1024):
+        self.upstream_url = upstream_url
+        self.max_age = max_age
+        self.compress_min_size = compress_min_size
+        self._sessions = ThreadLocalSession()  # 每个处理请求的线程使用各自的Session
+        self.cache = {}  # path -> {"fetched_at", "status", "body", "etag", "encoded": {编码: 压缩后内容}}
+        self.inflight = {}  # path -> threading.Event
+        self.lock = threading.Lock()
+        self.upstream_requests = 0
+    
+    @property
+    def session(self):
+        return self._sessions.session
+    
+    def get(self, path):
+        """获取缓存条目，过期时只由一个请求访问上游，其余并发请求等待同一结果"""
+        while True:
+            with self.lock:
+                entry = self.cache.get(path)
+                if entry and time.monotonic() - entry["fetched_at"] < self.max_age:
+                    return entry
+                event = self.inflight.get(path)
+                if event is None:
+                    event = self.inflight[path] = threading.Event()
+                    break
+            event.wait(15)
+        try:
+            entry = self._fetch(path)
+        finally:
+            with self.lock:
+                self.inflight.pop(path, None)
+            event.set()
+        return entry
+    
+    def _fetch(self, path):
+        with self.lock:
+            self.upstream_requests += 1
+        response = self.session.get(f"{self.upstream_url}{path}", timeout=10)
+        body = response.content
+        entry = {
+            "fetched_at": time.monotonic(),
+            "status": response.status_code,
+            "body": body,
+            "etag": f'"{hashlib.sha1(body).hexdigest()}"',
+            "encoded": {},
+        }
+        with self.lock:
+            previous = self.cache.get(path)
+            # 内容未变时沿用已压缩的结果
+            if previous and previous["etag"] == entry["etag"]:
+                entry["encoded"] = previous["encoded"]
+            if response.status_code == 200:
+                self.cache[path] = entry
+        return entry
+    
+    def encode(self, entry, accept_encoding):
+        """按客户端支持的编码压缩较大的响应，返回 (编码, 内容)"""
+        if len(entry["body"]) < self.compress_min_size:
+            return None, entry["body"]
+        accepted = [part.split(";")[0].strip() for part in accept_encoding.split(",")]
+        for encoding in ("gzip", "deflate"):
+            if encoding in accepted:
+                if encoding not in entry["encoded"]:
+                    if encoding == "gzip":
+                        entry["encoded"][encoding] = gzip.compress(entry["body"], 5)
+                    else:
+                        entry["encoded"][encoding] = zlib.compress(entry["body"], 5)
+                return encoding, entry["encoded"][encoding]
+        return None, entry["body"]
+    
+    def invalidate(self):
+        with self.lock:
+            self.cache.clear()
+
+class ProxyRequestHandler(BaseHTTPRequestHandler):
+    """缓存代理HTTP接口"""
+    protocol_version = "HTTP/1.1"
+    proxy = None
+    
+    def log_message(self, format, *args):
+        pass
+    
+    def do_GET(self):
+        if not self.path.startswith(CachingProxy.CACHEABLE_PREFIX):
+            return self.forward()
+        try:
+            entry = self.proxy.get(self.path)
+        except requests.RequestException as e:
+            return self.send_body(502, str(e).encode('utf-8'), "text/plain; charset=utf-8")
+        headers = {"ETag": entry["etag"], "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+        if entry["status"] == 200 and self.headers.get("If-None-Match") == entry["etag"]:
+            self.send_response(304)
+            for key, value in headers.items():
+                self.send_header(key, value)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        encoding, body = self.proxy.encode(entry, self.headers.get("Accept-Encoding", ""))
+        if encoding:
+            headers["Content-Encoding"] = encoding
+        self.send_body(entry["status"], body, "application/json", headers)
+    
+    def do_POST(self):
+        self.forward()
+    
+    def forward(self):
+        """转发非缓存请求（添加、移除任务），并使缓存失效"""
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length) if length else None
+        try:
+            response = self.proxy.session.request(
+                self.command, f"{self.proxy.upstream_url}{self.path}", data=body,
+                headers={"Content-Type": self.headers.get("Content-Type", "application/json")}, timeout=10
+            )
+        except requests.RequestException as e:
+            return self.send_body(502, str(e).encode('utf-8'), "text/plain; charset=utf-8")
+        self.proxy.invalidate()
+        self.send_body(response.status_code, response.content, response.headers.get("Content-Type", "application/json"))
+    
+    def send_body(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def run_proxy(listen, upstream):
+    """以缓存代理模式运行（无界面）"""
+    upstream_host, upstream_port = parse_host_port(upstream)
+    ProxyRequestHandler.proxy = CachingProxy(f"http://{upstream_host}:{upstream_port}")
+    host, port = parse_host_port(listen, "0.0.0.0")
+    server = QuietHTTPServer((host, port), ProxyRequestHandler)
+    proxy_log.info("缓存代理已启动: http://%s:%s -> http://%s:%s", host, port, upstream_host, upstream_port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+# API流量录制与回放：离线复现和测量真实任务列表下的刷新表现
+class TrafficRecorder:
+    """把BBDownAPIClient的请求、响应和耗时写入gzip压缩的JSONL文件，与同一请求上次相同的响应体只记录标记
+
+    每隔flush_interval秒刷新一次压缩流，程序异常退出时录制文件只丢失最后一小段
+    """
+    
+    def __init__(self, path, flush_interval=5.0):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.count = 0
+        self._last_bodies = {}  # (server, method, path) -> 上次响应体的SHA-1
+        self._last_flush = self.started
+        self.file = gzip.open(path, 'wt', encoding='utf-8')
+        self._write({"type": "header", "version": 1, "started_at": time.time()})
+    
+    def _write(self, record):
+        self.file.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+        now = time.monotonic()
+        if now - self._last_flush >= self.flush_interval:
+            self.file.flush()
+            self._last_flush = now
+    
+    def record(self, server, method, path, request_body, response, started):
+        """记录一次请求；response为None表示连接失败"""
+        elapsed = time.monotonic() - started
+        body = response.text if response is not None else ""
+        record = {
+            "t": round(started - self.started, 3),
+            "server": server,
+            "method": method,
+            "path": path,
+            "status": response.status_code if response is not None else 0,
+            "elapsed": round(elapsed, 4),
+        }
+        if request_body is not None:
+            record["request"] = request_body
+        key = (server, method, path)
+        digest = hashlib.sha1(body.encode('utf-8')).digest()
+        with self.lock:
+            if self.file.closed:
+                return
+            if self._last_bodies.get(key) == digest:
+                record["same"] = 1
+            else:
+                record["body"] = body
+                self._last_bodies[key] = digest
+            self._write(record)
+            self.count += 1
+    
+    def close(self):
+        with self.lock:
+            if not self.file.closed:
+                self.file.close()
+
+class TrafficReplay:
+    """按录制的时间线回放响应：把回放开始后经过的时间乘以速度，返回该时刻之前最近一次录制的同一请求的响应"""
+    
+    def __init__(self, path, speed=1.0, server=None):
+        self.speed = speed
+        self.timeline = {}  # (method, path) -> ([录制时刻...], [(状态码, 响应体, 耗时)...])
+        self.duration = 0
+        self.count = 0
+        self.served = 0
+        self.started = None
+        last_bodies = {}  # (method, path) -> 上次的响应体
+        last_ok = {}
+        distinct = {}  # SHA-1 -> 响应体，相同内容只保留一份
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            try:
+                for line in f:
+                    record = json.loads(line)
+                    if record.get("type") == "header":
+                        continue
+                    server = server or record["server"]
+                    if record["server"] != server:
+                        continue
+                    key = (record["method"], record["path"])
+                    if record.get("same"):
+                        body = last_bodies.get(key, b"")
+                    else:
+                        body = record.get("body", "").encode('utf-8')
+                        body = distinct.setdefault(hashlib.sha1(body).digest(), body)
+                    last_bodies[key] = body
+                    status = record["status"]
+                    # 经缓存代理录制的304没有响应体，回放时返回上次的完整响应
+                    if status == 304 and key in last_ok:
+                        status, body = 200, last_ok[key]
+                    elif status == 200:
+                        last_ok[key] = body
+                    times, responses = self.timeline.setdefault(key, ([], []))
+                    times.append(record["t"])
+                    responses.append((status, body, record["elapsed"]))
+                    self.duration = max(self.duration, record["t"])
+                    self.count += 1
+            except (EOFError, ValueError) as e:
+                # 录制程序异常退出时压缩流没有结尾，最后一行也可能不完整，回放已读取的部分
+                replay_log.warning("录制文件不完整，只回放前 %s 个请求: %s", self.count, e)
+        if not self.count:
+            raise Exception(f"录制文件中没有 {server} 的请求" if server else "录制文件中没有请求")
+        self.server = server
+    
+    def start(self):
+        self.started = time.monotonic()
+    
+    def position(self):
+        """当前对应的录制时刻（秒）"""
+        return (time.monotonic() - self.started) * self.speed
+    
+    def lookup(self, method, path):
+        """返回 (状态码, 响应体, 耗时)，没有录制过的请求返回None；录制开始前的请求使用第一次响应"""
+        entry = self.timeline.get((method, path))
+        if not entry:
+            return None
+        times, responses = entry
+        self.served += 1
+        return responses[max(bisect.bisect_right(times, self.position()) - 1, 0)]
+
+class ReplayRequestHandler(BaseHTTPRequestHandler):
+    """回放HTTP接口：按录制时的耗时（除以速度）延迟后返回录制的响应，录制中连接失败的请求直接断开"""
+    protocol_version = "HTTP/1.1"
+    replay = None
+    
+    def log_message(self, format, *args):
+        pass
+    
+    def do_GET(self):
+        self.respond()
+    
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        if length:
+            self.rfile.read(length)
+        self.respond()
+    
+    def respond(self):
+        response = self.replay.lookup(self.command, self.path)
+        if response is None:
+            status, body, elapsed = 404, b"", 0
+        else:
+            status, body, elapsed = response
+        time.sleep(elapsed / self.replay.speed)
+        if status == 0:
+            self.close_connection = True
+            return
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def run_replay(path, listen, speed, server=None):
+    """以回放模式运行（无界面），GUI连接回放地址即可离线复现录制时的任务列表"""
+    try:
+        replay = TrafficReplay(path, speed, server)
+    except Exception as e:
+        replay_log.error("读取录制文件失败: %s", e)
+        return 1
+    ReplayRequestHandler.replay = replay
+    host, port = parse_host_port(listen, "0.0.0.0")
+    httpd = QuietHTTPServer((host, port), ReplayRequestHandler)
+    replay.start()
+    replay_log.info(
+        "回放已启动: http://%s:%s，%s 的 %s 个请求，录制时长 %.0f 秒，速度 %sx",
+        host, port, replay.server, replay.count, replay.duration, speed
+    )
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+    replay_log.info("回放结束，共响应 %s 个请求", replay.served)
+    return 0
+
+class RelayAPIClient(BBDownAPIClient):
+    """连接任务中继的客户端：任务列表来自SSE推送，其余操作经中继转发"""
+    
+    def __init__(self, host="localhost", port=58700, on_change=None):
+        super().__init__(host, port)
+        self.on_change = on_change
+        self.state = None
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._listen, daemon=True)
+        self._thread.start()
+    
+    def get_tasks(self):
+        """返回最近一次推送的状态，未连接时返回None"""
+        state = self.state
+        return {name: list(state[name]) for name in ("Running", "Finished")} if state else None
+    
+    def close(self):
+        self._stopping.set()
+    
+    def _listen(self):
+        delay = 1
+        while not self._stopping.is_set():
+            try:
+                with requests.get(f"{self.base_url}/events", stream=True, timeout=(5, RelayRequestHandler.heartbeat * 3)) as response:
+                    response.raise_for_status()
+                    delay = 1
+                    event, data = None, []
+                    # 逐行读取原始流，iter_lines会等缓冲区填满才返回，推送会被延迟
+                    for raw in iter(response.raw.readline, b''):
+                        if self._stopping.is_set():
+                            return
+                        line = raw.decode('utf-8').rstrip('\r\n')
+                        if line.startswith("event:"):
+                            event = line[6:].strip()
+                        elif line.startswith("data:"):
+                            data.append(line[5:].strip())
+                        elif not line and data:
+                            self._handle_event(event, json.loads("\n".join(data)))
+                            event, data = None, []
+            except (requests.RequestException, ValueError) as e:
+                relay_log.info("中继连接断开: %s", e)
+            self.state = None
+            if self.on_change:
+                self.on_change()
+            self._stopping.wait(delay)
+            delay = min(delay * 2, 30)
+    
+    def _handle_event(self, event, data):
+        if event == "snapshot":
+            self.state = data
+        elif event == "delta" and self.state is not None:
+            self.state = apply_task_delta(self.state, data)
+        else:
+            return
+        if self.on_change:
+            self.on_change()
+
+# 多服务器管理
+class ServerPool:
+    """管理主服务器和附加服务器的API客户端，合并查询所有服务器的任务"""
+    
+    def __init__(self, primary):
+        self.primary = primary
+        self.extra = {}  # server_key -> BBDownAPIClient
+    
+    def set_primary(self, client):
+        self.primary = client
+    
+    def add(self, host, port):
+        """注册一个附加服务器，已存在时返回已有客户端"""
+        key = f"{host}:{port}"
+        if key == self.primary.server_key:
+            return self.primary
+        if key not in self.extra:
+            self.extra[key] = BBDownAPIClient(host, port)
+        return self.extra[key]
+    
+    def remove(self, server_key):
+        self.extra.pop(server_key, None)
+    
+    def clients(self):
+        """主服务器在前的全部客户端"""
+        return [self.primary] + [c for k, c in self.extra.items() if k != self.primary.server_key]
+    
+    def get(self, server_key):
+        """按服务器标识获取客户端，未知服务器返回主服务器"""
+        if server_key == self.primary.server_key:
+            return self.primary
+        return self.extra.get(server_key, self.primary)
+    
+    def find(self, server_key):
+        """按服务器标识获取客户端，服务器不在列表中时返回None"""
+        if server_key == self.primary.server_key:
+            return self.primary
+        return self.extra.get(server_key)
+    
+    def _map(self, func):
+        clients = self.clients()
+        if len(clients) == 1:
+            return [(clients[0], func(clients[0]))]
+        with ThreadPoolExecutor(max_workers=len(clients)) as executor:
+            return list(zip(clients, executor.map(func, clients)))
+    
+    def get_tasks(self):
+        """并发获取所有服务器的任务，并为每个任务标注所属服务器（_Server）"""
+        merged = {"Running": [], "Finished": []}
+        any_success = False
+        for client, tasks in self._map(lambda c: c.get_tasks()):
+            if tasks is None:
+                continue
+            any_success = True
+            for name in ("Running", "Finished"):
+                merged[name].extend(dict(task, _Server=client.server_key) for task in tasks.get(name, []))
+        return merged if any_success else None
+    
+    def remove_finished_tasks(self):
+        return all(result for _, result in self._map(lambda c: c.remove_finished_tasks()))
+    
+    def remove_failed_tasks(self):
+        return all(result for _, result in self._map(lambda c: c.remove_failed_tasks()))
+    
+    def remove_task(self, aid):
+        return any(result for _, result in self._map(lambda c: c.remove_task(aid)))
+
+def parse_server_list(text):
+    """解析 "host:port, host:port" 形式的服务器列表，返回 [(host, port)]"""
+    servers = []
+    for part in text.replace("，", ",").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "://" in part:
+            part = urlparse(part).netloc
+        host, _, port = part.rpartition(":")
+        if not host or not port.isdigit() or not (1 <= int(port) <= 65535):
+            raise ValueError(f"无效的服务器地址: {part}")
+        servers.append((host, int(port)))
+    return servers
+
+# 网络请求线程
+class APITaskThread(QThread):
+    finished = pyqtSignal(object)
+    
+    def __init__(self, api_client, task_type, *args, **kwargs):
+        super().__init__()
+        self.api_client = api_client
+        self.task_type = task_type
+        self.args = args
+        self.kwargs = kwargs
+        
+    def run(self):
+        try:
+            if self.task_type == "get_tasks":
+                result = self.api_client.get_tasks()
+            elif self.task_type == "get_running_tasks":
+                result = self.api_client.get_running_tasks()
+            elif self.task_type == "get_finished_tasks":
+                result = self.api_client.get_finished_tasks()
+            elif self.task_type == "get_task":
+                result = self.api_client.get_task(*self.args)
+            elif self.task_type == "add_task":
+                result = self.api_client.add_task(*self.args, **self.kwargs)
+            elif self.task_type == "submit_task":
+                result = self.api_client.submit_task(*self.args)
+            elif self.task_type == "remove_finished_tasks":
+                result = self.api_client.remove_finished_tasks()
+            elif self.task_type == "remove_failed_tasks":
+                result = self.api_client.remove_failed_tasks()
+            elif self.task_type == "remove_task":
+                result = self.api_client.remove_task(*self.args)
+            else:
+                result = None
+                
+            self.finished.emit(result)
+        except Exception as e:
+            api_log.warning("API线程错误: %s", e)
+            self.finished.emit(None)
+
+def get_gui_data_dir():
+    """获取GUI自身的数据目录（与 ~/.bbdown 分开，删除BBDown文件时不受影响）"""
+    data_dir = os.path.join(os.path.expanduser("~"), ".bbdown_gui")
+    os.makedirs(data_dir, exist_ok=True)
+    return data_dir
+
+# 视频标识规范化
+BBDOWN_ARCHIVE_FILE = "BBDown.archives"
+BV_TABLE = "FcwAPNKTMug3GV5Lj7EJnHpWsx4tb8haYeviqBz6rkCy12mUSDQX9RdoZf"
+BV_XOR_CODE = 23442827791579
+BV_MASK_CODE = 2251799813685247
+BV_MAX_AID = 1 << 51
+BV_PATTERN = re.compile(r"BV1[1-9A-HJ-NP-Za-km-z]{9}")
+AV_PATTERN = re.compile(r"(?i)\bav(\d+)")
+EP_SS_PATTERN = re.compile(r"(?i)\b(ep|ss)(\d+)")
+
+def av_to_bv(aid):
+    """AV号转换为BV号"""
+    chars = list("BV1000000000")
+    index = len(chars) - 1
+    value = (BV_MAX_AID | int(aid)) ^ BV_XOR_CODE
+    while value > 0:
+        chars[index] = BV_TABLE[value % 58]
+        value //= 58
+        index -= 1
+    chars[3], chars[9] = chars[9], chars[3]
+    chars[4], chars[7] = chars[7], chars[4]
+    return "".join(chars)
+
+def bv_to_av(bvid):
+    """BV号转换为AV号，格式不正确时返回None"""
+    if not BV_PATTERN.fullmatch(bvid):
+        return None
+    chars = list(bvid)
+    chars[3], chars[9] = chars[9], chars[3]
+    chars[4], chars[7] = chars[7], chars[4]
+    value = 0
+    for char in chars[3:]:
+        value = value * 58 + BV_TABLE.index(char)
+    return (value & BV_MASK_CODE) ^ BV_XOR_CODE
+
+def normalize_video_id(text):
+    """将URL、BV/av/ep/ss号、短链接等输入规范化为 (视频ID, 分P) ，无法识别时返回 (None, None)
+
+    视频ID统一为 "av<数字>"、"ep<数字>"、"ss<数字>" 或短链接 "b23:<代码>"。
+    """
+    if not text:
+        return None, None
+    text = text.strip()
+    page = None
+    if "://" in text or text.startswith(("www.", "b23.tv/", "bilibili.com/", "m.bilibili.com/")):
+        parsed = urlparse(text if "://" in text else "https://" + text)
+        query = dict(part.split("=", 1) for part in parsed.query.split("&") if "=" in part)
+        if query.get("p", "").isdigit():
+            page = int(query["p"])
+        if parsed.netloc.lower().endswith("b23.tv"):
+            code = parsed.path.strip("/").split("/")[0]
+            return (f"b23:{code}" if code else None), page
+        text = parsed.path
+    match = BV_PATTERN.search(text)
+    if match:
+        aid = bv_to_av(match.group(0))
+        return (f"av{aid}" if aid else match.group(0)), page
+    match = AV_PATTERN.search(text)
+    if match:
+        return f"av{int(match.group(1))}", page
+    match = EP_SS_PATTERN.search(text)
+    if match:
+        return f"{match.group(1).lower()}{int(match.group(2))}", page
+    if text.isdigit():
+        return f"av{int(text)}", page
+    return None, page
+
+# 分页选择最多展开的页数，超出时按全部分P处理，避免 "1-99999999" 这类输入展开出巨大的集合
+MAX_SELECTED_PAGES = 10000
+
+def parse_page_selection(text):
+    """解析分页选择（如 "1-5,8"），返回页码集合；ALL/LAST/NEW等无法展开或超过MAX_SELECTED_PAGES页的返回None表示全部分P"""
+    if not text:
+        return None
+    pages = set()
+    for part in str(text).replace("，", ",").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            start, _, end = part.partition("-")
+            if not (start.strip().isdigit() and end.strip().isdigit()):
+                return None
+            start, end = int(start), int(end)
+            if start > end:
+                start, end = end, start
+            if end - start + 1 > MAX_SELECTED_PAGES:
+                return None
+            pages.update(range(start, end + 1))
+        elif part.isdigit():
+            pages.add(int(part))
+        else:
+            return None
+        if len(pages) > MAX_SELECTED_PAGES:
+            return None
+    return frozenset(pages) or None
+
+def format_page_selection(pages):
+    """将页码列表压缩为BBDown的分页选择格式（如 "1-5,8"）"""
+    ranges = []
+    for page in sorted(pages):
+        if ranges and page == ranges[-1][1] + 1:
+            ranges[-1][1] = page
+        else:
+            ranges.append([page, page])
+    return ",".join(str(start) if start == end else f"{start}-{end}" for start, end in ranges)
+
+# 分P分片提交
+class FanOutJob:
+    """把一个多P视频按分P范围拆分成多个分片任务，作为一个逻辑任务跟踪合并进度"""
+    
+    def __init__(self, job_id, url, options, page_chunks=(), servers=()):
+        self.job_id = job_id
+        self.url = url
+        self.options = options
+        self.created_at = time.time()
+        self.title = url
+        self.chunks = []
+        for index, pages in enumerate(page_chunks):
+            self.chunks.append({
+                "index": index,
+                "select_page": format_page_selection(pages),
+                "pages": len(pages),
+                "server": servers[index % len(servers)],
+                "state": "waiting",
+                "progress": 0.0,
+                "aid": None,
+            })
+    
+    def to_dict(self):
+        return {
+            "job_id": self.job_id, "url": self.url, "options": self.options,
+            "created_at": self.created_at, "title": self.title, "chunks": self.chunks,
+        }
+    
+    @classmethod
+    def from_dict(cls, data):
+        job = cls(data["job_id"], data["url"], data["options"])
+        job.created_at = data.get("created_at", job.created_at)
+        job.title = data.get("title") or job.url
+        job.chunks = data["chunks"]
+        for chunk in job.chunks:
+            # 退出时正在提交的分片可能已被服务器接收，按已提交处理，避免重复下载
+            if chunk["state"] == "submitting":
+                chunk["state"] = "submitted"
+        return job
+    
+    def payload_for(self, chunk):
+        """分片对应的提交请求体"""
+        payload = dict(self.options)
+        payload["Url"] = self.url
+        payload["SelectPage"] = chunk["select_page"]
+        return payload
+    
+    def progress(self):
+        """按分P数加权的合并进度"""
+        total_pages = sum(chunk["pages"] for chunk in self.chunks)
+        if not total_pages:
+            return 0.0
+        return sum(chunk["progress"] * chunk["pages"] for chunk in self.chunks) / total_pages
+    
+    def count(self, *states):
+        return sum(1 for chunk in self.chunks if chunk["state"] in states)
+    
+    def state_text(self):
+        if self.count("failed"):
+            return f"{self.count('failed')} 个分片失败"
+        if self.count("done") == len(self.chunks):
+            return "完成"
+        if self.count("running", "submitted", "submitting"):
+            return "下载中"
+        return "等待中"
+    
+    def servers(self):
+        return sorted({chunk["server"] for chunk in self.chunks})
+
+class FanOutManager:
+    """管理分片任务：每台服务器同一时间只运行一个同视频分片（BBDown会拒绝同一视频的并行任务）
+
+    分片任务写入磁盘，程序重启后继续跟踪和提交
+    """
+    
+    def __init__(self, path=None):
+        self.path = path or os.path.join(get_gui_data_dir(), "fanout_jobs.json")
+        self.jobs = {}
+        self.claimed = set()  # 已对应到分片的服务器任务 (server, aid, create_time)
+        self._next_id = 1
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            for item in data.get("jobs", []):
+                job = FanOutJob.from_dict(item)
+                self.jobs[job.job_id] = job
+            self.claimed = {tuple(key) for key in data.get("claimed", [])}
+            self._next_id = max([data.get("next_id", 1)] + [job_id + 1 for job_id in self.jobs])
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            pass
+    
+    def save(self):
+        """保存所有分片任务；没有分片任务时认领记录也不再需要"""
+        if not self.jobs:
+            self.claimed.clear()
+        write_json_atomic(self.path, {
+            "next_id": self._next_id,
+            "jobs": [job.to_dict() for job in self.jobs.values()],
+            "claimed": sorted(list(key) for key in self.claimed),
+        })
+    
+    def server_keys(self):
+        return {chunk["server"] for job in self.jobs.values() for chunk in job.chunks}
+    
+    def remove_job(self, job_id):
+        if self.jobs.pop(job_id, None):
+            self.save()
+    
+    @staticmethod
+    def split_pages(select_page, chunk_size):
+        """将分页选择拆分为若干页码分片"""
+        pages = parse_page_selection(select_page)
+        if not pages:
+            return []
+        pages = sorted(pages)
+        chunk_size = max(1, chunk_size)
+        return [pages[i:i + chunk_size] for i in range(0, len(pages), chunk_size)]
+    
+    def create_job(self, url, options, chunk_size, servers, existing_tasks=()):
+        """创建分片任务，existing_tasks中已存在的同URL任务不会被误认作分片"""
+        page_chunks = self.split_pages(options.get("SelectPage"), chunk_size)
+        if not page_chunks:
+            return None
+        job = FanOutJob(self._next_id, url, options, page_chunks, servers)
+        self._next_id += 1
+        for task in existing_tasks:
+            if task.get("Url") == url:
+                self.claimed.add((task.get("_Server"), task.get("Aid"), task.get("TaskCreateTime")))
+        self.jobs[job.job_id] = job
+        self.save()
+        return job
+    
+    def releasable_chunks(self):
+        """返回可以提交的分片：其所在服务器上该任务没有正在进行的分片"""
+        releasable = []
+        for job in self.jobs.values():
+            busy = {c["server"] for c in job.chunks if c["state"] in ("submitting", "submitted", "running")}
+            for chunk in job.chunks:
+                if chunk["state"] == "waiting" and chunk["server"] not in busy:
+                    busy.add(chunk["server"])
+                    releasable.append((job, chunk))
+        return releasable
+    
+    def update_from_tasks(self, running_tasks, finished_tasks):
+        """根据服务器任务列表更新分片状态，返回属于分片的任务标识集合"""
+        chunk_tasks = set()
+        # 只在分片状态变化时保存，运行中的进度变化不写盘
+        before = [(chunk["state"], chunk["aid"]) for job in self.jobs.values() for chunk in job.chunks]
+        for job in self.jobs.values():
+            for chunk in job.chunks:
+                if chunk["state"] not in ("submitted", "running"):
+                    continue
+                for task in running_tasks:
+                    if task.get("_Server") == chunk["server"] and task.get("Url") == job.url:
+                        chunk["state"] = "running"
+                        chunk["aid"] = task.get("Aid")
+                        chunk["progress"] = task.get("Progress", 0) or 0
+                        job.title = task.get("Title") or job.title
+                        chunk_tasks.add((task.get("_Server"), task.get("Aid"), task.get("TaskCreateTime")))
+                        break
+                else:
+                    for task in finished_tasks:
+                        key = (task.get("_Server"), task.get("Aid"), task.get("TaskCreateTime"))
+                        if key in self.claimed or task.get("_Server") != chunk["server"] or task.get("Url") != job.url:
+                            continue
+                        self.claimed.add(key)
+                        chunk["aid"] = task.get("Aid")
+                        job.title = task.get("Title") or job.title
+                        if task.get("IsSuccessful", False):
+                            chunk["state"] = "done"
+                            chunk["progress"] = 1.0
+                        else:
+                            chunk["state"] = "failed"
+                            chunk["progress"] = task.get("Progress", 0) or 0
+                        break
+        # 已认领的已完成任务也属于分片
+        for task in finished_tasks:
+            key = (task.get("_Server"), task.get("Aid"), task.get("TaskCreateTime"))
+            if key in self.claimed:
+                chunk_tasks.add(key)
+        if before != [(chunk["state"], chunk["aid"]) for job in self.jobs.values() for chunk in job.chunks]:
+            self.save()
+        return chunk_tasks
+    
+    def retry_failed(self, job_id):
+        """将失败的分片重新放回等待队列"""
+        job = self.jobs.get(job_id)
+        if not job:
+            return 0
+        count = 0
+        for chunk in job.chunks:
+            if chunk["state"] == "failed":
+                chunk["state"] = "waiting"
+                chunk["progress"] = 0.0
+                count += 1
+        if count:
+            self.save()
+        return count
+    
+    def queued_payloads(self):
+        """尚未提交的分片请求体"""
+        return [job.payload_for(chunk) for job in self.jobs.values() for chunk in job.chunks if chunk["state"] == "waiting"]
+
+# 重复任务检测
+class VideoIdIndex:
+    """按规范化视频ID索引各来源（运行中、已完成、历史、排队中、BBDown存档）的任务，O(1)判断重复"""
+    
+    SOURCE_LABELS = {
+        "running": "运行中",
+        "finished": "已完成",
+        "history": "历史记录",
+        "submitted": "已提交",
+        "queued": "排队中",
+        "archive": "BBDown存档",
+        "library": "本地文件",
+    }
+    
+    def __init__(self):
+        self.sources = {source: {} for source in self.SOURCE_LABELS}  # source -> {video_id: [(pages, label)]}
+        self.archive_mtime = None
+    
+    @staticmethod
+    def task_keys(url, aid=None):
+        """返回一个任务可用于查重的所有视频ID"""
+        keys = set()
+        key, _ = normalize_video_id(url)
+        if key:
+            keys.add(key)
+        if aid and str(aid).isdigit():
+            keys.add(f"av{int(aid)}")
+        return keys
+    
+    def add(self, source, url, aid=None, pages=None, label=""):
+        """向指定来源添加一个任务"""
+        entries = self.sources[source]
+        for key in self.task_keys(url, aid):
+            entries.setdefault(key, []).append((pages, label or url))
+    
+    def replace_source(self, source, items):
+        """用 (url, aid, pages, label) 列表整体替换某个来源"""
+        self.sources[source] = {}
+        for url, aid, pages, label in items:
+            self.add(source, url, aid, pages, label)
+    
+    def find_duplicates(self, url, select_page=None):
+        """查找与给定输入重复的任务，返回 [(来源名称, 描述)]"""
+        key, page = normalize_video_id(url)
+        if not key:
+            return []
+        pages = parse_page_selection(select_page)
+        if page is not None and pages is None:
+            pages = frozenset([page])
+        duplicates = []
+        for source, entries in self.sources.items():
+            for existing_pages, label in entries.get(key, ()):
+                if pages is None or existing_pages is None or pages & existing_pages:
+                    duplicates.append((self.SOURCE_LABELS[source], label))
+        return duplicates
+    
+    def load_archive_file(self, path):
+        """读取BBDown的存档文件（SaveArchivesToFile），文件未变化时跳过"""
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            self.sources["archive"] = {}
+            self.archive_mtime = None
+            return
+        if mtime == self.archive_mtime:
+            return
+        self.archive_mtime = mtime
+        with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+            content = f.read()
+        try:
+            values = [str(v) for v in json.loads(content)]
+        except (ValueError, TypeError):
+            values = re.findall(r"BV1[0-9A-Za-z]{9}|(?i:av|ep|ss)\d+|\d+", content)
+        self.replace_source("archive", [(value, None, None, value) for value in values])
+
+# 任务统计
+class RollingAggregate:
+    """一个时间窗口内的累计值：任务结束时加入，超出窗口时移出，均为增量更新"""
+    
+    def __init__(self, span=None):
+        self.span = span  # 窗口秒数，None表示全部
+        self.events = []  # 按结束时间排列的小顶堆 (时间, 序号, 事件)
+        self.totals = self._empty()
+        self.servers = {}
+    
+    @staticmethod
+    def _empty():
+        return {"count": 0, "success": 0, "bytes": 0, "durations": []}
+    
+    def _apply(self, event, sign):
+        buckets = (self.totals, self.servers.setdefault(event["server"], self._empty()))
+        for bucket in buckets:
+            bucket["count"] += sign
+            bucket["success"] += sign * event["success"]
+            bucket["bytes"] += sign * event["bytes"]
+            if event["duration"] is None:
+                continue
+            if sign > 0:
+                bisect.insort(bucket["durations"], event["duration"])
+            else:
+                del bucket["durations"][bisect.bisect_left(bucket["durations"], event["duration"])]
+        if not buckets[1]["count"]:
+            del self.servers[event["server"]]
+    
+    def add(self, event, seq, now):
+        if self.span is not None:
+            if event["time"] < now - self.span:
+                return
+            heapq.heappush(self.events, (event["time"], seq, event))
+        self._apply(event, 1)
+    
+    def expire(self, now):
+        if self.span is None:
+            return
+        while self.events and self.events[0][0] < now - self.span:
+            self._apply(heapq.heappop(self.events)[2], -1)
+
+class TaskStatistics:
+    """按多个滚动窗口维护已结束任务的统计，并记录运行中任务的实时状态"""
+    
+    WINDOWS = (("最近1小时", 3600), ("最近24小时", 86400), ("最近7天", 7 * 86400), ("全部", None))
+    
+    def __init__(self):
+        self.windows = [RollingAggregate(span) for _, span in self.WINDOWS]
+        self.first_time = None
+        self._seq = 0
+        self.running = {}  # server -> {"count", "speed"}
+    
+    def add(self, record):
+        """加入一条任务结束记录"""
+        finish_time = record.get("TaskFinishTime") or record.get("ts")
+        if not finish_time:
+            return
+        create_time = record.get("TaskCreateTime")
+        event = {
+            "time": finish_time,
+            "server": record.get("server"),
+            "success": 1 if record.get("IsSuccessful", False) else 0,
+            "bytes": record.get("TotalDownloadedBytes") or 0,
+            "duration": finish_time - create_time if create_time and finish_time >= create_time else None,
+        }
+        self.first_time = min(self.first_time or finish_time, finish_time)
+        self._seq += 1
+        now = time.time()
+        for window in self.windows:
+            window.add(event, self._seq, now)
+    
+    def update_running(self, running_tasks, default_server):
+        """用最新的运行中任务列表更新实时状态"""
+        running = {}
+        for task in running_tasks:
+            server = running.setdefault(task.get("_Server", default_server), {"count": 0, "speed": 0})
+            server["count"] += 1
+            server["speed"] += task.get("DownloadSpeed") or 0
+        self.running = running
+    
+    @staticmethod
+    def _derive(bucket, hours):
+        durations = bucket["durations"]
+        middle = len(durations) // 2
+        median = None
+        if durations:
+            median = durations[middle] if len(durations) % 2 else (durations[middle - 1] + durations[middle]) / 2
+        return {
+            "count": bucket["count"],
+            "success_ratio": bucket["success"] / bucket["count"] if bucket["count"] else None,
+            "bytes": bucket["bytes"],
+            "tasks_per_hour": bucket["count"] / hours if hours else None,
+            "gb_per_hour": bucket["bytes"] / 1024 ** 3 / hours if hours else None,
+            "median_duration": median,
+        }
+    
+    def summary(self, index, now=None):
+        """返回窗口的汇总和按服务器的统计"""
+        now = now or time.time()
+        window = self.windows[index]
+        window.expire(now)
+        # 历史不足一个窗口时按实际时长计算速率
+        elapsed = now - self.first_time if self.first_time else 0
+        seconds = min(window.span, elapsed) if window.span is not None else elapsed
+        hours = max(seconds, 60) / 3600 if self.first_time else None
+        servers = {server: self._derive(bucket, hours) for server, bucket in window.servers.items()}
+        for server in self.running:
+            servers.setdefault(server, self._derive(RollingAggregate._empty(), hours))
+        return {"totals": self._derive(window.totals, hours), "servers": servers}
+
+# 任务历史记录
+# 提交后超过这个时间仍没有结果的任务不再视为"已提交"（正在运行的任务由任务列表覆盖）
+OPEN_SUBMISSION_TTL = 24 * 3600
+HISTORY_COMPACT_BYTES = 16 * 1024 * 1024  # 历史文件超过此大小时考虑压缩
+HISTORY_RETENTION = 90 * 86400  # 压缩时超过此期限的记录移入归档文件
+
+class TaskHistoryStore:
+    """以追加方式写入JSONL文件的任务历史，记录每次提交的完整请求体和任务结束结果
+
+    文件变大后由 compact 把超过保留期限的记录移入 gzip 归档文件（导出时仍会读取），
+    当前文件中只为归档的结束记录保留统计和查重所需的精简摘要。
+    """
+    
+    SUMMARY_FIELDS = ("server", "Url", "Aid", "Title", "IsSuccessful", "TaskCreateTime", "TaskFinishTime",
+                      "TotalDownloadedBytes")
+    
+    def __init__(self, path=None, load=True):
+        self.path = path or os.path.join(get_gui_data_dir(), "task_history.jsonl")
+        self.archive_path = os.path.splitext(self.path)[0] + ".archive.jsonl.gz"
+        self.lock = threading.Lock()
+        self.loaded = False
+        self.offset = 0  # 已读取到的文件位置，之后追加的记录可从这里继续读取
+        self.record_count = 0
+        self.expired_count = 0  # 超过保留期限、可以归档的记录数
+        self.submissions = {}  # (server, url) -> 最近一次提交记录
+        self.submissions_by_url = {}  # url -> 最近一次提交记录
+        self.open_submissions = {}  # url -> 已提交但尚未结束的提交记录
+        self.completed = []  # 成功完成的任务 (url, aid, pages)
+        self.titles = {}  # 标题 -> 视频ID，用于识别只含标题的文件名
+        self.seen_finished = set()  # (server, aid, finish_time)
+        self.verifications = {}  # (server, aid, finish_time) -> 最近一次校验记录
+        self.statistics = TaskStatistics()
+        if load:
+            self.load()
+    
+    def load(self, start=0):
+        """从文件位置start开始逐行读取历史，重建提交记录索引"""
+        horizon = time.time() - HISTORY_RETENTION
+        for record in self.iter_records(start):
+            self.record_count += 1
+            if record.get("type") != "archived" and (record.get("ts") or 0) < horizon:
+                self.expired_count += 1
+            if record.get("type") == "submitted":
+                self._index_submission(record)
+            elif record.get("type") in ("finished", "archived"):
+                self.seen_finished.add((record.get("server"), record.get("Aid"), record.get("TaskFinishTime")))
+                self._index_finished(record)
+            elif record.get("type") == "verified":
+                self.verifications[(record.get("server"), record.get("Aid"), record.get("TaskFinishTime"))] = record
+        self.loaded = True
+    
+    def adopt(self, other):
+        """采用后台线程加载好的索引，再读取其加载之后追加的记录"""
+        for name in ("submissions", "submissions_by_url", "open_submissions", "completed", "titles",
+                     "seen_finished", "verifications", "statistics", "record_count", "expired_count"):
+            setattr(self, name, getattr(other, name))
+        self.load(other.offset)
+    
+    def iter_records(self, start=0):
+        """从文件位置start开始流式遍历历史记录，跳过损坏的行；末尾正在写入的不完整行留到下次读取"""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'rb') as f:
+            f.seek(start)
+            self.offset = start
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                self.offset += len(line)
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+    
+    def iter_all_records(self):
+        """按时间顺序遍历归档文件和当前文件中的全部记录"""
+        if os.path.exists(self.archive_path):
+            try:
+                with gzip.open(self.archive_path, 'rt', encoding='utf-8') as f:
+                    for line in f:
+                        try:
+                            yield json.loads(line)
+                        except ValueError:
+                            continue
+            except (OSError, EOFError) as e:
+                task_log.warning("读取任务历史归档失败: %s", e)
+        yield from self.iter_records()
+    
+    def append(self, record):
+        """追加一条历史记录"""
+        line = json.dumps(record, ensure_ascii=False)
+        with self.lock, InterProcessLock(self.path + ".lock"):
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line + "\n")
+    
+    def needs_compaction(self, max_bytes=HISTORY_COMPACT_BYTES):
+        """文件超过max_bytes且至少四分之一的记录已超过保留期限"""
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            return False
+        return size >= max_bytes and self.expired_count * 4 >= self.record_count
+    
+    def compact(self, retention=HISTORY_RETENTION, now=None):
+        """把超过保留期限的记录移入归档文件，结束记录在当前文件中保留精简摘要，返回归档的记录数"""
+        horizon = (now or time.time()) - retention
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        archived = 0
+        with self.lock, InterProcessLock(self.path + ".lock"):
+            with open(tmp_path, 'w', encoding='utf-8') as out, \
+                    gzip.open(self.archive_path, 'at', encoding='utf-8') as archive:
+                for record in self.iter_records():
+                    if record.get("type") == "archived" or (record.get("ts") or 0) >= horizon:
+                        out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                        continue
+                    archive.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    archived += 1
+                    if record.get("type") == "finished":
+                        summary = {"type": "archived", "ts": record.get("ts")}
+                        summary.update((k, record[k]) for k in self.SUMMARY_FIELDS if k in record)
+                        submission = self.submissions_by_url.get(record.get("Url"))
+                        if submission and submission.get("payload", {}).get("SelectPage"):
+                            summary["SelectPage"] = submission["payload"]["SelectPage"]
+                        out.write(json.dumps(summary, ensure_ascii=False) + "\n")
+            os.replace(tmp_path, self.path)
+            self.offset = os.path.getsize(self.path)
+        self.expired_count = 0
+        return archived
+    
+    def _index_submission(self, record):
+        url = record.get("payload", {}).get("Url")
+        if not url:
+            return
+        self.submissions[(record.get("server"), url)] = record
+        self.submissions_by_url[url] = record
+        self.open_submissions[url] = record
+    
+    def expire_open_submissions(self, max_age=OPEN_SUBMISSION_TTL, now=None):
+        """丢弃超过max_age仍没有结果的提交（服务器重启等原因丢失的任务），返回丢弃的数量"""
+        horizon = (now or time.time()) - max_age
+        stale = [url for url, record in self.open_submissions.items() if (record.get("ts") or 0) < horizon]
+        for url in stale:
+            del self.open_submissions[url]
+        return len(stale)
+    
+    def _index_finished(self, record):
+        self.statistics.add(record)
+        url = record.get("Url")
+        submission = self.open_submissions.pop(url, None) or self.submissions_by_url.get(url)
+        if record.get("IsSuccessful", False):
+            if record.get("type") == "archived":
+                select_page = record.get("SelectPage")
+            else:
+                select_page = submission.get("payload", {}).get("SelectPage") if submission else None
+            self.completed.append((url, record.get("Aid"), parse_page_selection(select_page)))
+            aid = str(record.get("Aid") or "")
+            if aid.isdigit() and record.get("Title"):
+                self.titles[record["Title"]] = f"av{int(aid)}"
+    
+    def record_submission(self, server, payload, attempt=0, source="manual"):
+        """记录一次成功提交的原始请求体"""
+        record = {
+            "type": "submitted",
+            "ts": time.time(),
+            "server": server,
+            "attempt": attempt,
+            "source": source,
+            "payload": payload,
+        }
+        self._index_submission(record)
+        self.append(record)
+        return record
+    
+    def file_patterns(self):
+        """历史提交中用过的文件命名模板"""
+        patterns = set()
+        for record in self.submissions_by_url.values():
+            payload = record.get("payload", {})
+            patterns.update(payload[name] for name in ("FilePattern", "MultiFilePattern") if payload.get(name))
+        return patterns
+    
+    def get_submission(self, server, url):
+        """查找任务对应的提交记录，优先匹配同一服务器"""
+        return self.submissions.get((server, url)) or self.submissions_by_url.get(url)
+    
+    def record_verification(self, record):
+        """记录下载结果校验（或重新提交）结果"""
+        record = dict(record, type="verified", ts=time.time())
+        self.verifications[(record["server"], record.get("Aid"), record.get("TaskFinishTime"))] = record
+        self.append(record)
+    
+    def failed_verifications(self):
+        """校验未通过且尚未重新提交的任务"""
+        return [record for record in self.verifications.values() if record.get("status") in ("failed", "missing")]
+    
+    def record_finished(self, server, task):
+        """记录任务结束结果，已记录过的任务返回False"""
+        key = (server, task.get("Aid"), task.get("TaskFinishTime"))
+        if key in self.seen_finished:
+            return False
+        self.seen_finished.add(key)
+        record = {"type": "finished", "ts": time.time(), "server": server}
+        record.update((k, v) for k, v in task.items() if not k.startswith("_"))
+        self._index_finished(record)
+        self.append(record)
+        return True
+
+# 任务历史导出
+EXPORT_FORMATS = ("csv", "jsonl", "parquet")
+EXPORT_COLUMNS = (
+    "server", "aid", "title", "url", "status", "progress", "downloaded_bytes", "create_time",
+    "finish_time", "duration_seconds", "avg_bytes_per_second", "attempt", "source",
+)
+
+def parse_export_date(text, end_of_day=False):
+    """解析 YYYY-MM-DD 格式的日期，返回时间戳；end_of_day 为真时取当天结束时刻"""
+    if not text:
+        return None
+    try:
+        value = datetime.strptime(text.strip(), "%Y-%m-%d").timestamp()
+    except ValueError:
+        raise Exception(f"日期格式错误: {text}（应为 YYYY-MM-DD）")
+    return value + 86400 if end_of_day else value
+
+def iter_history_export(path, since=None, until=None, servers=None, status=None, horizon=OPEN_SUBMISSION_TTL):
+    """逐行读取历史文件，产生已结束任务的导出行
+    
+    只在内存中保留最近horizon秒内尚未结束的提交记录（用于补充重试次数和来源），内存占用与历史文件大小无关。
+    """
+    open_submissions = OrderedDict()  # (server, url) -> (提交时间, 重试次数, 来源)，按提交时间排列
+    for record in TaskHistoryStore(path, load=False).iter_all_records():
+        # 历史按时间追加，超过保留期限仍未结束的提交不会再匹配到结果
+        ts = record.get("ts") or 0
+        while open_submissions and next(iter(open_submissions.values()))[0] < ts - horizon:
+            open_submissions.popitem(last=False)
+        if record.get("type") == "submitted":
+            url = record.get("payload", {}).get("Url")
+            if url:
+                key = (record.get("server"), url)
+                open_submissions.pop(key, None)
+                open_submissions[key] = (ts, record.get("attempt", 0), record.get("source", "manual"))
+            continue
+        if record.get("type") != "finished":
+            continue
+        _, attempt, source = open_submissions.pop((record.get("server"), record.get("Url")), (None, None, None))
+        finish_time = record.get("TaskFinishTime") or record.get("ts") or 0
+        if since is not None and finish_time < since or until is not None and finish_time >= until:
+            continue
+        if servers and record.get("server") not in servers:
+            continue
+        successful = record.get("IsSuccessful", False)
+        if status and status != ("success" if successful else "failed"):
+            continue
+        create_time = record.get("TaskCreateTime")
+        downloaded = record.get("TotalDownloadedBytes") or 0
+        duration = finish_time - create_time if create_time and finish_time >= create_time else None
+        yield {
+            "server": record.get("server"),
+            "aid": record.get("Aid"),
+            "title": record.get("Title"),
+            "url": record.get("Url"),
+            "status": "success" if successful else "failed",
+            "progress": record.get("Progress"),
+            "downloaded_bytes": downloaded,
+            "create_time": datetime.fromtimestamp(create_time).strftime("%Y-%m-%d %H:%M:%S") if create_time else None,
+            "finish_time": datetime.fromtimestamp(finish_time).strftime("%Y-%m-%d %H:%M:%S") if finish_time else None,
+            "duration_seconds": duration,
+            "avg_bytes_per_second": round(downloaded / duration) if duration else None,
+            "attempt": attempt,
+            "source": source,
+        }
+
+def export_history(history_path, output, fmt=None, batch_size=10000, progress=None, **filters):
+    """将任务历史流式写入CSV/JSONL/Parquet文件，返回导出行数
+    
+    先写入临时文件，完成后再替换目标文件；Parquet按批写入，需要安装pyarrow。
+    """
+    fmt = fmt or os.path.splitext(output)[1].lstrip(".").lower()
+    if fmt not in EXPORT_FORMATS:
+        raise Exception(f"不支持的导出格式: {fmt}（可选 {', '.join(EXPORT_FORMATS)}）")
+    rows = iter_history_export(history_path, **filters)
+    tmp_path = f"{output}.part"
+    count = 0
+    try:
+        if fmt == "parquet":
+            try:
+                import pyarrow
+                import pyarrow.parquet
+            except ImportError:
+                raise Exception("导出Parquet格式需要安装pyarrow：pip install pyarrow")
+            schema = pyarrow.schema([
+                ("server", pyarrow.string()), ("aid", pyarrow.string()), ("title", pyarrow.string()),
+                ("url", pyarrow.string()), ("status", pyarrow.string()), ("progress", pyarrow.float64()),
+                ("downloaded_bytes", pyarrow.int64()), ("create_time", pyarrow.string()),
+                ("finish_time", pyarrow.string()), ("duration_seconds", pyarrow.int64()),
+                ("avg_bytes_per_second", pyarrow.int64()), ("attempt", pyarrow.int64()), ("source", pyarrow.string()),
+            ])
+            with pyarrow.parquet.ParquetWriter(tmp_path, schema) as writer:
+                batch = []
+                for row in rows:
+                    row["aid"] = None if row["aid"] is None else str(row["aid"])
+                    batch.append(row)
+                    count += 1
+                    if len(batch) >= batch_size:
+                        writer.write_table(pyarrow.Table.from_pylist(batch, schema=schema))
+                        batch = []
+                        if progress:
+                            progress(count)
+                if batch:
+                    writer.write_table(pyarrow.Table.from_pylist(batch, schema=schema))
+        else:
+            # CSV带BOM，Excel打开中文标题不乱码
+            with open(tmp_path, 'w', encoding='utf-8-sig' if fmt == "csv" else 'utf-8', newline='') as f:
+                if fmt == "csv":
+                    writer = csv.DictWriter(f, fieldnames=EXPORT_COLUMNS)
+                    writer.writeheader()
+                    write = writer.writerow
+                else:
+                    write = lambda row: f.write(json.dumps(row, ensure_ascii=False) + "\n")
+                for row in rows:
+                    write(row)
+                    count += 1
+                    if progress and count % batch_size == 0:
+                        progress(count)
+        os.replace(tmp_path, output)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return count
+
+class HistoryExportThread(QThread):
+    progress = pyqtSignal(int)  # 已导出行数
+    finished = pyqtSignal(int, str)  # 导出行数, 错误信息
+    
+    def __init__(self, history_path, output, fmt, filters):
+        super().__init__()
+        self.history_path = history_path
+        self.output = output
+        self.fmt = fmt
+        self.filters = filters
+    
+    def run(self):
+        try:
+            count = export_history(self.history_path, self.output, self.fmt, progress=self.progress.emit, **self.filters)
+            self.finished.emit(count, "")
+        except Exception as e:
+            self.finished.emit(0, str(e))
+
+def run_export(args):
+    """命令行导出任务历史（无界面）"""
+    try:
+        filters = {
+            "since": parse_export_date(args.since),
+            "until": parse_export_date(args.until, end_of_day=True),
+            "servers": set(args.server) if args.server else None,
+            "status": args.status,
+        }
+        history_path = args.history or os.path.join(get_gui_data_dir(), "task_history.jsonl")
+        count = export_history(history_path, args.export, args.format, **filters)
+    except Exception as e:
+        print(f"导出失败: {str(e)}", file=sys.stderr)
+        return 1
+    print(f"已导出 {count} 条记录到 {args.export}")
+    return 0
+
+# 任务列表快照
+SNAPSHOT_TASK_FIELDS = (
+    "Aid", "Title", "Url", "TaskCreateTime", "TaskFinishTime", "Progress",
+    "DownloadSpeed", "TotalDownloadedBytes", "IsSuccessful", "_Server",
+)
+
+class TaskSnapshotStore:
+    """保存最近一次的任务列表和连接设置，启动时先显示快照，无需等待首次查询"""
+    
+    def __init__(self, path=None):
+        self.path = path or os.path.join(get_gui_data_dir(), "snapshot.json")
+    
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return snapshot if isinstance(snapshot.get("tasks"), dict) else None
+    
+    def save(self, host, port, tasks, relay=False):
+        """只保留表格显示需要的字段"""
+        write_json_atomic(self.path, {
+            "saved_at": time.time(),
+            "host": host,
+            "port": port,
+            "relay": relay,
+            "tasks": {
+                name: [{key: task[key] for key in SNAPSHOT_TASK_FIELDS if key in task} for task in tasks.get(name, [])]
+                for name in ("Running", "Finished")
+            },
+        })
+
+# 离线提交队列
+class SubmissionOutbox:
+    """服务器不可用时暂存新提交的任务，写入磁盘，服务器恢复后按入队顺序提交
+
+    GUI和无界面模式（--enqueue/--headless）可能同时使用同一个队列文件：每次修改都在文件锁内重新读取后写回，
+    同一时间也只有一个进程在提交队列
+    """
+    
+    def __init__(self, path=None):
+        self.path = path or os.path.join(get_gui_data_dir(), "outbox.json")
+        self.lock = threading.Lock()
+        self.file_lock_path = self.path + ".lock"
+        self.entries = []
+        self._stamp = None  # 上次读取或写入时文件的 (修改时间, 大小)
+        with self._locked():
+            pass
+    
+    @contextmanager
+    def _locked(self):
+        """持有线程锁和文件锁，并读取其他进程写入的最新内容"""
+        with self.lock, InterProcessLock(self.file_lock_path):
+            self._reload()
+            yield
+    
+    def _file_stamp(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+    
+    def _reload(self):
+        stamp = self._file_stamp()
+        if stamp is None or stamp == self._stamp:
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+            self._stamp = stamp
+        except (OSError, ValueError):
+            pass
+    
+    @staticmethod
+    def dedup_key(server, payload):
+        key, page = normalize_video_id(payload["Url"])
+        return (server, key or payload["Url"], page, payload.get("SelectPage"))
+    
+    def _save(self):
+        write_json_atomic(self.path, self.entries)
+        self._stamp = self._file_stamp()
+    
+    def enqueue(self, server, payload, source="manual", submitted_at=None):
+        """加入队列，同一服务器上已排队的相同视频不重复加入；返回是否加入
+
+        submitted_at: 已经提交过但无法确认服务器是否接收的时间，提交前会先在任务列表中确认
+        """
+        with self._locked():
+            key = self.dedup_key(server, payload)
+            if any(self.dedup_key(entry["server"], entry["payload"]) == key for entry in self.entries):
+                return False
+            self.entries.append({
+                "id": f"{time.time():.6f}-{os.getpid()}-{len(self.entries)}",
+                "server": server,
+                "payload": payload,
+                "source": source,
+                "queued_at": time.time(),
+                "submitted_at": submitted_at,
+            })
+            self._save()
+            return True
+    
+    def remove(self, entry_id):
+        with self._locked():
+            self.entries = [entry for entry in self.entries if entry["id"] != entry_id]
+            self._save()
+    
+    def mark_submitted(self, entry_id, submitted_at):
+        """记录提交后未能确认结果的时间"""
+        with self._locked():
+            for entry in self.entries:
+                if entry["id"] == entry_id:
+                    entry["submitted_at"] = submitted_at
+            self._save()
+    
+    def servers(self):
+        with self._locked():
+            return {entry["server"] for entry in self.entries}
+    
+    def flush(self, get_client, admit=None):
+        """按入队顺序提交；某台服务器提交失败或admit拒绝后，其余排在后面的任务保留到下次，保证顺序
+
+        其他进程正在提交时直接返回，由其负责提交。
+        返回 (已提交 [(server, payload, source)], 被服务器拒绝 [(server, payload, source)])
+        """
+        flush_lock = InterProcessLock(self.path + ".flush.lock")
+        if not flush_lock.acquire(blocking=False):
+            return [], []
+        try:
+            return self._flush(get_client, admit)
+        finally:
+            flush_lock.release()
+    
+    def _flush(self, get_client, admit):
+        with self._locked():
+            entries = list(self.entries)
+        sent, rejected = [], []
+        blocked = set()
+        for entry in entries:
+            if entry["server"] in blocked:
+                continue
+            client = get_client(entry["server"])
+            if client is None or not client.is_available():
+                # 服务器不在列表中（如服务池实例尚未启动）或不可用时留在队列中
+                blocked.add(entry["server"])
+                continue
+            # 确认服务器可用后再检查时段和磁盘空间，熔断期间不占用下载时段的并发名额
+            if admit and not admit(entry["server"], entry["payload"]):
+                blocked.add(entry["server"])
+                continue
+            if entry.get("submitted_at"):
+                # 上次提交结果未知，先确认服务器是否已经接收，避免重复下载
+                found = client.find_submitted_task(entry["payload"], entry["submitted_at"])
+                if found is None:
+                    blocked.add(entry["server"])
+                    continue
+                if found:
+                    self.remove(entry["id"])
+                    sent.append((client.server_key, entry["payload"], entry["source"]))
+                    continue
+            submitted_at = time.time()
+            result = client.submit_task(entry["payload"])
+            if result == "unknown":
+                self.mark_submitted(entry["id"], submitted_at)
+            if result in ("unavailable", "unknown"):
+                blocked.add(entry["server"])
+                continue
+            self.remove(entry["id"])
+            item = (client.server_key, entry["payload"], entry["source"])
+            (sent if result == "ok" else rejected).append(item)
+        return sent, rejected
+
+class OutboxFlushThread(QThread):
+    finished = pyqtSignal(list, list)  # 已提交, 被拒绝
+    
+    def __init__(self, outbox, get_client, admit=None):
+        super().__init__()
+        self.outbox = outbox
+        self.get_client = get_client
+        self.admit = admit  # 在后台线程中调用，不能读取界面控件
+    
+    def run(self):
+        try:
+            self.finished.emit(*self.outbox.flush(self.get_client, self.admit))
+        except Exception as e:
+            task_log.warning("提交离线队列失败: %s", e)
+            self.finished.emit([], [])
+
+# 定时下载：只在配置的时段内放行排队任务
+WEEKDAY_NAMES = "一二三四五六日"
+
+def parse_clock(text):
+    """解析 HH:MM，返回当天的分钟数"""
+    match = re.fullmatch(r"\s*(\d{1,2}):(\d{2})\s*", text or "")
+    if not match or int(match.group(1)) > 23 or int(match.group(2)) > 59:
+        raise Exception(f"时间格式应为 HH:MM: {text}")
+    return int(match.group(1)) * 60 + int(match.group(2))
+
+def parse_weekdays(text):
+    """解析星期选择，如 "1-5,7"（1为周一），留空表示每天"""
+    if not (text or "").strip():
+        return list(range(1, 8))
+    days = set()
+    for part in text.replace("，", ",").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        start, _, end = part.partition("-")
+        try:
+            start, end = int(start), int(end or start)
+        except ValueError:
+            raise Exception(f"星期格式错误: {part}")
+        if not 1 <= start <= end <= 7:
+            raise Exception(f"星期应在1到7之间: {part}")
+        days.update(range(start, end + 1))
+    return sorted(days)
+
+def format_weekdays(days):
+    """将星期列表格式化为 "1-5,7" """
+    if len(days) == 7:
+        return ""
+    parts = []
+    for day in sorted(days):
+        if parts and parts[-1][1] == day - 1:
+            parts[-1][1] = day
+        else:
+            parts.append([day, day])
+    return ",".join(str(start) if start == end else f"{start}-{end}" for start, end in parts)
+
+class DownloadScheduler:
+    """按服务器和星期配置下载时段，时段外暂停放行排队任务，时段内可限制同时运行的任务数
+
+    时段 {"server": "host:port" 或 "*", "days": [1-7], "start": "HH:MM", "end": "HH:MM", "max_running": 上限或None}，
+    结束早于开始表示跨越午夜，开始等于结束表示全天；没有任何时段适用的服务器不受限制
+    """
+    
+    def __init__(self, path=None):
+        self.path = path or os.path.join(get_gui_data_dir(), "schedule.json")
+        self.lock = threading.Lock()
+        self.windows = []
+        self.pause_new = False  # 时段外新添加的任务也进入队列
+        self.running = {}  # server -> 运行中任务数（含上次刷新后放行的任务）
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                config = json.load(f)
+            self.windows = config.get("windows", [])
+            self.pause_new = bool(config.get("pause_new", False))
+        except (OSError, ValueError, AttributeError):
+            pass
+    
+    def configure(self, windows, pause_new):
+        """校验并保存时段配置"""
+        for window in windows:
+            parse_clock(window["start"])
+            parse_clock(window["end"])
+            if window.get("max_running") is not None and window["max_running"] < 1:
+                raise Exception("并发上限至少为1")
+        with self.lock:
+            self.windows = windows
+            self.pause_new = pause_new
+        write_json_atomic(self.path, {"pause_new": pause_new, "windows": windows})
+    
+    def applicable(self, server):
+        return [window for window in self.windows if window.get("server", "*") in ("*", server)]
+    
+    @staticmethod
+    def _covers(window, now):
+        start, end = parse_clock(window["start"]), parse_clock(window["end"])
+        minute = now.hour * 60 + now.minute
+        days = window.get("days") or range(1, 8)
+        today = now.isoweekday()
+        yesterday = (today + 5) % 7 + 1
+        if start < end:
+            return today in days and start <= minute < end
+        # 跨越午夜：午夜后的部分属于前一天的时段
+        return (today in days and minute >= start) or (yesterday in days and minute < end)
+    
+    def open_window(self, server, now=None):
+        """返回当前生效的时段；服务器不受限制时返回空字典，时段外返回None"""
+        windows = self.applicable(server)
+        if not windows:
+            return {}
+        now = now or datetime.now()
+        for window in windows:
+            if self._covers(window, now):
+                return window
+        return None
+    
+    def is_open(self, server, now=None):
+        return self.open_window(server, now) is not None
+    
+    def update_running(self, counts):
+        """刷新后以服务器实际运行的任务数为准"""
+        with self.lock:
+            self.running = dict(counts)
+    
+    def admit(self, server, now=None):
+        """是否允许现在向服务器提交任务，允许时占用一个并发名额直到下次刷新"""
+        window = self.open_window(server, now)
+        if window is None:
+            return False
+        with self.lock:
+            limit = window.get("max_running")
+            if limit and self.running.get(server, 0) >= limit:
+                return False
+            self.running[server] = self.running.get(server, 0) + 1
+        return True
+    
+    def next_opening(self, server, now=None):
+        """下一个时段的开始时间，服务器不受限制时返回None"""
+        now = now or datetime.now()
+        starts = []
+        for window in self.applicable(server):
+            minute = parse_clock(window["start"])
+            days = window.get("days") or range(1, 8)
+            for offset in range(8):
+                day = now + timedelta(days=offset)
+                start = day.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(minutes=minute)
+                if day.isoweekday() in days and start > now:
+                    starts.append(start)
+                    break
+        return min(starts) if starts else None
+    
+    def describe_next_opening(self, server, now=None):
+        start = self.next_opening(server, now)
+        if start is None:
+            return "未配置时段"
+        return f"周{WEEKDAY_NAMES[start.isoweekday() - 1]} {start.strftime('%H:%M')}"
+
+def run_scheduler(args):
+    """无界面运行定时下载：按时段和并发上限提交离线队列中的任务"""
+    outbox = SubmissionOutbox()
+    scheduler = DownloadScheduler()
+    disk_monitor = DiskSpaceMonitor()
+    history = TaskHistoryStore(load=False)
+    clients = {}
+    
+    def get_client(server):
+        if server not in clients:
+            clients[server] = BBDownAPIClient(*parse_host_port(server))
+        return clients[server]
+    
+    def admit(server, payload):
+        host = server.rpartition(":")[0]
+        work_dir = payload.get("WorkDir") if host in LOCAL_HOSTS else None
+        return disk_monitor.admits(work_dir) and scheduler.admit(server)
+    
+    for url in args.enqueue or []:
+        client = get_client(args.upstream)
+        options = {"WorkDir": args.work_dir} if args.work_dir else None
+        if outbox.enqueue(client.server_key, client.build_task_payload(url, options), source="schedule"):
+            schedule_log.info("已加入队列: %s -> %s", url, client.server_key)
+    if not args.headless:
+        return 0
+    
+    schedule_log.info("定时下载已启动，队列中有 %s 个任务，每 %s 秒检查一次", len(outbox.entries), args.interval)
+    try:
+        while True:
+            servers = outbox.servers()
+            # 只为有排队任务且处于时段内的服务器查询运行中任务数
+            scheduler.update_running({
+                server: len(get_client(server).get_running_tasks())
+                for server in servers if scheduler.is_open(server)
+            })
+            if servers:
+                sent, rejected = outbox.flush(get_client, admit)
+                for server, payload, source in sent:
+                    history.record_submission(server, payload, source=source)
+                    schedule_log.info("已提交: %s -> %s", payload["Url"], server)
+                for server, payload, _ in rejected:
+                    schedule_log.warning("任务被服务器拒绝: %s -> %s", payload["Url"], server)
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+# 失败任务自动重试
+RETRY_RESOLVED_TTL = 24 * 3600  # 已重试或已放弃的失败记录保留时长，之后从状态文件中清除
+
+class FailedTaskRetrier:
+    """按失败原因分组记录失败任务，并以指数退避方式在重试次数上限内重新提交
+
+    失败记录、待重试条目和重试设置写入磁盘，程序重启后继续按原计划重试
+    """
+    
+    def __init__(self, history, max_attempts=3, base_delay=60, max_delay=3600, path=None):
+        self.history = history
+        self.path = path or os.path.join(get_gui_data_dir(), "retry_state.json")
+        self.enabled = False
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.failures = {}  # (server, aid, finish_time) -> 失败信息
+        self.pending = {}  # 同上 -> 待重试条目
+        self.interrupted = []  # 上次退出时正在提交、无法确认结果的条目
+        self._dirty = False
+        self.load()
+    
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.enabled = bool(data.get("enabled", self.enabled))
+            self.max_attempts = int(data.get("max_attempts", self.max_attempts))
+            self.base_delay = int(data.get("base_delay", self.base_delay))
+            self.max_delay = int(data.get("max_delay", self.max_delay))
+            for info in data.get("failures", []):
+                info["key"] = tuple(info["key"])
+                if info["state"] in ("retried", "exhausted", "no_payload"):
+                    info.setdefault("resolved_at", time.time())
+                self.failures[info["key"]] = info
+                if info["state"] == "pending":
+                    self.pending[info["key"]] = info
+                elif info["state"] == "submitting":
+                    self.interrupted.append(info)
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+    
+    def mark_dirty(self):
+        self._dirty = True
+    
+    def save(self):
+        """有变化时保存失败记录和重试设置，已处理完超过保留时长的失败记录不再保存"""
+        if not self._dirty:
+            return
+        horizon = time.time() - RETRY_RESOLVED_TTL
+        for key in [key for key, info in self.failures.items() if info.get("resolved_at", horizon) < horizon]:
+            del self.failures[key]
+        write_json_atomic(self.path, {
+            "enabled": self.enabled,
+            "max_attempts": self.max_attempts,
+            "base_delay": self.base_delay,
+            "max_delay": self.max_delay,
+            "failures": [dict(info, key=list(info["key"])) for info in self.failures.values()],
+        })
+        self._dirty = False
+    
+    @staticmethod
+    def classify_failure(task):
+        """根据任务进度推断失败原因"""
+        progress = task.get("Progress", 0) or 0
+        downloaded = task.get("TotalDownloadedBytes", 0) or 0
+        if progress <= 0 and downloaded <= 0:
+            return "解析失败（未开始下载）"
+        if progress < 1:
+            return "下载中断"
+        return "混流/后处理失败"
+    
+    def backoff_delay(self, attempt):
+        """第attempt次重试前的等待秒数（带±10%抖动）"""
+        delay = min(self.max_delay, self.base_delay * (2 ** max(attempt - 1, 0)))
+        return delay * random.uniform(0.9, 1.1)
+    
+    def on_task_failed(self, server, task):
+        """登记一个失败任务，启用自动重试时安排重试"""
+        key = (server, task.get("Aid"), task.get("TaskFinishTime"))
+        if key in self.failures:
+            return None
+        submission = self.history.get_submission(server, task.get("Url"))
+        info = {
+            "key": key,
+            "server": server,
+            "aid": task.get("Aid"),
+            "title": task.get("Title", ""),
+            "reason": self.classify_failure(task),
+            "payload": submission.get("payload") if submission else None,
+            "attempt": (submission.get("attempt", 0) if submission else 0) + 1,
+            "state": "failed",
+        }
+        self.failures[key] = info
+        self._dirty = True
+        if self.enabled:
+            self.schedule(info)
+        return info
+    
+    def schedule(self, info, delay=None):
+        """安排一次重试，超出次数上限或没有原始参数时放弃"""
+        self._dirty = True
+        if not info["payload"]:
+            self._resolve(info, "no_payload")
+            return False
+        if info["attempt"] > self.max_attempts:
+            self._resolve(info, "exhausted")
+            return False
+        if delay is None:
+            delay = self.backoff_delay(info["attempt"])
+        info["due"] = time.time() + delay
+        info["state"] = "pending"
+        self.pending[info["key"]] = info
+        return True
+    
+    def schedule_all_now(self):
+        """立即重试所有尚未处理的失败任务"""
+        count = 0
+        for info in self.failures.values():
+            if info["state"] in ("failed", "pending", "submit_failed"):
+                if self.schedule(info, delay=0):
+                    count += 1
+        return count
+    
+    def pop_due(self, now=None, admit=None):
+        """取出已到期的重试条目，admit拒绝的条目留到下次"""
+        now = now or time.time()
+        due = [info for info in self.pending.values() if info["due"] <= now and (admit is None or admit(info))]
+        for info in due:
+            del self.pending[info["key"]]
+            info["state"] = "submitting"
+            info["submitted_at"] = time.time()
+            self._dirty = True
+        return due
+    
+    def _resolve(self, info, state):
+        info["state"] = state
+        info["resolved_at"] = time.time()
+    
+    def on_resubmitted(self, info, result):
+        """处理重新提交的结果（submit_task的返回值）
+
+        成功或无法确认时视为已重试；请求未发出（服务器不可用）时不计入重试次数，按当前退避重新安排；
+        被服务器拒绝时计入重试次数并继续退避
+        """
+        self._dirty = True
+        if result in ("ok", "unknown"):
+            self._resolve(info, "retried")
+            return
+        if result == "unavailable":
+            self.schedule(info)
+            return
+        info["state"] = "submit_failed"
+        info["attempt"] += 1
+        self.schedule(info)
+    
+    def failure_groups(self):
+        """按失败原因统计各状态的数量"""
+        groups = {}
+        for info in self.failures.values():
+            group = groups.setdefault(info["reason"], {"total": 0, "pending": 0, "retried": 0, "given_up": 0})
+            group["total"] += 1
+            if info["state"] in ("pending", "submitting", "submit_failed"):
+                group["pending"] += 1
+            elif info["state"] == "retried":
+                group["retried"] += 1
+            elif info["state"] in ("exhausted", "no_payload"):
+                group["given_up"] += 1
+        return groups
+
+# 批量提交线程
+class BulkAddThread(QThread):
+    progress = pyqtSignal(int, int)  # 已完成数, 总数
+    finished = pyqtSignal(list)  # [(client, payload, 提交结果, 提交时间)]
+    
+    def __init__(self, jobs):
+        super().__init__()
+        self.jobs = jobs  # [(client, payload)]
+    
+    def run(self):
+        results = []
+        for index, (client, payload) in enumerate(self.jobs):
+            submitted_at = time.time()
+            results.append((client, payload, client.submit_task(payload), submitted_at))
+            self.progress.emit(index + 1, len(self.jobs))
+        self.finished.emit(results)
+
+# 批量移除已完成任务
+def select_tasks_by_rules(tasks, older_than_days=None, larger_than_bytes=None, title_pattern=None, status=None, now=None):
+    """按条件筛选任务：完成时间早于N天、大小超过阈值、标题匹配正则、成功或失败，条件之间为"且"的关系"""
+    now = now or time.time()
+    regex = None
+    if title_pattern:
+        try:
+            regex = re.compile(title_pattern, re.IGNORECASE)
+        except re.error as e:
+            raise Exception(f"标题匹配规则无效: {str(e)}")
+    selected = []
+    for task in tasks:
+        if older_than_days is not None and (task.get("TaskFinishTime") or now) > now - older_than_days * 86400:
+            continue
+        if larger_than_bytes is not None and (task.get("TotalDownloadedBytes") or 0) <= larger_than_bytes:
+            continue
+        if regex and not regex.search(task.get("Title") or ""):
+            continue
+        if status and status != ("success" if task.get("IsSuccessful", False) else "failed"):
+            continue
+        selected.append(task)
+    return selected
+
+class BulkRemoveThread(QThread):
+    progress = pyqtSignal(int, int)  # 已完成数, 总数
+    finished = pyqtSignal(list, list)  # 已移除的任务, 移除失败的任务
+    
+    def __init__(self, jobs, max_workers=6):
+        super().__init__()
+        self.jobs = jobs  # [(client, task)]
+        self.max_workers = max_workers
+    
+    def run(self):
+        removed, failed = [], []
+        # 限制并发数，避免数百个请求同时压到BBDown上
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(client.remove_task, task.get("Aid")): task for client, task in self.jobs}
+            for done, future in enumerate(as_completed(futures), 1):
+                task = futures[future]
+                try:
+                    success = future.result()
+                except Exception as e:
+                    task_log.warning("移除任务 %s 出错: %s", task.get("Aid"), e)
+                    success = False
+                (removed if success else failed).append(task)
+                self.progress.emit(done, len(self.jobs))
+        self.finished.emit(removed, failed)
+
+# BBDown版本安装管理
+BBDOWN_DATA_FILES = ("BBDown.data", "BBDownTV.data", "BBDown.archives")
+
+def write_json_atomic(path, data):
+    """先写临时文件再替换，保证文件内容始终完整"""
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+class InterProcessLock:
+    """跨进程文件锁（POSIX使用flock，Windows使用msvcrt），用于GUI和无界面模式共用的数据文件"""
+    
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+    
+    def acquire(self, blocking=True):
+        """获取锁；blocking为False且锁被其他进程持有时返回False"""
+        self._file = open(self.path, 'a+b')
+        try:
+            if platform.system() == "Windows":
+                import msvcrt
+                self._file.seek(0)
+                while True:
+                    try:
+                        msvcrt.locking(self._file.fileno(), msvcrt.LK_NBLCK, 1)
+                        return True
+                    except OSError:
+                        if not blocking:
+                            break
+                        time.sleep(0.05)
+            else:
+                import fcntl
+                try:
+                    fcntl.flock(self._file.fileno(), fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+                    return True
+                except OSError:
+                    pass
+        except Exception:
+            self._file.close()
+            self._file = None
+            raise
+        self._file.close()
+        self._file = None
+        return False
+    
+    def release(self):
+        if not self._file:
+            return
+        try:
+            if platform.system() == "Windows":
+                import msvcrt
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        finally:
+            self._file.close()
+            self._file = None
+    
+    def __enter__(self):
+        self.acquire()
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.release()
+
+def find_bbdown_executable(directory):
+    """在目录中查找BBDown可执行文件"""
+    for root, dirs, files in os.walk(directory):
+        for file in files:
+            if file.lower().startswith('bbdown') and (file.endswith('.exe') or '.' not in file):
+                return os.path.join(root, file)
+    return None
+
+def path_within(path, directory):
+    """path是否位于directory之内（按路径分段比较，v1.6.1 不包含 v1.6.10）"""
+    path = os.path.normcase(os.path.abspath(path))
+    directory = os.path.normcase(os.path.abspath(directory))
+    try:
+        return os.path.commonpath([path, directory]) == directory
+    except ValueError:  # Windows下位于不同盘符
+        return False
+
+class BBDownInstallManager:
+    """管理按版本并存的BBDown安装目录
+
+    每个版本解压到 ~/.bbdown/versions/<版本号>，~/.bbdown/current.json 记录当前和上一个版本，
+    切换版本只需原子替换该文件，正在运行的服务端所用的旧版本文件不会被删除。
+    """
+    
+    RELEASES_URL = "https://api.github.com/repos/nilaoda/BBDown/releases/latest"
+    
+    def __init__(self, root=None):
+        self.root = root or os.path.join(os.path.expanduser("~"), ".bbdown")
+        self.versions_dir = os.path.join(self.root, "versions")
+        self.pointer_path = os.path.join(self.root, "current.json")
+        self.release_cache_path = os.path.join(self.root, "release_cache.json")
+        self.legacy_dir = os.path.join(self.root, "current")
+    
+    def read_pointer(self):
+        try:
+            with open(self.pointer_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+    
+    def current(self):
+        """返回当前版本 {"version", "path"}，没有可用安装时返回None"""
+        pointer = self.read_pointer()
+        if pointer.get("path") and os.path.exists(pointer["path"]):
+            return {"version": pointer.get("version"), "path": pointer["path"]}
+        # 兼容旧版本的 ~/.bbdown/current 目录
+        if os.path.isdir(self.legacy_dir):
+            path = find_bbdown_executable(self.legacy_dir)
+            if path:
+                return {"version": None, "path": path}
+        return None
+    
+    def cached_current(self):
+        """只用一次stat校验安装清单，清单缺失或与文件不符时返回None，需要调用discover完整查找"""
+        pointer = self.read_pointer()
+        path = pointer.get("path")
+        if not path or "mtime" not in pointer:
+            return None
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        if st.st_mtime != pointer["mtime"] or st.st_size != pointer.get("size"):
+            return None
+        return {"version": pointer.get("version"), "path": path}
+    
+    def discover(self):
+        """完整查找当前安装（可能遍历旧版目录），找到后更新安装清单供下次启动快速校验"""
+        current = self.current()
+        if current:
+            pointer = self.read_pointer()
+            if pointer.get("path") == current["path"]:
+                pointer.update(self.file_stamp(current["path"]))
+                write_json_atomic(self.pointer_path, pointer)
+            else:
+                self.switch(current["version"], current["path"])
+        return current
+    
+    @staticmethod
+    def file_stamp(path):
+        st = os.stat(path)
+        return {"mtime": st.st_mtime, "size": st.st_size}
+    
+    def previous(self):
+        """返回可回滚的上一个版本"""
+        previous = self.read_pointer().get("previous") or {}
+        if previous.get("path") and os.path.exists(previous["path"]):
+            return previous
+        return None
+    
+    def fetch_latest_release(self, session=None, timeout=30):
+        """获取最新版本信息，使用ETag条件请求，未变化(304)或网络失败时使用本地缓存"""
+        session = session or requests
+        cache = {}
+        try:
+            with open(self.release_cache_path, 'r', encoding='utf-8') as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            pass
+        
+        headers = {"Accept": "application/vnd.github+json"}
+        if cache.get("etag"):
+            headers["If-None-Match"] = cache["etag"]
+        try:
+            response = session.get(self.RELEASES_URL, headers=headers, timeout=timeout)
+        except Exception:
+            if cache.get("data"):
+                return cache["data"]
+            raise
+        
+        if response.status_code == 304 and cache.get("data"):
+            return cache["data"]
+        if response.status_code != 200:
+            if cache.get("data"):
+                return cache["data"]
+            raise Exception("无法获取版本信息")
+        
+        data = response.json()
+        os.makedirs(self.root, exist_ok=True)
+        write_json_atomic(self.release_cache_path, {
+            "etag": response.headers.get("ETag"),
+            "checked_at": time.time(),
+            "data": data,
+        })
+        return data
+    
+    def version_dir(self, version):
+        return os.path.join(self.versions_dir, version)
+    
+    def create_staging_dir(self, version):
+        """创建用于解压的临时目录，解压完成后再整体移动到版本目录"""
+        os.makedirs(self.versions_dir, exist_ok=True)
+        staging = os.path.join(self.versions_dir, f".{version}.staging-{os.getpid()}")
+        if os.path.exists(staging):
+            shutil.rmtree(staging)
+        os.makedirs(staging)
+        return staging
+    
+    def commit(self, version, staging_dir, executable, in_use=()):
+        """将解压好的临时目录提交为正式版本，并原子切换当前版本
+
+        in_use 为正在运行的服务端所用的可执行文件路径
+        """
+        target = self.version_dir(version)
+        current = self.current()
+        if os.path.exists(target):
+            used = list(in_use) + ([current["path"]] if current else [])
+            if any(path_within(path, target) for path in used):
+                # 该目录正在使用，保留旧目录，新文件放入带时间戳的目录
+                target = f"{target}-{int(time.time())}"
+            else:
+                shutil.rmtree(target)
+        os.replace(staging_dir, target)
+        executable = os.path.join(target, os.path.relpath(executable, staging_dir))
+        
+        # 登录凭据和存档保存在可执行文件所在目录，随版本一起迁移
+        if current:
+            old_dir = os.path.dirname(current["path"])
+            new_dir = os.path.dirname(executable)
+            for name in BBDOWN_DATA_FILES:
+                source = os.path.join(old_dir, name)
+                if os.path.exists(source) and not os.path.exists(os.path.join(new_dir, name)):
+                    shutil.copy2(source, new_dir)
+        
+        self.switch(version, executable)
+        return executable
+    
+    def switch(self, version, executable):
+        """原子切换当前版本指针"""
+        current = self.current()
+        pointer = {
+            "version": version,
+            "path": executable,
+            "installed_at": time.time(),
+            "previous": current if current and current["path"] != executable else self.read_pointer().get("previous"),
+        }
+        pointer.update(self.file_stamp(executable))
+        write_json_atomic(self.pointer_path, pointer)
+    
+    def rollback(self):
+        """回滚到上一个版本，返回新的当前版本"""
+        previous = self.previous()
+        if not previous:
+            raise Exception("没有可回滚的版本")
+        self.switch(previous.get("version"), previous["path"])
+        return previous
+    
+    def prune(self, in_use=()):
+        """删除当前、上一个版本和正在运行的服务端所用版本以外的旧版本目录"""
+        keep = list(in_use)
+        for entry in (self.current(), self.previous()):
+            if entry:
+                keep.append(entry["path"])
+        if not os.path.isdir(self.versions_dir):
+            return
+        for name in os.listdir(self.versions_dir):
+            path = os.path.join(self.versions_dir, name)
+            if name.startswith(".") or any(path_within(k, path) for k in keep):
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+
+# 分段并行下载
+class DownloadCancelled(Exception):
+    """下载被用户取消"""
+
+class StreamingUnsupported(Exception):
+    """压缩包无法边下载边解压，需要先下载到本地"""
+
+class SegmentedDownloader:
+    """支持HTTP Range多段并行下载、断点续传和完整性校验的下载器
+
+    未完成的下载保存在 <目标文件>.part，分段进度保存在 <目标文件>.part.json，
+    再次下载同一URL时从中断处继续。服务器不支持Range时退化为单连接顺序下载。
+    """
+    
+    def __init__(self, session=None, segments=4, buffer_size=1024 * 1024,
+                 progress_interval=0.25, timeout=30, max_retries=3):
+        self.session = session or requests.Session()
+        self.segments = segments
+        self.buffer_size = buffer_size
+        self.progress_interval = progress_interval
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self._lock = threading.Lock()
+    
+    def probe(self, url):
+        """探测文件大小和Range支持，返回 (最终URL, 总大小, 是否支持Range)"""
+        response = self.session.get(url, headers={"Range": "bytes=0-0"}, stream=True, timeout=self.timeout)
+        try:
+            if response.status_code == 206:
+                content_range = response.headers.get("Content-Range", "")
+                total = content_range.rpartition("/")[2]
+                if total.isdigit():
+                    return response.url, int(total), True
+            if response.status_code != 200:
+                raise Exception(f"下载请求失败: HTTP {response.status_code}")
+            total = response.headers.get("Content-Length", "")
+            return response.url, (int(total) if total.isdigit() else None), False
+        finally:
+            response.close()
+    
+    def download(self, url, dest_path, expected_size=None, expected_digest=None,
+                 progress_callback=None, cancel_event=None):
+        """下载url到dest_path，校验通过后返回dest_path"""
+        part_path = dest_path + ".part"
+        state_path = dest_path + ".part.json"
+        self.cancel_event = cancel_event or threading.Event()
+        self.progress_callback = progress_callback
+        self._last_report = 0.0
+        
+        final_url, total, supports_range = self.probe(url)
+        if expected_size and total and expected_size != total:
+            raise Exception(f"文件大小不一致: 期望 {expected_size}，服务器返回 {total}")
+        total = total or expected_size
+        
+        if supports_range and total:
+            segments = self._load_state(state_path, url, total, part_path)
+            if segments is None:
+                segments = self._plan_segments(total)
+                with open(part_path, 'wb') as f:
+                    f.truncate(total)
+                self._save_state(state_path, url, total, segments)
+            self._downloaded = sum(seg["done"] for seg in segments)
+            self._total = total
+            self._report(force=True)
+            with ThreadPoolExecutor(max_workers=len(segments)) as executor:
+                futures = [
+                    executor.submit(self._download_segment, final_url, part_path, state_path, url, total, segments, seg)
+                    for seg in segments if seg["done"] < seg["end"] - seg["start"] + 1
+                ]
+                for future in futures:
+                    future.result()
+        else:
+            self._download_stream(final_url, part_path, total)
+        
+        self._report(force=True)
+        self.verify(part_path, expected_size or total, expected_digest)
+        os.replace(part_path, dest_path)
+        if os.path.exists(state_path):
+            os.remove(state_path)
+        return dest_path
+    
+    def _plan_segments(self, total):
+        count = max(1, min(self.segments, total // (self.buffer_size * 2) or 1))
+        size = total // count
+        segments = []
+        for index in range(count):
+            start = index * size
+            end = total - 1 if index == count - 1 else start + size - 1
+            segments.append({"start": start, "end": end, "done": 0})
+        return segments
+    
+    def _load_state(self, state_path, url, total, part_path):
+        """读取断点续传状态，与当前下载不匹配时返回None"""
+        try:
+            with open(state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            if state.get("url") != url or state.get("total") != total:
+                return None
+            if os.path.getsize(part_path) != total:
+                return None
+            return state["segments"]
+        except (OSError, ValueError, KeyError):
+            return None
+    
+    def _save_state(self, state_path, url, total, segments):
+        # 各分段线程共用同一个临时文件，写入和替换都要在锁内完成
+        with self._lock:
+            data = json.dumps({"url": url, "total": total, "segments": segments})
+            tmp_path = state_path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(data)
+            os.replace(tmp_path, state_path)
+    
+    def _download_segment(self, url, part_path, state_path, state_url, total, segments, seg):
+        """下载一个分段，失败时从已完成位置重试"""
+        attempt = 0
+        while True:
+            start = seg["start"] + seg["done"]
+            if start > seg["end"]:
+                return
+            try:
+                headers = {"Range": f"bytes={start}-{seg['end']}"}
+                with self.session.get(url, headers=headers, stream=True, timeout=self.timeout) as response:
+                    if response.status_code != 206:
+                        raise Exception(f"分段请求失败: HTTP {response.status_code}")
+                    with open(part_path, 'r+b', buffering=self.buffer_size) as f:
+                        f.seek(start)
+                        unsaved = 0
+                        for chunk in response.iter_content(chunk_size=self.buffer_size):
+                            if self.cancel_event.is_set():
+                                f.flush()
+                                self._save_state(state_path, state_url, total, segments)
+                                raise DownloadCancelled("下载已取消")
+                            if not chunk:
+                                continue
+                            f.write(chunk)
+                            with self._lock:
+                                seg["done"] += len(chunk)
+                                self._downloaded += len(chunk)
+                            unsaved += len(chunk)
+                            if unsaved >= 8 * self.buffer_size:
+                                f.flush()
+                                self._save_state(state_path, state_url, total, segments)
+                                unsaved = 0
+                            self._report()
+                        f.flush()
+                self._save_state(state_path, state_url, total, segments)
+                if seg["start"] + seg["done"] <= seg["end"]:
+                    raise Exception("分段数据不完整")
+                return
+            except DownloadCancelled:
+                raise
+            except Exception:
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise
+                time.sleep(min(2 ** attempt, 10))
+    
+    def _download_stream(self, url, part_path, total):
+        """服务器不支持Range时的单连接下载"""
+        self._downloaded = 0
+        self._total = total
+        with self.session.get(url, stream=True, timeout=self.timeout) as response:
+            if response.status_code != 200:
+                raise Exception(f"下载请求失败: HTTP {response.status_code}")
+            with open(part_path, 'wb', buffering=self.buffer_size) as f:
+                for chunk in response.iter_content(chunk_size=self.buffer_size):
+                    if self.cancel_event.is_set():
+                        raise DownloadCancelled("下载已取消")
+                    if chunk:
+                        f.write(chunk)
+                        self._downloaded += len(chunk)
+                        self._report()
+    
+    def _report(self, force=False):
+        """节流的进度回调，默认每秒最多4次"""
+        if not self.progress_callback:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_report < self.progress_interval:
+            return
+        self._last_report = now
+        self.progress_callback(self._downloaded, self._total)
+    
+    def verify(self, path, expected_size=None, expected_digest=None):
+        """校验文件大小和摘要（支持 "sha256:<hex>" 或纯十六进制SHA-256）"""
+        size = os.path.getsize(path)
+        if expected_size and size != expected_size:
+            raise Exception(f"文件大小校验失败: 期望 {expected_size}，实际 {size}")
+        if expected_digest:
+            algorithm, _, expected = expected_digest.rpartition(":")
+            digest = hashlib.new(algorithm or "sha256")
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(self.buffer_size), b""):
+                    digest.update(block)
+            if digest.hexdigest().lower() != expected.lower():
+                os.remove(path)
+                raise Exception("文件摘要校验失败，已删除损坏的下载文件")
+
+# 压缩包解压
+def is_bbdown_executable_name(name):
+    """判断压缩包中的文件名是否为BBDown可执行文件"""
+    file = os.path.basename(name.rstrip("/"))
+    return file.lower().startswith('bbdown') and (file.endswith('.exe') or '.' not in file)
+
+class HTTPRangeFile(io.RawIOBase):
+    """通过HTTP Range请求按需读取远程文件的只读可寻址文件对象
+
+    供zipfile直接读取远程压缩包的中央目录和单个成员，顺序读取时请求块大小逐步翻倍以减少请求次数。
+    """
+    
+    def __init__(self, session, url, size, timeout=30, min_block=64 * 1024, max_block=16 * 1024 * 1024,
+                 progress_callback=None, cancel_event=None, max_retries=3):
+        super().__init__()
+        self.session = session
+        self.url = url
+        self.size = size
+        self.timeout = timeout
+        self.min_block = min_block
+        self.max_block = max_block
+        self.progress_callback = progress_callback
+        self.cancel_event = cancel_event
+        self.max_retries = max_retries
+        self.position = 0
+        self.block_start = 0
+        self.block = b""
+        self.next_block_size = min_block
+        self.fetched = 0
+    
+    def readable(self):
+        return True
+    
+    def seekable(self):
+        return True
+    
+    def tell(self):
+        return self.position
+    
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self.position = offset
+        elif whence == io.SEEK_CUR:
+            self.position += offset
+        else:
+            self.position = self.size + offset
+        return self.position
+    
+    def readinto(self, buffer):
+        if self.position >= self.size:
+            return 0
+        offset = self.position - self.block_start
+        if not (0 <= offset < len(self.block)):
+            self._fetch(self.position, len(buffer))
+            offset = 0
+        data = self.block[offset:offset + len(buffer)]
+        buffer[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+    
+    def _fetch(self, start, wanted):
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise DownloadCancelled("下载已取消")
+        # 紧接上一块的顺序读取时扩大请求块，随机读取时恢复最小块
+        if start == self.block_start + len(self.block) and self.block:
+            self.next_block_size = min(self.next_block_size * 2, self.max_block)
+        else:
+            self.next_block_size = self.min_block
+        end = min(self.size, start + max(wanted, self.next_block_size)) - 1
+        parts, received, attempt = [], 0, 0
+        while start + received <= end:
+            before = received
+            try:
+                headers = {"Range": f"bytes={start + received}-{end}"}
+                with self.session.get(self.url, headers=headers, stream=True, timeout=self.timeout) as response:
+                    if response.status_code != 206:
+                        raise Exception(f"分段请求失败: HTTP {response.status_code}")
+                    for chunk in response.iter_content(chunk_size=16 * 1024):
+                        parts.append(chunk)
+                        received += len(chunk)
+                if start + received <= end:
+                    raise requests.ConnectionError("连接提前结束")
+            except requests.RequestException:
+                # 连接中断时从已收到的位置继续请求该块，有进展时不计入重试次数
+                attempt = 1 if received > before else attempt + 1
+                if attempt > self.max_retries:
+                    raise
+                time.sleep(min(2 ** attempt, 10))
+        self.block_start = start
+        self.block = b"".join(parts)
+        self.fetched += len(self.block)
+        if self.progress_callback:
+            self.progress_callback(self.fetched, None)
+
+class _ResumableStream:
+    """通过Range请求顺序读取远程文件，连接中断时从已读取的位置重新请求"""
+    
+    def __init__(self, session, url, total, timeout=60, max_retries=3, block_size=1024 * 1024):
+        self.session = session
+        self.url = url
+        self.total = total
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.block_size = block_size
+        self.position = 0
+        self.response = None
+    
+    def _open(self):
+        self.close()
+        response = self.session.get(
+            self.url, headers={"Range": f"bytes={self.position}-{self.total - 1}"}, stream=True, timeout=self.timeout
+        )
+        if response.status_code != 206:
+            response.close()
+            raise StreamingUnsupported(f"分段请求失败: HTTP {response.status_code}")
+        self.response = response
+    
+    def read(self, size=-1):
+        if self.position >= self.total:
+            return b""
+        size = self.total - self.position if size is None or size < 0 else size
+        attempt = 0
+        while True:
+            try:
+                if self.response is None:
+                    self._open()
+                data = self.response.raw.read(min(size, self.block_size))
+                if not data:
+                    raise requests.ConnectionError("连接提前结束")
+                self.position += len(data)
+                return data
+            except (requests.RequestException, urllib3.exceptions.HTTPError, OSError):
+                self.close()
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise
+                time.sleep(min(2 ** attempt, 10))
+    
+    def close(self):
+        if self.response is not None:
+            self.response.close()
+            self.response = None
+
+class _HashingReader:
+    """边读取边计算摘要的文件包装，用于流式解压时校验完整压缩包"""
+    
+    def __init__(self, raw, algorithm="sha256", progress_callback=None, total=None, cancel_event=None):
+        self.raw = raw
+        self.digest = hashlib.new(algorithm)
+        self.size = 0
+        self.total = total
+        self.progress_callback = progress_callback
+        self.cancel_event = cancel_event
+        self.pending = b""  # 解析zip时多读出、退回的数据
+    
+    def read(self, size=-1):
+        if self.pending:
+            if size is None or size < 0:
+                size = len(self.pending)
+            data, self.pending = self.pending[:size], self.pending[size:]
+            return data
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise DownloadCancelled("下载已取消")
+        data = self.raw.read(size)
+        self.digest.update(data)
+        self.size += len(data)
+        if self.progress_callback:
+            self.progress_callback(self.size, self.total)
+        return data
+    
+    def unread(self, data):
+        self.pending = data + self.pending
+    
+    def read_exact(self, size):
+        parts = []
+        while size > 0:
+            data = self.read(size)
+            if not data:
+                raise Exception("压缩包数据不完整")
+            parts.append(data)
+            size -= len(data)
+        return b"".join(parts)
+
+class ArchiveExtractor:
+    """BBDown压缩包解压器，只取出可执行文件
+
+    默认边下载边解压，不写临时压缩包：tar.gz 和 zip 都按顺序流式解析，只写出可执行文件，
+    读完整个压缩包后校验大小和摘要；没有公布摘要的zip只通过Range请求读取中央目录和可执行文件成员（由CRC-32校验）。
+    流式读取依赖Range请求在断线后续传，服务器不支持Range或zip结构无法流式解析时，
+    才用 SegmentedDownloader 下载完整压缩包到本地（可续传）再解压。
+    """
+    
+    def __init__(self, session=None, buffer_size=1024 * 1024, timeout=60, progress_callback=None, cancel_event=None):
+        self.session = session or requests.Session()
+        self.buffer_size = buffer_size
+        self.timeout = timeout
+        self.cancel_event = cancel_event or threading.Event()
+        self.progress_callback = progress_callback
+        self._last_report = 0.0
+    
+    def extract(self, url, dest_dir, download_path, expected_size=None, expected_digest=None):
+        """下载url指向的压缩包（zip或tar.gz）并把可执行文件解压到dest_dir，返回可执行文件路径"""
+        name = os.path.basename(urlparse(url).path).lower()
+        is_zip = name.endswith('.zip')
+        if not is_zip and not name.endswith(('.tar.gz', '.tgz')):
+            raise Exception(f"不支持的压缩格式: {name}")
+        final_url, total, supports_range = SegmentedDownloader(self.session, timeout=self.timeout).probe(url)
+        if expected_size and total and expected_size != total:
+            raise Exception(f"文件大小不一致: 期望 {expected_size}，服务器返回 {total}")
+        if supports_range and total:
+            try:
+                if is_zip and not expected_digest:
+                    return self.extract_zip_remote(final_url, dest_dir, total)
+                return self.extract_stream(final_url, dest_dir, is_zip, total, expected_digest)
+            except StreamingUnsupported as e:
+                install_log.info("无法流式解压，改为先下载压缩包: %s", e)
+        
+        # 下载中断时保留 .part 和分段进度，再次下载时从中断处继续
+        SegmentedDownloader(self.session, buffer_size=self.buffer_size, timeout=self.timeout).download(
+            url, download_path, expected_size, expected_digest, self.progress_callback, self.cancel_event
+        )
+        try:
+            if is_zip:
+                with open(download_path, 'rb') as f:
+                    return self._extract_zip_executable(f, dest_dir)
+            with tarfile.open(download_path, "r:gz") as archive:
+                for member in archive:
+                    if member.isfile() and is_bbdown_executable_name(member.name):
+                        return self._write_member(archive.extractfile(member), dest_dir, member.name, member.mode)
+            raise Exception("未找到BBDown可执行文件")
+        finally:
+            os.remove(download_path)
+    
+    def _report(self, done, total):
+        """节流的进度回调，每秒最多4次"""
+        now = time.monotonic()
+        if self.progress_callback and now - self._last_report >= 0.25:
+            self._last_report = now
+            self.progress_callback(done, total)
+    
+    def _write_member(self, source, dest_dir, name, mode=None):
+        dest = os.path.join(dest_dir, os.path.basename(name.rstrip("/")))
+        with open(dest, 'wb', buffering=self.buffer_size) as out:
+            shutil.copyfileobj(source, out, self.buffer_size)
+        if mode:
+            os.chmod(dest, mode & 0o777)
+        return dest
+    
+    def extract_stream(self, url, dest_dir, is_zip, total, expected_digest=None):
+        """边下载边解压，只写出可执行文件，读完压缩包后校验大小和摘要"""
+        algorithm = (expected_digest or "sha256:").rpartition(":")[0] or "sha256"
+        stream = _ResumableStream(self.session, url, total, self.timeout, block_size=self.buffer_size)
+        try:
+            reader = _HashingReader(stream, algorithm, self._report, total, self.cancel_event)
+            executable = None
+            if is_zip:
+                executable = self._extract_zip_stream(reader, dest_dir)
+            else:
+                with tarfile.open(fileobj=reader, mode="r|gz") as archive:
+                    for member in archive:
+                        if executable is None and member.isfile() and is_bbdown_executable_name(member.name):
+                            executable = self._write_member(archive.extractfile(member), dest_dir, member.name, member.mode)
+            # 读完剩余数据以完成摘要计算
+            while reader.read(self.buffer_size):
+                pass
+        finally:
+            stream.close()
+        if reader.size != total:
+            raise Exception(f"文件大小校验失败: 期望 {total}，实际 {reader.size}")
+        if expected_digest and reader.digest.hexdigest().lower() != expected_digest.rpartition(":")[2].lower():
+            raise Exception("文件摘要校验失败")
+        if not executable:
+            raise Exception("未找到BBDown可执行文件")
+        return executable
+    
+    def _extract_zip_stream(self, reader, dest_dir):
+        """按本地文件头顺序解析zip，写出可执行文件成员并校验CRC-32，读到中央目录时停止"""
+        executable = None
+        while True:
+            if reader.read_exact(4) != b"PK\x03\x04":
+                return executable  # 已到中央目录
+            _, flags, method, _, _, crc, compressed, _, name_len, extra_len = struct.unpack(
+                "<HHHHHIIIHH", reader.read_exact(26)
+            )
+            name = reader.read_exact(name_len).decode("utf-8" if flags & 0x800 else "cp437")
+            extra = reader.read_exact(extra_len)
+            has_descriptor = bool(flags & 0x8)
+            if flags & 0x1 or method not in (0, 8) or compressed == 0xFFFFFFFF or 0x0001 in self._extra_ids(extra):
+                raise StreamingUnsupported(f"zip成员 {name} 使用了加密、ZIP64或不支持的压缩方式")
+            if has_descriptor and method == 0:
+                raise StreamingUnsupported(f"zip成员 {name} 未在文件头中记录大小")
+            wanted = executable is None and not name.endswith("/") and is_bbdown_executable_name(name)
+            dest = os.path.join(dest_dir, os.path.basename(name)) if wanted else None
+            out = open(dest, 'wb', buffering=self.buffer_size) if wanted else None
+            try:
+                actual_crc = self._copy_zip_member(reader, method, None if has_descriptor else compressed, out)
+            finally:
+                if out:
+                    out.close()
+            if has_descriptor:
+                descriptor = reader.read_exact(4)
+                if descriptor == b"PK\x07\x08":
+                    descriptor = reader.read_exact(4)
+                crc = struct.unpack("<I", descriptor)[0]
+                reader.read_exact(8)
+            if wanted:
+                if actual_crc != crc:
+                    raise Exception("可执行文件CRC校验失败")
+                executable = dest
+    
+    @staticmethod
+    def _extra_ids(extra):
+        """zip扩展字段中各字段的标识（0x0001为ZIP64）"""
+        ids, offset = set(), 0
+        while offset + 4 <= len(extra):
+            field_id, size = struct.unpack_from("<HH", extra, offset)
+            ids.add(field_id)
+            offset += 4 + size
+        return ids
+    
+    def _copy_zip_member(self, reader, method, compressed, out):
+        """复制（或跳过）一个zip成员的数据，compressed为None时由deflate流自身确定结尾，返回CRC-32"""
+        if out is None and compressed is not None:
+            while compressed:
+                compressed -= len(reader.read_exact(min(compressed, self.buffer_size)))
+            return None
+        decompressor = zlib.decompressobj(-15) if method == 8 else None
+        crc = 0
+        while compressed is None or compressed > 0:
+            chunk = reader.read(self.buffer_size if compressed is None else min(compressed, self.buffer_size))
+            if not chunk:
+                raise Exception("压缩包数据不完整")
+            if compressed is not None:
+                compressed -= len(chunk)
+            data = decompressor.decompress(chunk) if decompressor else chunk
+            crc = zlib.crc32(data, crc)
+            if out:
+                out.write(data)
+            if decompressor and decompressor.eof:
+                reader.unread(decompressor.unused_data)
+                break
+        if decompressor:
+            data = decompressor.flush()
+            crc = zlib.crc32(data, crc)
+            if out:
+                out.write(data)
+        return crc
+    
+    def extract_zip_remote(self, url, dest_dir, total):
+        """通过Range请求只读取zip中的可执行文件成员，成员的CRC-32由zipfile校验"""
+        remote = HTTPRangeFile(self.session, url, total, self.timeout,
+                               progress_callback=lambda done, _: self._report(done, total),
+                               cancel_event=self.cancel_event)
+        return self._extract_zip_executable(io.BufferedReader(remote, self.buffer_size), dest_dir)
+    
+    def _extract_zip_executable(self, fileobj, dest_dir):
+        with zipfile.ZipFile(fileobj) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and is_bbdown_executable_name(info.filename):
+                    with archive.open(info) as source:
+                        return self._write_member(source, dest_dir, info.filename, info.external_attr >> 16)
+        raise Exception("未找到BBDown可执行文件")
+
+# 服务端输出捕获
+ANSI_ESCAPE_RE = re.compile(r'\x1b\[[0-9;?]*[A-Za-z]')
+
+def decode_console_line(raw):
+    """解码子进程输出的一行：优先UTF-8，失败时使用系统编码；去除颜色控制符，进度刷新行只保留最后一段"""
+    try:
+        text = raw.decode('utf-8')
+    except UnicodeDecodeError:
+        text = raw.decode(locale.getpreferredencoding(False) or 'utf-8', errors='replace')
+    text = ANSI_ESCAPE_RE.sub('', text.rstrip('\r\n'))
+    segments = [segment for segment in text.split('\r') if segment.strip()]
+    return segments[-1] if segments else ""
+
+class ServerLogBuffer:
+    """线程安全的服务端日志环形缓冲区，按序号增量读取，可选写入按大小轮转的日志文件"""
     
-    def get_tasks(self):
-        try:
-            response = requests.get(f"{self.base_url}/get-tasks/", timeout=5)
-            return response.json() if response.status_code == 200 else None
-        except Exception as e:
-            print(f"获取任务失败: {str(e)}")
-            return None
+    def __init__(self, max_lines=5000, max_bytes=5 * 1024 * 1024, backup_count=3):
+        self.entries = deque(maxlen=max_lines)  # (序号, 时间戳, 来源, 文本)
+        self.seq = 0
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.log_path = None
+        self._file = None
+        self._lock = threading.Lock()
     
-    def get_running_tasks(self):
-        try:
-            response = requests.get(f"{self.base_url}/get-tasks/running", timeout=5)
-            return response.json() if response.status_code == 200 else []
-        except Exception as e:
-            print(f"获取运行中任务失败: {str(e)}")
-            return []
+    def append(self, source, text):
+        with self._lock:
+            self.seq += 1
+            entry = (self.seq, time.time(), source, text)
+            self.entries.append(entry)
+            if self._file:
+                self._write(entry)
     
-    def get_finished_tasks(self):
+    def since(self, seq):
+        """返回序号大于seq的日志，缓冲区溢出丢弃的部分不再返回"""
+        with self._lock:
+            if seq >= self.seq:
+                return []
+            new_count = min(self.seq - seq, len(self.entries))
+            return list(self.entries)[-new_count:]
+    
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+    
+    @staticmethod
+    def format_entry(entry):
+        _, ts, source, text = entry
+        return f"{datetime.fromtimestamp(ts).strftime('%H:%M:%S')} [{source}] {text}"
+    
+    def set_log_file(self, path):
+        """开启（path非空）或关闭日志文件写入"""
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+            self.log_path = path
+            if path:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                self._file = open(path, 'a', encoding='utf-8')
+    
+    def _write(self, entry):
         try:
-            response = requests.get(f"{self.base_url}/get-tasks/finished", timeout=5)
-            return response.json() if response.status_code == 200 else []
-        except Exception as e:
-            print(f"获取已完成任务失败: {str(e)}")
-            return []
+            self._file.write(self.format_entry(entry) + "\n")
+            self._file.flush()
+            if self._file.tell() >= self.max_bytes:
+                self._rotate()
+        except OSError:
+            pass
     
-    def get_task(self, aid):
+    def _rotate(self):
+        self._file.close()
+        for index in range(self.backup_count - 1, 0, -1):
+            source = f"{self.log_path}.{index}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.log_path}.{index + 1}")
+        os.replace(self.log_path, f"{self.log_path}.1")
+        self._file = open(self.log_path, 'a', encoding='utf-8')
+
+# BBDown服务端进程管理
+class BBDownServerSupervisor:
+    """管理一个BBDown serve子进程：退避轮询就绪状态、崩溃后在次数上限内自动重启、按PID停止"""
+    
+    def __init__(self, bbdown_path, port=58682, listen_host="0.0.0.0", cwd=None,
+                 ready_timeout=30, max_restarts=5, restart_window=600, log_buffer=None):
+        self.bbdown_path = bbdown_path
+        self.port = port
+        self.listen_host = listen_host
+        self.cwd = cwd
+        self.log_buffer = log_buffer
+        self.ready_timeout = ready_timeout
+        self.max_restarts = max_restarts
+        self.restart_window = restart_window
+        self.process = None
+        self.state = "stopped"  # starting / running / restarting / failed / stopped
+        self.started_at = None
+        self.restart_count = 0
+        self.recent_restarts = []
+        self.last_exit_code = None
+        self._stopping = threading.Event()
+        self._detached = threading.Event()
+        self._spawn_lock = threading.Lock()  # 停止与监控线程重启互斥，停止后不会再启动新进程
+        self._monitor_thread = None
+    
+    @property
+    def probe_url(self):
+        return f"http://127.0.0.1:{self.port}/get-tasks/"
+    
+    def console_paths(self):
+        """子进程stdout和stderr直接写入的文件"""
+        base = os.path.join(get_gui_data_dir(), "server_logs", f"bbdown-{self.port}")
+        return f"{base}.out.log", f"{base}.err.log"
+    
+    @property
+    def executable_record_path(self):
+        """记录该端口上次启动所用的可执行文件，沿用后台服务端时据此避免清理其版本目录"""
+        return os.path.join(get_gui_data_dir(), "server_logs", f"bbdown-{self.port}.json")
+    
+    def recorded_executable(self):
         try:
-            response = requests.get(f"{self.base_url}/get-tasks/{aid}", timeout=5)
-            return response.json() if response.status_code == 200 else None
-        except Exception as e:
-            print(f"获取任务详情失败: {str(e)}")
+            with open(self.executable_record_path, 'r', encoding='utf-8') as f:
+                return json.load(f).get("path")
+        except (OSError, ValueError):
             return None
     
-    def add_task(self, url, options=None):
-        data = {"Url": url}
-        if options:
-            data.update(options)
+    def _spawn(self):
+        cmd = [self.bbdown_path, "serve", "-l", f"http://{self.listen_host}:{self.port}"]
+        # 输出写入文件再跟踪读取到日志缓冲区，不经过GUI持有的管道，GUI退出后服务端可以继续运行；
+        # Windows下不再弹出控制台窗口
+        kwargs = {"stdin": subprocess.DEVNULL}
+        if platform.system() == "Windows":
+            kwargs["creationflags"] = subprocess.CREATE_NO_WINDOW
+        else:
+            kwargs["start_new_session"] = True  # 不随启动GUI的终端一起收到中断信号
+        outputs = []
         try:
-            response = requests.post(
-                f"{self.base_url}/add-task",
-                json=data,
-                headers={"Content-Type": "application/json"},
-                timeout=10
-            )
-            return response.status_code == 200
-        except Exception as e:
-            print(f"添加任务失败: {str(e)}")
-            return False
+            for path in self.console_paths():
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                # 保留上一个进程的输出，便于排查崩溃原因
+                try:
+                    if os.path.exists(path):
+                        os.replace(path, path + ".1")
+                except OSError:
+                    pass
+                outputs.append(open(path, 'wb'))
+            self.process = subprocess.Popen(cmd, cwd=self.cwd, stdout=outputs[0], stderr=outputs[1], **kwargs)
+        finally:
+            for output in outputs:
+                output.close()
+        try:
+            write_json_atomic(self.executable_record_path, {"path": os.path.abspath(self.bbdown_path), "pid": self.process.pid})
+        except OSError as e:
+            install_log.warning("记录服务端可执行文件失败: %s", e)
+        self.started_at = time.time()
+        if self.log_buffer is not None:
+            for path, name in zip(self.console_paths(), ("stdout", "stderr")):
+                threading.Thread(target=self._follow_output, args=(path, name, self.process), daemon=True).start()
     
-    def remove_finished_tasks(self):
+    def _follow_output(self, path, name, process):
+        """跟踪读取输出文件，直到进程退出且剩余内容读完，或不再管理该进程"""
+        source = str(self.port) if name == "stdout" else f"{self.port}/err"
+        pending = b""
+        with open(path, 'rb') as f:
+            while not self._detached.is_set():
+                chunk = f.read(65536)
+                if not chunk:
+                    if process.poll() is not None:
+                        break
+                    time.sleep(0.2)
+                    continue
+                *lines, pending = (pending + chunk).split(b"\n")
+                for raw in lines:
+                    text = decode_console_line(raw)
+                    if text:
+                        self.log_buffer.append(source, text)
+        text = decode_console_line(pending)
+        if text and not self._detached.is_set():
+            self.log_buffer.append(source, text)
+    
+    def responds(self):
+        """端口上是否已有服务端在响应"""
         try:
-            response = requests.get(f"{self.base_url}/remove-finished", timeout=5)
-            return response.status_code == 200
-        except Exception as e:
-            print(f"移除已完成任务失败: {str(e)}")
+            return requests.get(self.probe_url, timeout=1).status_code == 200
+        except requests.RequestException:
             return False
     
-    def remove_failed_tasks(self):
-        try:
-            response = requests.get(f"{self.base_url}/remove-finished/failed", timeout=5)
-            return response.status_code == 200
-        except Exception as e:
-            print(f"移除失败任务失败: {str(e)}")
+    def wait_ready(self):
+        """以指数退避轮询服务端接口，直到就绪、进程退出或超过期限"""
+        deadline = time.monotonic() + self.ready_timeout
+        delay = 0.05
+        while time.monotonic() < deadline and not self._stopping.is_set():
+            if self.process.poll() is not None:
+                self.last_exit_code = self.process.returncode
+                return False
+            try:
+                if requests.get(self.probe_url, timeout=1).status_code == 200:
+                    return True
+            except requests.RequestException:
+                pass
+            time.sleep(delay)
+            delay = min(delay * 2, 1.0)
+        return False
+    
+    def start(self):
+        """启动服务端并等待就绪，成功后开始监控进程"""
+        if self.is_running():
+            return True
+        if not self.bbdown_path or not os.path.exists(self.bbdown_path):
+            raise Exception("BBDown可执行文件不存在")
+        self._stopping.clear()
+        self.state = "starting"
+        self._spawn()
+        if not self.wait_ready():
+            self._terminate()
+            self.state = "failed"
             return False
+        self.state = "running"
+        self._monitor_thread = threading.Thread(target=self._monitor, daemon=True)
+        self._monitor_thread.start()
+        return True
     
-    def remove_task(self, aid):
+    def _monitor(self):
+        """等待进程退出，非主动停止的退出视为崩溃并重启"""
+        while not self._stopping.is_set():
+            self.last_exit_code = self.process.wait()
+            if self._stopping.is_set():
+                break
+            if self.log_buffer is not None:
+                self.log_buffer.append(str(self.port), f"== 服务进程意外退出，退出码 {self.last_exit_code}")
+            now = time.time()
+            self.recent_restarts = [t for t in self.recent_restarts if now - t < self.restart_window]
+            if len(self.recent_restarts) >= self.max_restarts:
+                self.state = "failed"
+                break
+            self.state = "restarting"
+            self.recent_restarts.append(now)
+            self.restart_count += 1
+            # 连续崩溃时逐步延长重启间隔
+            if self._stopping.wait(min(2 ** (len(self.recent_restarts) - 1), 30)):
+                break
+            with self._spawn_lock:
+                if self._stopping.is_set():
+                    break
+                self._spawn()
+            if self.wait_ready():
+                self.state = "running"
+            elif self._stopping.is_set():
+                break
+            elif self.process.poll() is None:
+                # 进程仍在但始终未就绪，不再等待
+                if self.log_buffer is not None:
+                    self.log_buffer.append(str(self.port), f"== 重启后 {self.ready_timeout} 秒内未就绪，已放弃")
+                self._terminate()
+                self.last_exit_code = None
+                self.state = "failed"
+                break
+            # 就绪前退出按再次崩溃处理，由下一轮计入重启次数
+    
+    def _terminate(self, timeout=5):
+        if not self.process or self.process.poll() is not None:
+            return
+        self.process.terminate()
         try:
-            response = requests.get(f"{self.base_url}/remove-finished/{aid}", timeout=5)
-            return response.status_code == 200
+            self.process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+    
+    def stop(self, timeout=5):
+        """按PID停止服务端：先发送终止信号，超时后强制结束"""
+        with self._spawn_lock:
+            self._stopping.set()
+        self._terminate(timeout)
+        if self._monitor_thread and self._monitor_thread is not threading.current_thread():
+            self._monitor_thread.join(timeout)
+        self.state = "stopped"
+        self.started_at = None
+    
+    def detach(self):
+        """不再管理进程但保持其运行（退出GUI时保留服务端），输出继续写入日志文件"""
+        with self._spawn_lock:
+            self._stopping.set()
+        self._detached.set()
+        self.state = "stopped"
+    
+    def is_running(self):
+        return self.process is not None and self.process.poll() is None and self.state in ("starting", "running", "restarting")
+    
+    def uptime(self):
+        """当前进程已运行秒数"""
+        if not self.started_at or not self.is_running():
+            return 0
+        return time.time() - self.started_at
+    
+    def describe(self):
+        return f"端口 {self.port}"
+    
+    def failure_reason(self):
+        if self.last_exit_code is not None:
+            return f"服务器进程已退出，退出码: {self.last_exit_code}"
+        return "等待服务器就绪超时"
+    
+    def status(self):
+        return {
+            "state": self.state,
+            "pid": self.process.pid if self.is_running() else None,
+            "port": self.port,
+            "uptime": self.uptime(),
+            "restarts": self.restart_count,
+            "last_exit_code": self.last_exit_code,
+        }
+
+SERVER_STATE_NAMES = {
+    "starting": "启动中", "running": "运行中", "restarting": "重启中", "failed": "已崩溃", "stopped": "已停止",
+}
+
+class LocalServerPool:
+    """在连续端口上管理多个本地BBDown serve实例，每个实例可指定独立的默认工作目录"""
+    
+    def __init__(self, log_buffer=None):
+        self.log_buffer = log_buffer
+        self.bbdown_path = None
+        self.base_port = 58682
+        self.count = 1
+        self.work_dirs = []
+        self.instances = {}  # port -> BBDownServerSupervisor
+        self.adopted_ports = set()  # 启动时已有服务端在运行、直接沿用的端口
+    
+    def configure(self, bbdown_path, base_port, count, work_dirs=()):
+        """设置实例参数；可执行文件或端口变化后，已停止的旧实例会被替换"""
+        self.bbdown_path = bbdown_path
+        self.base_port = base_port
+        self.count = max(1, count)
+        self.work_dirs = list(work_dirs)
+    
+    def ports(self):
+        return [self.base_port + index for index in range(self.count)]
+    
+    def work_dir_for(self, port):
+        """实例的默认工作目录"""
+        index = port - self.base_port
+        if 0 <= index < len(self.work_dirs) and self.work_dirs[index]:
+            return self.work_dirs[index]
+        return None
+    
+    def start(self):
+        """确保配置的实例全部运行，多余的实例被停止；全部就绪返回True"""
+        wanted = set(self.ports())
+        self.adopted_ports.clear()
+        for port in [p for p in self.instances if p not in wanted]:
+            self.instances.pop(port).stop()
+        
+        to_start = []
+        for port in wanted:
+            supervisor = self.instances.get(port)
+            work_dir = self.work_dir_for(port)
+            if supervisor and supervisor.is_running():
+                continue
+            if work_dir:
+                os.makedirs(work_dir, exist_ok=True)
+            supervisor = BBDownServerSupervisor(self.bbdown_path, port, cwd=work_dir, log_buffer=self.log_buffer)
+            if supervisor.responds():
+                # 上次退出时保留在后台运行的服务端，直接沿用
+                if self.log_buffer is not None:
+                    self.log_buffer.append(str(port), "== 端口上已有服务端在运行，沿用该服务端")
+                self.adopted_ports.add(port)
+                continue
+            self.instances[port] = supervisor
+            to_start.append(supervisor)
+        if not to_start:
+            return True
+        # 各实例并行启动，分别等待就绪
+        with ThreadPoolExecutor(max_workers=len(to_start)) as executor:
+            return all(executor.map(lambda s: s.start(), to_start))
+    
+    def stop(self):
+        """停止所有实例"""
+        instances = list(self.instances.values())
+        if instances:
+            with ThreadPoolExecutor(max_workers=len(instances)) as executor:
+                list(executor.map(lambda s: s.stop(), instances))
+        self.instances.clear()
+    
+    def detach(self):
+        """保留所有实例在后台运行，不再管理"""
+        for supervisor in self.instances.values():
+            supervisor.detach()
+        self.instances.clear()
+    
+    def is_running(self):
+        return any(s.is_running() for s in self.instances.values())
+    
+    def running_ports(self):
+        return sorted(port for port, s in self.instances.items() if s.is_running())
+    
+    def executables_in_use(self):
+        """正在运行的实例（包括沿用的后台服务端）所用的可执行文件路径"""
+        paths = [s.bbdown_path for s in self.instances.values() if s.is_running()]
+        for port in self.adopted_ports:
+            path = BBDownServerSupervisor(None, port).recorded_executable()
+            if path:
+                paths.append(path)
+        return paths
+    
+    def describe(self):
+        ports = self.running_ports()
+        if not ports and self.adopted_ports:
+            return f"沿用已在运行的服务端，端口 {', '.join(map(str, sorted(self.adopted_ports)))}"
+        if len(ports) == 1:
+            return f"端口 {ports[0]}"
+        return f"{len(ports)} 个实例，端口 {ports[0]}-{ports[-1]}" if ports else "无运行实例"
+    
+    def failure_reason(self):
+        reasons = []
+        for port, supervisor in sorted(self.instances.items()):
+            if not supervisor.is_running():
+                reasons.append(f"端口 {port}: {supervisor.failure_reason()}")
+        return "部分实例启动失败：\n" + "\n".join(reasons) if reasons else "启动失败"
+
+# 后台查找BBDown安装
+class BBDownDiscoveryThread(QThread):
+    finished = pyqtSignal(object)  # {"version", "path"} 或 None
+    
+    def run(self):
+        try:
+            self.finished.emit(BBDownInstallManager().discover())
         except Exception as e:
-            print(f"移除特定任务失败: {str(e)}")
-            return False
+            install_log.warning("查找BBDown失败: %s", e)
+            self.finished.emit(None)
 
-# 网络请求线程
-class APITaskThread(QThread):
-    finished = pyqtSignal(object)
+# 后台读取任务历史
+class HistoryLoadThread(QThread):
+    finished = pyqtSignal(object)  # 加载好的 TaskHistoryStore
     
-    def __init__(self, api_client, task_type, *args, **kwargs):
+    def __init__(self, path):
         super().__init__()
-        self.api_client = api_client
-        self.task_type = task_type
-        self.args = args
-        self.kwargs = kwargs
-        
+        self.path = path
+    
     def run(self):
+        store = TaskHistoryStore(self.path, load=False)
         try:
-            if self.task_type == "get_tasks":
-                result = self.api_client.get_tasks()
-            elif self.task_type == "get_running_tasks":
-                result = self.api_client.get_running_tasks()
-            elif self.task_type == "get_finished_tasks":
-                result = self.api_client.get_finished_tasks()
-            elif self.task_type == "get_task":
-                result = self.api_client.get_task(*self.args)
-            elif self.task_type == "add_task":
-                result = self.api_client.add_task(*self.args, **self.kwargs)
-            elif self.task_type == "remove_finished_tasks":
-                result = self.api_client.remove_finished_tasks()
-            elif self.task_type == "remove_failed_tasks":
-                result = self.api_client.remove_failed_tasks()
-            elif self.task_type == "remove_task":
-                result = self.api_client.remove_task(*self.args)
-            else:
-                result = None
-                
-            self.finished.emit(result)
+            store.load()
+            if store.needs_compaction():
+                task_log.info("任务历史已压缩，%s 条过期记录移入归档", store.compact())
         except Exception as e:
-            print(f"API线程错误: {str(e)}")
-            self.finished.emit(None)
+            task_log.warning("读取任务历史失败: %s", e)
+        self.finished.emit(store)
 
 # BBDown下载和管理线程
 class BBDownManagerThread(QThread):
     progress = pyqtSignal(str)  # 进度信息
     finished = pyqtSignal(bool, str)  # 完成状态和消息
     
-    def __init__(self, action="download", bbdown_path=None):
+    def __init__(self, action="download", bbdown_path=None, supervisor=None, base_url=None, in_use=()):
         super().__init__()
         self.action = action
+        self.in_use = list(in_use)  # 正在运行的服务端所用的可执行文件，更新时不能删除
         self.bbdown_path = bbdown_path
+        self.supervisor = supervisor
+        self.base_url = base_url
+        self.cancel_event = threading.Event()
         
     def run(self):
         try:
             if self.action == "download":
                 self.download_bbdown()
+            elif self.action == "rollback":
+                previous = BBDownInstallManager().rollback()
+                self.finished.emit(True, f"已回滚到 BBDown {previous.get('version') or ''}: {previous['path']}")
             elif self.action == "start":
                 self.start_bbdown_server()
+            elif self.action == "stop":
+                self.stop_bbdown_server()
+            elif self.action == "stop_external":
+                self.stop_external_server()
+            elif self.action == "delete":
+                self.delete_bbdown_files()
         except Exception as e:
             self.finished.emit(False, f"操作失败: {str(e)}")
     
@@ -164,16 +3856,18 @@ class BBDownManagerThread(QThread):
         try:
             self.progress.emit("正在获取最新版本信息...")
             
-            # 获取最新版本信息
-            releases_url = "https://api.github.com/repos/nilaoda/BBDown/releases/latest"
-            response = requests.get(releases_url, timeout=30)
-            if response.status_code != 200:
-                raise Exception("无法获取版本信息")
-            
-            release_data = response.json()
+            # 获取最新版本信息（带ETag缓存）
+            install_manager = BBDownInstallManager()
+            release_data = install_manager.fetch_latest_release()
             tag_name = release_data["tag_name"]
             assets = release_data["assets"]
             
+            # 已是最新版本时无需下载
+            current = install_manager.current()
+            if current and current.get("version") == tag_name:
+                self.finished.emit(True, f"BBDown {tag_name} 已是最新版本: {current['path']}")
+                return
+            
             # 确定当前系统和架构
             system = platform.system().lower()
             machine = platform.machine().lower()
@@ -205,6 +3899,8 @@ class BBDownManagerThread(QThread):
                 if target_name in asset["name"]:
                     download_url = asset["browser_download_url"]
                     break
+            asset_size = asset.get("size") if download_url else None
+            asset_digest = asset.get("digest") if download_url else None
             
             if not download_url:
                 raise Exception(f"未找到适合 {system}-{machine} 的版本")
@@ -212,136 +3908,167 @@ class BBDownManagerThread(QThread):
             self.progress.emit(f"正在下载 {tag_name} 版本...")
             
             # 创建BBDown目录
-            bbdown_dir = os.path.join(os.path.expanduser("~"), ".bbdown")
+            bbdown_dir = install_manager.root
             os.makedirs(bbdown_dir, exist_ok=True)
             
             # 下载文件
             filename = os.path.basename(urlparse(download_url).path)
             download_path = os.path.join(bbdown_dir, filename)
             
-            response = requests.get(download_url, stream=True, timeout=60)
-            total_size = int(response.headers.get('content-length', 0))
-            downloaded = 0
-            
-            with open(download_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    if chunk:
-                        f.write(chunk)
-                        downloaded += len(chunk)
-                        if total_size > 0:
-                            progress = (downloaded / total_size) * 100
-                            self.progress.emit(f"下载进度: {progress:.1f}%")
-            
-            self.progress.emit("正在解压文件...")
-            
-            # 解压文件
-            extract_dir = os.path.join(bbdown_dir, "current")
-            if os.path.exists(extract_dir):
-                import shutil
-                shutil.rmtree(extract_dir)
-            os.makedirs(extract_dir)
-            
-            if filename.endswith('.zip'):
-                with zipfile.ZipFile(download_path, 'r') as zip_ref:
-                    zip_ref.extractall(extract_dir)
-            elif filename.endswith(('.tar.gz', '.tgz')):
-                with tarfile.open(download_path, 'r:gz') as tar_ref:
-                    tar_ref.extractall(extract_dir)
-            
-            # 查找BBDown可执行文件
-            bbdown_exe = None
-            for root, dirs, files in os.walk(extract_dir):
-                for file in files:
-                    if file.lower().startswith('bbdown') and (file.endswith('.exe') or '.' not in file):
-                        bbdown_exe = os.path.join(root, file)
-                        break
-                if bbdown_exe:
-                    break
+            # 边下载边把可执行文件解压到临时目录并校验压缩包；成功后再切换版本，失败时当前版本不受影响
+            extract_dir = install_manager.create_staging_dir(tag_name)
+            extractor = ArchiveExtractor(
+                progress_callback=self.emit_download_progress,
+                cancel_event=self.cancel_event,
+            )
+            try:
+                bbdown_exe = extractor.extract(download_url, extract_dir, download_path, asset_size, asset_digest)
+            except Exception:
+                shutil.rmtree(extract_dir, ignore_errors=True)
+                raise
             
-            if not bbdown_exe:
-                raise Exception("未找到BBDown可执行文件")
+            # zip包不保留权限位，Linux下直接添加可执行权限
+            if system == "linux":
+                os.chmod(bbdown_exe, os.stat(bbdown_exe).st_mode | 0o111)
             
             # 在macOS上设置可执行权限
             if system == "darwin":
                 self.progress.emit("开始设置macOS可执行权限...")
-                print(f"[DEBUG] 准备为文件设置可执行权限: {bbdown_exe}")
+                install_log.debug("准备为文件设置可执行权限: %s", bbdown_exe)
                 
                 # 直接使用osascript请求管理员权限进行赋权
                 script = f'do shell script "chmod +x {bbdown_exe}" with administrator privileges'
-                print(f"[DEBUG] 构建的osascript命令: {script}")
+                install_log.debug("构建的osascript命令: %s", script)
                 
                 self.progress.emit("正在请求管理员权限...")
-                print("[DEBUG] 开始执行osascript命令，等待用户授权...")
+                install_log.debug("开始执行osascript命令，等待用户授权...")
                 
                 try:
-                    print("[DEBUG] 调用subprocess.run执行osascript...")
+                    install_log.debug("调用subprocess.run执行osascript...")
                     result = subprocess.run(['osascript', '-e', script], 
                                            check=True, timeout=60, 
                                            capture_output=True, text=True)
-                    print(f"[DEBUG] osascript执行成功，返回码: {result.returncode}")
-                    print(f"[DEBUG] stdout: {result.stdout}")
-                    print(f"[DEBUG] stderr: {result.stderr}")
+                    install_log.debug("osascript执行成功，返回码: %s", result.returncode)
+                    install_log.debug("stdout: %s", result.stdout)
+                    install_log.debug("stderr: %s", result.stderr)
                     self.progress.emit("可执行权限设置成功")
-                    print("[DEBUG] 权限设置完成，继续后续流程...")
+                    install_log.debug("权限设置完成，继续后续流程...")
                     
                 except subprocess.TimeoutExpired:
-                    print("[ERROR] osascript执行超时")
+                    install_log.error("osascript执行超时")
                     raise Exception("设置可执行权限超时，请重试")
                 except subprocess.CalledProcessError as e:
-                    print(f"[ERROR] osascript执行失败，返回码: {e.returncode}")
-                    print(f"[ERROR] stdout: {e.stdout}")
-                    print(f"[ERROR] stderr: {e.stderr}")
+                    install_log.error("osascript执行失败，返回码: %s", e.returncode)
+                    install_log.error("stdout: %s", e.stdout)
+                    install_log.error("stderr: %s", e.stderr)
                     raise Exception(f"设置可执行权限失败: {e.stderr if e.stderr else '用户取消或权限不足'}")
                 except Exception as e:
-                    print(f"[ERROR] 设置权限时发生未知错误: {str(e)}")
-                    print(f"[ERROR] 错误类型: {type(e).__name__}")
+                    install_log.error("设置权限时发生未知错误: %s", e)
+                    install_log.error("错误类型: %s", type(e).__name__)
                     raise Exception(f"设置可执行权限时发生错误: {str(e)}")
             
-            print(f"[DEBUG] 开始清理下载的压缩包: {download_path}")
-            # 清理下载的压缩包
-            os.remove(download_path)
-            print("[DEBUG] 压缩包清理完成")
+            # 提交新版本并原子切换，保留上一个版本用于回滚
+            bbdown_exe = install_manager.commit(tag_name, extract_dir, bbdown_exe, self.in_use)
+            install_manager.prune(self.in_use)
             
-            print(f"[DEBUG] 准备发送完成信号: BBDown {tag_name} 下载完成")
+            install_log.debug("准备发送完成信号: BBDown %s 下载完成", tag_name)
             self.finished.emit(True, f"BBDown {tag_name} 下载完成: {bbdown_exe}")
-            print("[DEBUG] 完成信号已发送")
+            install_log.debug("完成信号已发送")
             
+        except DownloadCancelled:
+            self.finished.emit(False, "下载已取消")
         except Exception as e:
             self.finished.emit(False, f"下载失败: {str(e)}")
     
+    def emit_download_progress(self, downloaded, total):
+        """发送下载进度（由下载器节流调用）"""
+        if total:
+            self.progress.emit(f"下载进度: {downloaded / total * 100:.1f}%")
+        else:
+            self.progress.emit(f"已下载: {downloaded / (1024 ** 2):.1f} MB")
+    
     def start_bbdown_server(self):
         """启动BBDown服务器"""
         try:
             if not self.bbdown_path or not os.path.exists(self.bbdown_path):
                 raise Exception("BBDown可执行文件不存在")
             
-            self.progress.emit("正在启动BBDown服务器...")
-            
-            # 启动BBDown服务器
-            cmd = [self.bbdown_path, "serve", "-l", "http://0.0.0.0:58682"]
+            self.progress.emit("正在启动BBDown服务器，等待服务就绪...")
             
-            # 在后台启动进程
-            if platform.system() == "Windows":
-                subprocess.Popen(cmd, creationflags=subprocess.CREATE_NEW_CONSOLE)
+            # 由进程管理器启动并轮询就绪状态，就绪后立即返回
+            started_at = time.monotonic()
+            if self.supervisor.start():
+                elapsed = time.monotonic() - started_at
+                self.finished.emit(True, f"BBDown服务器启动成功（{self.supervisor.describe()}，耗时 {elapsed:.1f} 秒）")
             else:
-                subprocess.Popen(cmd)
-            
-            # 等待一下让服务器启动
-            import time
-            time.sleep(2)
-            
-            # 检查服务器是否启动成功
-            try:
-                response = requests.get("http://localhost:58682/get-tasks/", timeout=5)
-                if response.status_code == 200:
-                    self.finished.emit(True, "BBDown服务器启动成功")
-                else:
-                    self.finished.emit(False, "服务器启动失败")
-            except:
-                self.finished.emit(False, "无法连接到BBDown服务器")
+                self.finished.emit(False, self.supervisor.failure_reason())
                 
         except Exception as e:
             self.finished.emit(False, f"启动失败: {str(e)}")
+    
+    def stop_bbdown_server(self):
+        """停止由本程序管理的BBDown服务器"""
+        try:
+            self.progress.emit("正在停止BBDown服务器...")
+            self.supervisor.stop()
+            self.finished.emit(True, "BBDown服务器已停止")
+        except Exception as e:
+            self.finished.emit(False, f"停止服务器失败: {str(e)}")
+    
+    def _stop_external(self):
+        """通过API或进程名停止不由本程序管理的服务器，轮询确认已停止，返回是否已停止"""
+        # 尝试通过API优雅关闭
+        try:
+            response = requests.post(f"{self.base_url}/shutdown", timeout=5)
+            if response.status_code == 200:
+                return True
+        except requests.RequestException:
+            pass
+        
+        # 如果API关闭失败，尝试通过进程管理停止
+        self.progress.emit("正在结束BBDown进程...")
+        if platform.system() == "Windows":
+            subprocess.run(["taskkill", "/f", "/im", "BBDown.exe"], capture_output=True, text=True)
+        else:
+            subprocess.run(["pkill", "-f", "BBDown"], capture_output=True, text=True)
+        
+        # 轮询确认服务器已停止
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline:
+            try:
+                requests.get(f"{self.base_url}/get-tasks/", timeout=1)
+            except requests.RequestException:
+                return True
+            time.sleep(0.2)
+        return False
+    
+    def stop_external_server(self):
+        """停止不由本程序管理的BBDown服务器"""
+        try:
+            if self._stop_external():
+                self.finished.emit(True, "BBDown服务器已停止")
+            else:
+                self.finished.emit(False, "服务器可能仍在运行，请手动检查")
+        except Exception as e:
+            self.finished.emit(False, f"停止服务器失败: {str(e)}")
+    
+    def delete_bbdown_files(self):
+        """停止所有服务器后删除BBDown安装目录"""
+        try:
+            self.progress.emit("正在停止BBDown服务器...")
+            # 首先停止本程序管理的服务器，再停止其他服务器
+            self.supervisor.stop()
+            self._stop_external()
+            
+            bbdown_dir = BBDownInstallManager().root
+            if not os.path.exists(bbdown_dir):
+                self.finished.emit(True, "BBDown文件目录不存在")
+                return
+            self.progress.emit("正在删除BBDown文件...")
+            shutil.rmtree(bbdown_dir)
+            self.finished.emit(True, "BBDown文件已删除")
+        except Exception as e:
+            self.finished.emit(False, f"删除文件失败: {str(e)}")
 
 class OptionsForm(QWidget):
     def __init__(self, parent=None):
@@ -792,7 +4519,7 @@ class OptionsForm(QWidget):
     def on_basic_options_toggled(self, checked):
         """当基本选项组被勾选时的处理"""
         if checked:
-            print("[DEBUG] 基本选项组被勾选，设置默认工作目录")
+            options_log.debug("基本选项组被勾选，设置默认工作目录")
             self.set_default_work_dir()
     
     def set_default_work_dir(self):
@@ -833,13 +4560,13 @@ class OptionsForm(QWidget):
             # 检查目录是否存在
             if os.path.exists(downloads_path):
                 self.work_dir.setText(downloads_path)
-                print(f"[DEBUG] 设置默认工作目录为: {downloads_path}")
+                options_log.debug("设置默认工作目录为: %s", downloads_path)
             else:
-                print(f"[DEBUG] 默认下载目录不存在: {downloads_path}")
+                options_log.debug("默认下载目录不存在: %s", downloads_path)
         else:
             # 非localhost连接，保持为空
             self.work_dir.clear()
-            print("[DEBUG] 非localhost连接，工作目录保持为空")
+            options_log.debug("非localhost连接，工作目录保持为空")
     
     def get_options(self):
         """收集所有选项并返回字典"""
@@ -922,50 +4649,647 @@ class OptionsForm(QWidget):
         if parent_gui and hasattr(parent_gui, 'host_input'):
             current_host = parent_gui.host_input.text().strip().lower()
             is_localhost = current_host in ['localhost', '127.0.0.1', '::1']
-            print(f"[DEBUG] 当前连接主机: {current_host}, 是否为localhost: {is_localhost}")
+            options_log.debug("当前连接主机: %s, 是否为localhost: %s", current_host, is_localhost)
         
         # 只有在非localhost连接时才附加认证信息
         if not is_localhost:
             if self.cookie.text().strip():
                 options["Cookie"] = self.cookie.text().strip()
-                print("[DEBUG] 已添加Cookie参数")
+                options_log.debug("已添加Cookie参数")
             if self.access_token.text().strip():
                 options["AccessToken"] = self.access_token.text().strip()
-                print("[DEBUG] 已添加AccessToken参数")
+                options_log.debug("已添加AccessToken参数")
+        else:
+            options_log.debug("检测到localhost连接，跳过认证信息附加")
+        if self.host_input.text().strip():
+            options["Host"] = self.host_input.text().strip()
+        if self.ep_host_input.text().strip():
+            options["EpHost"] = self.ep_host_input.text().strip()
+        if self.upos_host.text().strip():
+            options["UposHost"] = self.upos_host.text().strip()
+        if self.aria2c_args.text().strip():
+            options["Aria2cArgs"] = self.aria2c_args.text().strip()
+        if self.aria2c_proxy.text().strip():
+            options["Aria2cProxy"] = self.aria2c_proxy.text().strip()
+        
+        # 高级设置
+        options["Debug"] = self.debug.isChecked()
+        options["ForceHttp"] = self.force_http.isChecked()
+        options["AllowPcdn"] = self.allow_pcdn.isChecked()
+        options["ForceReplaceHost"] = self.force_replace_host.isChecked()
+        options["SaveArchivesToFile"] = self.save_archives.isChecked()
+        options["VideoAscending"] = self.video_asc.isChecked()
+        options["AudioAscending"] = self.audio_asc.isChecked()
+        options["BandwithAscending"] = self.bandwidth_asc.isChecked()
+        
+        # 兼容性选项
+        options["OnlyHevc"] = self.only_hevc.isChecked()
+        options["OnlyAvc"] = self.only_avc.isChecked()
+        options["OnlyAv1"] = self.only_av1.isChecked()
+        
+        # 清理空值
+        options = {k: v for k, v in options.items() if v or isinstance(v, bool)}
+        
+        return options
+
+# 下载结果校验
+MEDIA_EXTENSIONS = (".mp4", ".mkv", ".flv", ".m4a", ".mp3", ".flac", ".aac")
+
+def normalize_title(text):
+    """只保留文字和数字，用于比较BBDown处理过非法字符的文件名"""
+    return "".join(char for char in text.lower() if char.isalnum())
+
+def locate_output_files(work_dir, title, started, finished, slack=120):
+    """在工作目录中查找任务的输出文件：修改时间在任务运行期间内的媒体文件，优先匹配标题
+
+    只查看工作目录顶层和名称包含标题的子目录（BBDown多P视频默认放在以标题命名的目录中），
+    不遍历整个工作目录
+    """
+    key = normalize_title(title or "")
+    candidates = []
+    
+    def collect(directory, recurse):
+        try:
+            entries = list(os.scandir(directory))
+        except OSError:
+            return
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if recurse or (key and key in normalize_title(entry.name)):
+                        collect(entry.path, True)
+                    continue
+                if not entry.name.lower().endswith(MEDIA_EXTENSIONS):
+                    continue
+                mtime = entry.stat().st_mtime
+            except OSError:
+                continue
+            if started - slack <= mtime <= finished + slack:
+                candidates.append(entry.path)
+    
+    collect(work_dir, False)
+    titled = [path for path in candidates if key and key in normalize_title(os.path.relpath(path, work_dir))]
+    if titled:
+        return titled
+    # 没有匹配标题时，只有唯一候选文件才认为属于该任务
+    return candidates if len(candidates) == 1 else []
+
+def probe_container(path, size):
+    """检查文件容器结构，返回 (格式, 问题描述或None)"""
+    with open(path, 'rb') as f:
+        head = f.read(12)
+        if head[4:8] == b'ftyp':
+            # 遍历MP4顶层box，检查是否被截断以及是否包含moov/mdat
+            found = set()
+            offset = 0
+            while offset + 8 <= size:
+                f.seek(offset)
+                header = f.read(16)
+                box_size = int.from_bytes(header[:4], 'big')
+                box_type = header[4:8].decode('latin-1')
+                if box_size == 1:
+                    box_size = int.from_bytes(header[8:16], 'big')
+                elif box_size == 0:
+                    box_size = size - offset
+                if box_size < 8:
+                    return "mp4", f"{box_type} box大小无效（偏移 {offset}）"
+                if offset + box_size > size:
+                    return "mp4", f"{box_type} box不完整，文件被截断"
+                found.add(box_type)
+                offset += box_size
+            if "moov" not in found:
+                return "mp4", "缺少moov box，混流未完成"
+            if "mdat" not in found and "moof" not in found:
+                return "mp4", "缺少媒体数据"
+            return "mp4", None
+    if head[:4] == b'\x1a\x45\xdf\xa3':
+        return "mkv", None
+    if head[:3] == b'FLV':
+        return "flv", None
+    if head[:4] == b'fLaC':
+        return "flac", None
+    if head[:3] == b'ID3' or (len(head) > 1 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0):
+        return ("aac" if path.lower().endswith(".aac") else "mp3"), None
+    return None, "无法识别的文件格式"
+
+def hash_file_mmap(path, chunk_size=8 * 1024 * 1024):
+    """通过内存映射计算SHA-256，避免逐块读入的额外拷贝"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return digest.hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            view = memoryview(mapped)
+            try:
+                for offset in range(0, len(view), chunk_size):
+                    digest.update(view[offset:offset + chunk_size])
+            finally:
+                view.release()
+    return digest.hexdigest()
+
+def verify_task_output(job):
+    """校验一个已完成任务的输出文件，返回写入历史的校验记录"""
+    record = {
+        "server": job["server"],
+        "Aid": job.get("Aid"),
+        "TaskFinishTime": job.get("TaskFinishTime"),
+        "Title": job.get("Title"),
+        "Url": job.get("Url"),
+        "files": [],
+        "problems": [],
+    }
+    files = locate_output_files(
+        job["work_dir"], job.get("Title"), job.get("TaskCreateTime") or 0, job.get("TaskFinishTime") or time.time()
+    )
+    downloaded = job.get("TotalDownloadedBytes") or 0
+    if not files:
+        record["status"] = "missing" if downloaded else "skipped"
+        if downloaded:
+            record["problems"].append(f"在 {job['work_dir']} 中找不到输出文件")
+        return record
+    
+    total_size = 0
+    for path in files:
+        size = os.path.getsize(path)
+        total_size += size
+        container, problem = probe_container(path, size)
+        record["files"].append({"path": path, "size": size, "container": container, "sha256": hash_file_mmap(path)})
+        if problem:
+            record["problems"].append(f"{os.path.basename(path)}: {problem}")
+    # 混流后的文件大小应接近下载的音视频流总量
+    if downloaded and total_size < downloaded * 0.9:
+        record["problems"].append(f"输出文件共 {total_size} 字节，小于已下载的 {downloaded} 字节")
+    record["status"] = "failed" if record["problems"] else "ok"
+    return record
+
+class OutputVerifier(QObject):
+    """在线程池中并行校验下载结果（哈希计算期间hashlib会释放GIL）"""
+    verified = pyqtSignal(dict)
+    
+    def __init__(self, parent=None, max_workers=None):
+        super().__init__(parent)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers or min(4, os.cpu_count() or 1))
+        self.pending = 0
+    
+    def submit(self, job):
+        self.pending += 1
+        self._executor.submit(self._run, job)
+    
+    def _run(self, job):
+        try:
+            record = verify_task_output(job)
+        except Exception as e:
+            record = {
+                "server": job["server"], "Aid": job.get("Aid"), "TaskFinishTime": job.get("TaskFinishTime"),
+                "Title": job.get("Title"), "Url": job.get("Url"), "files": [],
+                "problems": [f"校验出错: {str(e)}"], "status": "failed",
+            }
+        self.verified.emit(record)
+
+# 本地文件库索引
+DEFAULT_FILE_PATTERNS = ("<videoTitle>", "<videoTitle>/[P<pageNumberWithZero>]<pageTitle>")
+FILE_PATTERN_VARIABLE = re.compile(r"<(\w+)>")
+FILE_PATTERN_FIELDS = {
+    "bvid": ("bvid", r"BV1[1-9A-HJ-NP-Za-km-z]{9}"),
+    "aid": ("aid", r"\d+"),
+    "pageNumber": ("page", r"\d+"),
+    "pageNumberWithZero": ("page", r"\d+"),
+    "videoTitle": ("title", r"[^/]+?"),
+}
+
+def compile_file_pattern(pattern):
+    """把BBDown的文件命名模板转换为匹配相对路径（不含扩展名）的正则表达式"""
+    parts, used = [], set()
+    pattern = pattern.replace("\\", "/")
+    position = 0
+    for match in FILE_PATTERN_VARIABLE.finditer(pattern):
+        parts.append(re.escape(pattern[position:match.start()]))
+        group, expression = FILE_PATTERN_FIELDS.get(match.group(1), (None, r"[^/]*?"))
+        if group is None:
+            parts.append(expression)
+        elif group in used:
+            parts.append(f"(?P={group})")
+        else:
+            parts.append(f"(?P<{group}>{expression})")
+            used.add(group)
+        position = match.end()
+    parts.append(re.escape(pattern[position:]))
+    return re.compile(r"(?:^|/)" + "".join(parts) + "$")
+
+def extract_library_video_id(rel_path, patterns, titles):
+    """从下载文件的相对路径中提取 (视频ID, 分P)，依次尝试各命名模板，最后直接查找BV/av号"""
+    for regex in patterns:
+        match = regex.search(rel_path)
+        if not match:
+            continue
+        groups = match.groupdict()
+        page = int(groups["page"]) if groups.get("page") else None
+        if groups.get("bvid"):
+            key = normalize_video_id(groups["bvid"])[0]
+        elif groups.get("aid"):
+            key = f"av{int(groups['aid'])}"
+        else:
+            key = titles.get(normalize_title(groups.get("title") or ""))
+        if key:
+            return key, page
+    match = BV_PATTERN.search(rel_path) or AV_PATTERN.search(rel_path)
+    if match:
+        return normalize_video_id(match.group(0))[0], None
+    return None, None
+
+def collapse_nested_dirs(paths):
+    """去掉重复目录和位于其他目录之下的目录"""
+    result = []
+    for path in sorted({normalize_dir(path) for path in paths if path}):
+        if not any(path.startswith(parent.rstrip(os.sep) + os.sep) for parent in result):
+            result.append(path)
+    return result
+
+class LibraryIndex:
+    """本地下载目录索引：目录修改时间未变时沿用缓存的文件列表，扫描可中断并在下次继续"""
+    
+    def __init__(self, path=None):
+        self.path = path or os.path.join(get_gui_data_dir(), "library_index.json")
+        self.lock = threading.Lock()
+        self.loaded = False
+        self.extra_roots = []  # 用户添加的、不属于任何任务工作目录的根目录
+        self.roots = {}  # 根目录 -> {"generation", "pending", "scanned_at"}
+        self.dirs = {}  # 目录 -> {"mtime", "root", "generation", "files": {文件名: [大小, 修改时间]}, "subdirs"}
+    
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        with self.lock:
+            self.extra_roots = data.get("extra_roots", [])
+            self.roots = data.get("roots", {})
+            self.dirs = data.get("dirs", {})
+            self.loaded = True
+    
+    def save(self):
+        with self.lock:
+            write_json_atomic(self.path, {"extra_roots": self.extra_roots, "roots": self.roots, "dirs": self.dirs})
+    
+    def scan(self, root, should_stop=None, progress=None, checkpoint_interval=5):
+        """扫描一个根目录，返回是否扫描完成；中断时保存待扫描目录，下次从断点继续"""
+        root = normalize_dir(root)
+        with self.lock:
+            state = self.roots.setdefault(root, {"generation": 0, "pending": [], "scanned_at": None})
+            if not state["pending"]:
+                state["generation"] += 1
+                state["pending"] = [root]
+            generation = state["generation"]
+            pending = state["pending"]
+        last_checkpoint = time.time()
+        while pending:
+            if should_stop and should_stop():
+                self.save()
+                return False
+            directory = pending.pop()
+            try:
+                mtime = os.stat(directory).st_mtime_ns
+                cached = self.dirs.get(directory)
+                if not cached or cached["mtime"] != mtime:
+                    files, subdirs = {}, []
+                    with os.scandir(directory) as entries:
+                        for entry in entries:
+                            if entry.is_dir(follow_symlinks=False):
+                                subdirs.append(entry.name)
+                            elif os.path.splitext(entry.name)[1].lower() in MEDIA_EXTENSIONS:
+                                stat = entry.stat()
+                                files[entry.name] = [stat.st_size, stat.st_mtime]
+                    cached = {"mtime": mtime, "files": files, "subdirs": subdirs}
+                with self.lock:
+                    cached.update(root=root, generation=generation)
+                    self.dirs[directory] = cached
+                    pending.extend(os.path.join(directory, name) for name in cached["subdirs"])
+            except OSError as e:
+                library_log.debug("无法扫描目录 %s: %s", directory, e)
+            if progress:
+                progress(directory)
+            if time.time() - last_checkpoint > checkpoint_interval:
+                self.save()
+                last_checkpoint = time.time()
+        # 本轮没有访问到的目录已被删除
+        with self.lock:
+            for directory in [d for d, info in self.dirs.items() if info["root"] == root and info["generation"] != generation]:
+                del self.dirs[directory]
+            state["scanned_at"] = time.time()
+        self.save()
+        return True
+    
+    def forget_roots(self, keep):
+        """移除不再需要索引的根目录"""
+        keep = {normalize_dir(root) for root in keep}
+        with self.lock:
+            for root in [root for root in self.roots if root not in keep]:
+                del self.roots[root]
+            self.dirs = {d: info for d, info in self.dirs.items() if info["root"] in keep}
+    
+    def items(self, patterns, titles):
+        """返回可放入查重索引的 (视频ID, 分P集合, 文件路径) 列表"""
+        regexes = [compile_file_pattern(pattern) for pattern in patterns]
+        items = []
+        with self.lock:
+            directories = list(self.dirs.items())
+        for directory, info in directories:
+            rel_dir = os.path.relpath(directory, info["root"]).replace(os.sep, "/")
+            rel_dir = "" if rel_dir == "." else rel_dir + "/"
+            for name in info["files"]:
+                key, page = extract_library_video_id(rel_dir + os.path.splitext(name)[0], regexes, titles)
+                if key:
+                    items.append((key, frozenset([page]) if page else None, os.path.join(directory, name)))
+        return items
+    
+    def file_count(self):
+        with self.lock:
+            return sum(len(info["files"]) for info in self.dirs.values())
+    
+    def last_scanned(self):
+        with self.lock:
+            times = [state["scanned_at"] for state in self.roots.values() if state["scanned_at"]]
+        return max(times) if times else None
+
+class LibraryScanThread(QThread):
+    indexed = pyqtSignal(list)  # [(视频ID, 分P集合, 文件路径)]，读取缓存后和扫描完成后各发送一次
+    progress = pyqtSignal(int)  # 已扫描目录数
+    finished = pyqtSignal(bool)  # 是否全部扫描完成
+    
+    def __init__(self, index, roots, patterns, titles, extra_roots=None):
+        super().__init__()
+        self.index = index
+        self.roots = roots
+        self.extra_roots = extra_roots  # None表示沿用索引文件中保存的设置
+        self.patterns = patterns
+        self.titles = titles  # 标题 -> 视频ID，在线程中再规范化
+    
+    def run(self):
+        try:
+            self.titles = {normalize_title(title): key for title, key in self.titles.items()}
+            if not self.index.loaded:
+                self.index.load()
+                self.indexed.emit(self.index.items(self.patterns, self.titles))
+            if self.extra_roots is not None:
+                self.index.extra_roots = self.extra_roots
+            self.roots = collapse_nested_dirs(self.roots + self.index.extra_roots)
+            self.index.forget_roots(self.roots)
+            scanned = [0]
+            
+            def report(_):
+                scanned[0] += 1
+                if scanned[0] % 200 == 0:
+                    self.progress.emit(scanned[0])
+            
+            complete = True
+            for root in self.roots:
+                if not self.index.scan(root, self.isInterruptionRequested, report):
+                    complete = False
+                    break
+            self.indexed.emit(self.index.items(self.patterns, self.titles))
+            self.finished.emit(complete)
+        except Exception as e:
+            library_log.exception("索引本地文件失败: %s", e)
+            self.finished.emit(False)
+
+# 磁盘空间监控
+LOCAL_HOSTS = ('localhost', '127.0.0.1', '::1')
+
+def normalize_dir(path):
+    return os.path.normcase(os.path.abspath(os.path.expanduser(path)))
+
+def existing_parent(path):
+    """返回路径本身或最近的已存在上级目录（BBDown会自动创建工作目录）"""
+    path = normalize_dir(path)
+    while not os.path.exists(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            break
+        path = parent
+    return path
+
+class DiskSpaceMonitor:
+    """按磁盘采样可用空间，由运行中任务已下载字节数的增长推算占用，空间不足时暂停放行新任务"""
+    
+    RESUME_FACTOR = 1.2  # 恢复放行需要的余量高于暂停阈值，避免在阈值附近反复切换
+    
+    def __init__(self, reserve_bytes=2 * 1024 ** 3, horizon=1800):
+        self.reserve_bytes = reserve_bytes
+        self.horizon = horizon  # 推算未来多少秒内的占用
+        self.lock = threading.Lock()
+        self.disks = {}  # 设备号 -> 磁盘状态
+        self.dir_disk = {}  # 规范化的工作目录 -> 设备号
+        self._progress = {}  # 任务标识 -> (采样时间, 已下载字节数)
+    
+    def sample(self, work_dirs, running_tasks):
+        """采样工作目录所在磁盘，running_tasks 为 [(工作目录, 任务)]
+        
+        返回状态发生变化的磁盘 [(磁盘状态, 原状态)]
+        """
+        now = time.time()
+        disks, dir_disk = {}, {}
+        for work_dir in set(work_dirs):
+            try:
+                disk = self._measure(work_dir, disks)
+            except OSError as e:
+                disk_log.warning("无法读取磁盘空间 %s: %s", work_dir, e)
+                continue
+            disk["dirs"].append(work_dir)
+            dir_disk[normalize_dir(work_dir)] = disk["device"]
+        
+        progress = {}
+        for work_dir, task in running_tasks:
+            device = dir_disk.get(normalize_dir(work_dir))
+            if device is None:
+                continue
+            disk = disks[device]
+            key = (task.get("_Server"), task_key(task))
+            downloaded = task.get("TotalDownloadedBytes") or 0
+            progress[key] = (now, downloaded)
+            previous = self._progress.get(key)
+            if previous and now > previous[0]:
+                rate = max(downloaded - previous[1], 0) / (now - previous[0])
+            else:
+                rate = task.get("DownloadSpeed") or 0
+            # 剩余下载量按进度推算；混流时音视频临时文件与输出文件同时存在，再加一份成品大小
+            fraction = task.get("Progress") or 0
+            if 0.01 <= fraction < 1:
+                expected = downloaded / fraction
+                projected = expected - downloaded + expected
+            else:
+                projected = rate * self.horizon
+            disk["tasks"] += 1
+            disk["rate"] += rate
+            disk["projected"] += projected
+        
+        changes = []
+        with self.lock:
+            for device, disk in disks.items():
+                previous = self.disks.get(device, {}).get("status", "ok")
+                self._classify(disk, previous)
+                if disk["status"] != previous:
+                    changes.append((disk, previous))
+            self.disks = disks
+            self.dir_disk = dir_disk
+            self._progress = progress
+        return changes
+    
+    @staticmethod
+    def _measure(work_dir, disks):
+        """读取工作目录所在磁盘的空间，同一磁盘上的目录共用一条记录"""
+        path = existing_parent(work_dir)
+        device = os.stat(path).st_dev
+        if device not in disks:
+            usage = shutil.disk_usage(path)
+            disks[device] = {
+                "device": device, "path": path, "dirs": [], "total": usage.total, "free": usage.free,
+                "rate": 0.0, "projected": 0, "tasks": 0, "status": "ok",
+            }
+        return disks[device]
+    
+    def _classify(self, disk, previous):
+        headroom = disk["free"] - disk["projected"]
+        if headroom < self.reserve_bytes:
+            disk["status"] = "paused"
+        elif previous == "paused" and headroom < self.reserve_bytes * self.RESUME_FACTOR:
+            disk["status"] = "paused"
+        elif headroom < self.reserve_bytes * 2:
+            disk["status"] = "warning"
         else:
-            print("[DEBUG] 检测到localhost连接，跳过认证信息附加")
-        if self.host_input.text().strip():
-            options["Host"] = self.host_input.text().strip()
-        if self.ep_host_input.text().strip():
-            options["EpHost"] = self.ep_host_input.text().strip()
-        if self.upos_host.text().strip():
-            options["UposHost"] = self.upos_host.text().strip()
-        if self.aria2c_args.text().strip():
-            options["Aria2cArgs"] = self.aria2c_args.text().strip()
-        if self.aria2c_proxy.text().strip():
-            options["Aria2cProxy"] = self.aria2c_proxy.text().strip()
-        
-        # 高级设置
-        options["Debug"] = self.debug.isChecked()
-        options["ForceHttp"] = self.force_http.isChecked()
-        options["AllowPcdn"] = self.allow_pcdn.isChecked()
-        options["ForceReplaceHost"] = self.force_replace_host.isChecked()
-        options["SaveArchivesToFile"] = self.save_archives.isChecked()
-        options["VideoAscending"] = self.video_asc.isChecked()
-        options["AudioAscending"] = self.audio_asc.isChecked()
-        options["BandwithAscending"] = self.bandwidth_asc.isChecked()
-        
-        # 兼容性选项
-        options["OnlyHevc"] = self.only_hevc.isChecked()
-        options["OnlyAvc"] = self.only_avc.isChecked()
-        options["OnlyAv1"] = self.only_av1.isChecked()
-        
-        # 清理空值
-        options = {k: v for k, v in options.items() if v or isinstance(v, bool)}
-        
-        return options
+            disk["status"] = "ok"
+        disk["eta"] = (disk["free"] - self.reserve_bytes) / disk["rate"] if disk["rate"] > 0 else None
+    
+    def admits(self, work_dir):
+        """工作目录所在磁盘是否允许开始新任务，尚未采样的目录当场读取一次"""
+        if not work_dir:
+            return True
+        key = normalize_dir(work_dir)
+        with self.lock:
+            disk = self.disks.get(self.dir_disk.get(key))
+        if disk is None:
+            try:
+                disk = self._measure(work_dir, {})
+            except OSError:
+                return True
+            with self.lock:
+                disk = self.disks.setdefault(disk["device"], disk)
+                if "eta" not in disk:  # 新读取的磁盘尚未判定状态
+                    self._classify(disk, "ok")
+                disk["dirs"].append(work_dir)
+                self.dir_disk[key] = disk["device"]
+        return disk["status"] != "paused"
+    
+    def snapshot(self):
+        with self.lock:
+            return [dict(disk) for disk in self.disks.values()]
+
+class DiskSampleThread(QThread):
+    finished = pyqtSignal(list)  # 状态发生变化的磁盘
+    
+    def __init__(self, monitor, work_dirs, running_tasks):
+        super().__init__()
+        self.monitor = monitor
+        self.work_dirs = work_dirs
+        self.running_tasks = running_tasks
+    
+    def run(self):
+        self.finished.emit(self.monitor.sample(self.work_dirs, self.running_tasks))
+
+# 凭据文件监控
+CREDENTIAL_FILES = {"web": "BBDown.data", "tv": "BBDownTV.data"}
+
+class CredentialWatcher(QObject):
+    """监控BBDown凭据文件：文件系统事件触发、合并短时间内的连续写入，在后台线程读取文件内容"""
+    changed = pyqtSignal(str, str, float)  # 类型(web/tv), 内容, 文件修改时间
+    _loaded = pyqtSignal(str, str, object)
+    
+    def __init__(self, parent=None, debounce_ms=300):
+        super().__init__(parent)
+        self.directory = None
+        self.debounce_ms = debounce_ms
+        self._stats = {}  # kind -> (mtime, size)，内容未变化时不重复读取
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._watcher = QFileSystemWatcher(self)
+        self._watcher.directoryChanged.connect(lambda _: self._schedule_all())
+        self._watcher.fileChanged.connect(self._on_file_changed)
+        self._timers = {}
+        for kind in CREDENTIAL_FILES:
+            timer = QTimer(self)
+            timer.setSingleShot(True)
+            timer.timeout.connect(lambda kind=kind: self._read(kind))
+            self._timers[kind] = timer
+        self._loaded.connect(self._on_loaded)
+    
+    def path(self, kind):
+        return os.path.join(self.directory, CREDENTIAL_FILES[kind]) if self.directory else None
+    
+    def set_directory(self, directory):
+        """切换监控目录（BBDown所在目录），并立即读取一次已有凭据"""
+        if directory == self.directory:
+            return
+        paths = self._watcher.files() + self._watcher.directories()
+        if paths:
+            self._watcher.removePaths(paths)
+        self.directory = directory
+        self._stats.clear()
+        if directory and os.path.isdir(directory):
+            self._watcher.addPath(directory)
+            self._schedule_all(0)
+    
+    def refresh(self, kind):
+        """忽略缓存的文件状态重新读取"""
+        self._stats.pop(kind, None)
+        self._schedule(kind, 0)
+    
+    def _on_file_changed(self, path):
+        for kind in CREDENTIAL_FILES:
+            if path == self.path(kind):
+                self._schedule(kind)
+    
+    def _schedule_all(self, delay=None):
+        for kind in CREDENTIAL_FILES:
+            self._schedule(kind, delay)
+    
+    def _schedule(self, kind, delay=None):
+        # 连续写入时不断推迟，文件稳定后再读取
+        self._timers[kind].start(self.debounce_ms if delay is None else delay)
+    
+    def _read(self, kind):
+        path = self.path(kind)
+        if not path:
+            return
+        # 原子替换后文件会从监控中移除，需要重新添加
+        if os.path.exists(path) and path not in self._watcher.files():
+            self._watcher.addPath(path)
+        self._executor.submit(self._read_file, kind, path)
+    
+    def _read_file(self, kind, path):
+        try:
+            st = os.stat(path)
+            stat_key = (st.st_mtime, st.st_size)
+            if self._stats.get(kind) == stat_key:
+                return
+            with open(path, 'r', encoding='utf-8') as f:
+                content = f.read().strip()
+            # 读取期间文件仍在写入，等待下一次事件
+            st = os.stat(path)
+            if (st.st_mtime, st.st_size) != stat_key:
+                return
+            self._loaded.emit(kind, content, stat_key)
+        except OSError:
+            pass
+    
+    def _on_loaded(self, kind, content, stat_key):
+        if self._stats.get(kind) == stat_key:
+            return
+        self._stats[kind] = stat_key
+        if content:
+            self.changed.emit(kind, content, stat_key[0])
 
 class BBDownGUI(QMainWindow):
+    relay_changed = pyqtSignal()  # 中继推送了新的任务状态（来自后台线程）
+    
     def __init__(self):
         super().__init__()
         
@@ -996,6 +5320,38 @@ class BBDownGUI(QMainWindow):
         
         # 初始化API客户端
         self.api_client = BBDownAPIClient()
+        self.relay_changed.connect(self.start_refresh_tasks)
+        
+        # 任务历史与失败重试
+        self._background_threads = set()
+        # 历史文件只追加、可能很大，在后台线程读取，完成后再填充统计和查重索引
+        self.task_history = TaskHistoryStore(load=False)
+        self.history_thread = None
+        self.retrier = FailedTaskRetrier(self.task_history)
+        self.output_verifier = OutputVerifier(self)
+        self.output_verifier.verified.connect(self.handle_output_verified)
+        self.video_index = VideoIdIndex()
+        self.library_index = LibraryIndex()
+        self.library_thread = None
+        self._library_video_count = 0
+        
+        # 多服务器与分片任务
+        self.server_pool = ServerPool(self.api_client)
+        self.fanout = FanOutManager()
+        
+        # 本地服务池：多个本地serve实例自动注册到服务器列表，输出汇总到日志缓冲区
+        self.server_log = ServerLogBuffer()
+        self._server_log_seq = 0
+        self.local_pool = LocalServerPool(self.server_log)
+        self.disk_monitor = DiskSpaceMonitor()
+        self.scheduler = DownloadScheduler()
+        
+        # 凭据文件监控，登录或外部刷新凭据后自动填入
+        self.credential_watcher = CredentialWatcher(self)
+        self.credential_watcher.changed.connect(self.apply_credential)
+        self._login_started = {}  # kind -> 登录开始时间
+        self._pool_server_keys = set()
+        self._recent_placements = {}
         
         # 创建主控件
         self.main_widget = QWidget()
@@ -1009,22 +5365,79 @@ class BBDownGUI(QMainWindow):
         # 创建选项卡
         self.tabs = QTabWidget()
         self.main_layout.addWidget(self.tabs)
+        self._lazy_tabs = {}
+        self._credentials = {}
         
-        # 创建各个选项卡
+        # 创建各个选项卡，选项较多的选项卡在首次显示时才构建
         self.create_dashboard_tab()
-        self.create_add_task_tab()
+        self.add_task_page = self.add_lazy_tab("添加任务", self.create_add_task_tab)
         self.create_manage_tab()
-        self.create_auth_tab()
+        self.create_local_pool_tab()
+        self.create_server_log_tab()
+        self.statistics_page = self.add_lazy_tab("统计", self.create_statistics_tab)
+        self.add_lazy_tab("定时下载", self.create_schedule_tab)
+        self.add_lazy_tab("账号凭据管理", self.create_auth_tab)
+        self.tabs.currentChanged.connect(self.ensure_tab_built)
         
         # 设置定时刷新
         self.refresh_timer = QTimer()
         self.refresh_timer.timeout.connect(self.start_refresh_tasks)
         self.refresh_timer.start(10000)  # 每10秒刷新一次
         
+        # 离线队列：服务器恢复后按顺序提交，配置了下载时段时只在时段内提交
+        self.outbox = SubmissionOutbox()
+        self.outbox_flush_thread = None
+        self.outbox_timer = QTimer()
+        self.outbox_timer.timeout.connect(self.process_outbox)
+        self.outbox_timer.start(2000)
+        # 上次退出时正在重新提交的失败任务，交给离线队列先确认服务器是否已接收
+        for info in self.retrier.interrupted:
+            self.outbox.enqueue(info["server"], info["payload"], source="retry", submitted_at=info.get("submitted_at"))
+            self.retrier.on_resubmitted(info, "unknown")
+        self.retrier.interrupted = []
+        self.retrier.save()
+        
+        # 磁盘空间监控：空间不足时暂停重试、分片和离线队列的放行
+        self.disk_sample_thread = None
+        self.disk_timer = QTimer()
+        self.disk_timer.timeout.connect(self.start_disk_sample)
+        self.disk_timer.start(15000)
+        
+        # 检查到期的失败重试
+        self.retry_timer = QTimer()
+        self.retry_timer.timeout.connect(self.process_due_retries)
+        self.retry_timer.start(5000)
+        
         # 初始化数据
         self.last_tasks = {"Running": [], "Finished": []}
         
+        # 先显示上次保存的任务快照，首次查询返回后原地更新
+        self.snapshot_store = TaskSnapshotStore()
+        self._snapshot_dirty = False
+        self._showing_snapshot = False  # 表格中是否为快照数据（窗口隐藏时标签的isVisible()也为False，不能用来判断）
+        self.restore_snapshot()
+        
+        # 继续跟踪上次未完成的分片任务，其服务器参与任务轮询
+        for server in self.fanout.server_keys():
+            host, _, port = server.rpartition(":")
+            if port.isdigit():
+                self.server_pool.add(host, int(port))
+        if self.fanout.jobs:
+            self.update_fanout_table()
+        self.snapshot_timer = QTimer()
+        self.snapshot_timer.timeout.connect(self.save_snapshot)
+        self.snapshot_timer.start(60000)
+        
+        # 定期增量扫描本地下载目录，已下载的视频在添加任务时提示重复
+        self.library_timer = QTimer()
+        self.library_timer.timeout.connect(self.start_library_scan)
+        self.library_timer.start(600000)
+        
         self.start_refresh_tasks()
+        self.start_disk_sample()
+        self.history_thread = HistoryLoadThread(self.task_history.path)
+        self.history_thread.finished.connect(self.handle_history_loaded)
+        self.history_thread.start()
     
     def create_connection_controls(self):
         connection_group = QGroupBox("连接设置")
@@ -1032,6 +5445,8 @@ class BBDownGUI(QMainWindow):
         
         self.host_input = QLineEdit("localhost")
         self.port_input = QLineEdit("58682")
+        self.relay_check = QCheckBox("中继")
+        self.relay_check.setToolTip("连接到 --relay 模式运行的任务中继，由中继推送任务变化，不再直接轮询BBDown")
         self.connect_btn = QPushButton("连接")
         self.connect_btn.setIcon(QIcon.fromTheme("network-connect"))
         self.connect_btn.clicked.connect(self.update_connection)
@@ -1040,6 +5455,7 @@ class BBDownGUI(QMainWindow):
         layout.addWidget(self.host_input)
         layout.addWidget(QLabel("端口:"))
         layout.addWidget(self.port_input)
+        layout.addWidget(self.relay_check)
         layout.addWidget(self.connect_btn)
         
         # 添加分隔线
@@ -1063,17 +5479,32 @@ class BBDownGUI(QMainWindow):
         self.stop_bbdown_btn.clicked.connect(self.stop_bbdown_server)
         self.stop_bbdown_btn.setEnabled(False)  # 初始禁用
         
+        self.rollback_bbdown_btn = QPushButton("回滚版本")
+        self.rollback_bbdown_btn.setIcon(QIcon.fromTheme("edit-undo"))
+        self.rollback_bbdown_btn.clicked.connect(self.rollback_bbdown)
+        self.rollback_bbdown_btn.setEnabled(False)  # 初始禁用
+        
         self.delete_bbdown_btn = QPushButton("删除BBDown文件")
         self.delete_bbdown_btn.setIcon(QIcon.fromTheme("edit-delete"))
         self.delete_bbdown_btn.clicked.connect(self.delete_bbdown_files)
         self.delete_bbdown_btn.setEnabled(False)  # 初始禁用
         
         layout.addWidget(self.download_bbdown_btn)
+        layout.addWidget(self.rollback_bbdown_btn)
         layout.addWidget(self.start_bbdown_btn)
         layout.addWidget(self.stop_bbdown_btn)
         layout.addWidget(self.delete_bbdown_btn)
+        
+        # 服务端进程状态
+        self.server_status_label = QLabel("")
+        self.server_status_label.setStyleSheet("color: #555;")
+        layout.addWidget(self.server_status_label)
         layout.addStretch()
         
+        self.server_status_timer = QTimer()
+        self.server_status_timer.timeout.connect(self.update_server_status)
+        self.server_status_timer.start(1000)
+        
         self.main_layout.addWidget(connection_group)
         
         # 检查是否已有BBDown
@@ -1095,10 +5526,20 @@ class BBDownGUI(QMainWindow):
             QMessageBox.warning(self, "输入错误", "端口必须是1-65535之间的整数")
             return
         
-        self.api_client = BBDownAPIClient(host, port)
+        self.set_api_client(host, port, self.relay_check.isChecked())
         QMessageBox.information(self, "成功", "连接设置已更新")
         self.start_refresh_tasks()
     
+    def set_api_client(self, host, port, relay=False):
+        """切换主服务器连接，中继模式下任务列表由推送更新"""
+        if isinstance(self.api_client, RelayAPIClient):
+            self.api_client.close()
+        if relay:
+            self.api_client = RelayAPIClient(host, port, on_change=self.relay_changed.emit)
+        else:
+            self.api_client = BBDownAPIClient(host, port)
+        self.server_pool.set_primary(self.api_client)
+    
     def create_dashboard_tab(self):
         dashboard_tab = QWidget()
         layout = QVBoxLayout(dashboard_tab)
@@ -1109,6 +5550,18 @@ class BBDownGUI(QMainWindow):
         self.refresh_btn.clicked.connect(self.start_refresh_tasks)
         layout.addWidget(self.refresh_btn)
         
+        # 快照提示，收到服务器数据后隐藏
+        self.snapshot_label = QLabel()
+        self.snapshot_label.setStyleSheet("color: #b8860b;")
+        self.snapshot_label.setVisible(False)
+        layout.addWidget(self.snapshot_label)
+        
+        # 服务器不可用和离线队列提示
+        self.outbox_label = QLabel()
+        self.outbox_label.setStyleSheet("color: #c0392b;")
+        self.outbox_label.setVisible(False)
+        layout.addWidget(self.outbox_label)
+        
         # 分割视图
         splitter = QSplitter(Qt.Vertical)
         
@@ -1124,42 +5577,112 @@ class BBDownGUI(QMainWindow):
         finished_group = QGroupBox("已完成任务")
         finished_layout = QVBoxLayout()
         finished_layout.addWidget(self.finished_table)
+        finished_btn_layout = QHBoxLayout()
+        self.remove_selected_btn = QPushButton("移除选中的任务")
+        self.remove_selected_btn.setIcon(QIcon.fromTheme("edit-delete"))
+        self.remove_selected_btn.setToolTip("按住Ctrl或Shift可选择多行")
+        self.remove_selected_btn.clicked.connect(self.remove_selected_finished)
+        finished_btn_layout.addStretch()
+        finished_btn_layout.addWidget(self.remove_selected_btn)
+        finished_layout.addLayout(finished_btn_layout)
         finished_group.setLayout(finished_layout)
         
+        # 分片任务表
+        self.fanout_table = QTableWidget()
+        self.fanout_table.setColumnCount(6)
+        self.fanout_table.setHorizontalHeaderLabels(["标题", "分片完成", "合并进度", "状态", "服务器", "操作"])
+        self.fanout_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        self.fanout_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.fanout_group = QGroupBox("分片任务")
+        fanout_layout = QVBoxLayout()
+        fanout_layout.addWidget(self.fanout_table)
+        self.fanout_group.setLayout(fanout_layout)
+        self.fanout_group.setVisible(False)
+        
         splitter.addWidget(running_group)
         splitter.addWidget(finished_group)
-        splitter.setSizes([400, 400])
+        splitter.addWidget(self.fanout_group)
+        splitter.setSizes([400, 400, 200])
         
         layout.addWidget(splitter)
         self.tabs.addTab(dashboard_tab, "任务仪表盘")
     
     def create_task_table(self):
         table = QTableWidget()
-        table.setColumnCount(9)
+        table.setColumnCount(10)
         table.setHorizontalHeaderLabels([
             "AID", "标题", "创建时间", "完成时间", "进度", 
-            "速度", "大小", "状态", "操作"
+            "速度", "大小", "状态", "操作", "服务器"
         ])
         table.horizontalHeader().setSectionResizeMode(1, QHeaderView.Stretch)
+        table.setColumnHidden(9, True)
         table.setSelectionBehavior(QTableWidget.SelectRows)
         table.setEditTriggers(QTableWidget.NoEditTriggers)
         return table
     
+    def add_lazy_tab(self, title, builder):
+        """添加占位选项卡，首次显示时调用builder构建内容"""
+        page = QWidget()
+        QVBoxLayout(page).setContentsMargins(0, 0, 0, 0)
+        self._lazy_tabs[page] = builder
+        self.tabs.addTab(page, title)
+        return page
+    
+    def ensure_tab_built(self, index):
+        """构建尚未创建的选项卡内容"""
+        page = self.tabs.widget(index)
+        builder = self._lazy_tabs.pop(page, None)
+        if builder:
+            page.layout().addWidget(builder())
+    
+    def ensure_options_form(self):
+        """获取任务选项表单，尚未创建时构建添加任务选项卡"""
+        if not hasattr(self, 'options_form'):
+            self.ensure_tab_built(self.tabs.indexOf(self.add_task_page))
+        return self.options_form
+    
     def create_add_task_tab(self):
         add_task_tab = QWidget()
         layout = QVBoxLayout(add_task_tab)
         
-        # 创建选项表单
+        # 创建选项表单，并填入已加载的凭据
         self.options_form = OptionsForm()
         layout.addWidget(self.options_form)
+        for kind, content in self._credentials.items():
+            self.fill_credential_options(kind, content)
+        
+        # 分P分片提交
+        self.fanout_options = QGroupBox("分P分片提交（按分页选择拆分为多个任务）")
+        self.fanout_options.setCheckable(True)
+        self.fanout_options.setChecked(False)
+        fanout_layout = QGridLayout(self.fanout_options)
+        fanout_layout.setColumnStretch(1, 1)
+        fanout_layout.addWidget(QLabel("每片分P数:"), 0, 0)
+        self.fanout_chunk_size = QLineEdit("10")
+        self.fanout_chunk_size.setValidator(QIntValidator(1, 10000, self))
+        fanout_layout.addWidget(self.fanout_chunk_size, 0, 1)
+        fanout_layout.addWidget(QLabel("分片服务器:"), 1, 0)
+        self.fanout_servers = QLineEdit()
+        self.fanout_servers.setPlaceholderText("host:port，多个用逗号分隔；留空则只使用当前服务器")
+        fanout_layout.addWidget(self.fanout_servers, 1, 1)
+        layout.addWidget(self.fanout_options)
         
         # 添加按钮
         self.add_btn = QPushButton("添加任务")
         self.add_btn.setIcon(QIcon.fromTheme("list-add"))
         self.add_btn.clicked.connect(self.add_new_task)
-        layout.addWidget(self.add_btn)
         
-        self.tabs.addTab(add_task_tab, "添加任务")
+        # 批量导入按钮
+        self.bulk_import_btn = QPushButton("批量导入...")
+        self.bulk_import_btn.setIcon(QIcon.fromTheme("document-open"))
+        self.bulk_import_btn.clicked.connect(self.bulk_import_tasks)
+        
+        button_layout = QHBoxLayout()
+        button_layout.addWidget(self.add_btn, 1)
+        button_layout.addWidget(self.bulk_import_btn)
+        layout.addLayout(button_layout)
+        
+        return add_task_tab
     
     def create_manage_tab(self):
         manage_tab = QWidget()
@@ -1192,10 +5715,857 @@ class BBDownGUI(QMainWindow):
         
         layout.addLayout(batch_layout)
         layout.addLayout(aid_layout)
+        layout.addWidget(self.create_rule_removal_group())
+        layout.addWidget(self.create_retry_group())
+        layout.addWidget(self.create_verification_group())
+        layout.addWidget(self.create_library_group())
+        layout.addWidget(self.create_export_group())
         layout.addStretch()
         
         self.tabs.addTab(manage_tab, "任务管理")
     
+    def create_statistics_tab(self):
+        """创建统计选项卡"""
+        stats_tab = QWidget()
+        layout = QVBoxLayout(stats_tab)
+        
+        window_layout = QHBoxLayout()
+        window_layout.addWidget(QLabel("统计范围:"))
+        self.stats_window_combo = QComboBox()
+        self.stats_window_combo.addItems([name for name, _ in TaskStatistics.WINDOWS])
+        self.stats_window_combo.setCurrentIndex(1)
+        self.stats_window_combo.currentIndexChanged.connect(self.update_statistics_view)
+        window_layout.addWidget(self.stats_window_combo)
+        window_layout.addStretch()
+        layout.addLayout(window_layout)
+        
+        summary_group = QGroupBox("汇总")
+        summary_layout = QGridLayout(summary_group)
+        self.stats_labels = {}
+        fields = [
+            ("count", "已结束任务"), ("success_ratio", "成功率"), ("bytes", "下载量"),
+            ("tasks_per_hour", "任务/小时"), ("gb_per_hour", "GB/小时"), ("median_duration", "耗时中位数"),
+            ("running", "运行中任务"), ("speed", "当前总速度"),
+        ]
+        for index, (key, name) in enumerate(fields):
+            value_label = QLabel("-")
+            value_label.setFont(QFont("Arial", 14, QFont.Bold))
+            summary_layout.addWidget(QLabel(name), index // 4 * 2, index % 4)
+            summary_layout.addWidget(value_label, index // 4 * 2 + 1, index % 4)
+            self.stats_labels[key] = value_label
+        layout.addWidget(summary_group)
+        
+        self.stats_server_table = QTableWidget()
+        self.stats_server_table.setColumnCount(9)
+        self.stats_server_table.setHorizontalHeaderLabels(
+            ["服务器", "已结束", "成功率", "下载量", "任务/小时", "GB/小时", "耗时中位数", "运行中", "当前速度"]
+        )
+        self.stats_server_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        self.stats_server_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.stats_server_table.verticalHeader().setVisible(False)
+        layout.addWidget(self.stats_server_table)
+        
+        self.update_statistics_view()
+        return stats_tab
+    
+    def create_schedule_tab(self):
+        """创建定时下载选项卡"""
+        schedule_tab = QWidget()
+        layout = QVBoxLayout(schedule_tab)
+        
+        info = QLabel(
+            "只在以下时段内放行排队任务（离线队列、失败重试、分片），时段外保留在队列中，时段开始后自动提交。"
+            "服务器填 * 表示所有服务器；星期如 1-5,7（1为周一），留空表示每天；结束早于开始表示跨越午夜；"
+            "并发上限限制时段内该服务器同时运行的任务数，留空不限制。没有配置时段的服务器不受限制。"
+        )
+        info.setWordWrap(True)
+        layout.addWidget(info)
+        
+        self.schedule_table = QTableWidget()
+        self.schedule_table.setColumnCount(5)
+        self.schedule_table.setHorizontalHeaderLabels(["服务器", "星期", "开始", "结束", "并发上限"])
+        self.schedule_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        self.schedule_table.verticalHeader().setVisible(False)
+        for window in self.scheduler.windows:
+            self.add_schedule_row(window)
+        layout.addWidget(self.schedule_table)
+        
+        self.schedule_pause_new_check = QCheckBox("时段外新添加的任务（添加任务、批量导入）也加入队列，等待时段开始")
+        self.schedule_pause_new_check.setChecked(self.scheduler.pause_new)
+        layout.addWidget(self.schedule_pause_new_check)
+        
+        btn_layout = QHBoxLayout()
+        add_btn = QPushButton("添加时段")
+        add_btn.setIcon(QIcon.fromTheme("list-add"))
+        add_btn.clicked.connect(lambda: self.add_schedule_row())
+        remove_btn = QPushButton("删除选中时段")
+        remove_btn.setIcon(QIcon.fromTheme("list-remove"))
+        remove_btn.clicked.connect(self.remove_schedule_rows)
+        save_btn = QPushButton("保存")
+        save_btn.setIcon(QIcon.fromTheme("document-save"))
+        save_btn.clicked.connect(self.apply_schedule)
+        btn_layout.addWidget(add_btn)
+        btn_layout.addWidget(remove_btn)
+        btn_layout.addStretch()
+        btn_layout.addWidget(save_btn)
+        layout.addLayout(btn_layout)
+        
+        self.schedule_status_label = QLabel()
+        self.schedule_status_label.setWordWrap(True)
+        layout.addWidget(self.schedule_status_label)
+        self.update_schedule_status()
+        return schedule_tab
+    
+    def add_schedule_row(self, window=None):
+        """在时段表中添加一行，默认为每天 22:00-07:00"""
+        window = window or {"server": "*", "days": list(range(1, 8)), "start": "22:00", "end": "07:00", "max_running": None}
+        row = self.schedule_table.rowCount()
+        self.schedule_table.insertRow(row)
+        values = [
+            window.get("server", "*"), format_weekdays(window.get("days") or range(1, 8)),
+            window["start"], window["end"], str(window.get("max_running") or ""),
+        ]
+        for column, value in enumerate(values):
+            self.schedule_table.setItem(row, column, QTableWidgetItem(value))
+    
+    def remove_schedule_rows(self):
+        for row in sorted({index.row() for index in self.schedule_table.selectedIndexes()}, reverse=True):
+            self.schedule_table.removeRow(row)
+    
+    def apply_schedule(self):
+        """校验并保存时段表，新的时段立即生效"""
+        windows = []
+        try:
+            for row in range(self.schedule_table.rowCount()):
+                values = [(self.schedule_table.item(row, column) or QTableWidgetItem()).text().strip() for column in range(5)]
+                server, days, start, end, limit = values
+                if limit and not limit.isdigit():
+                    raise Exception(f"并发上限应为整数: {limit}")
+                windows.append({
+                    "server": server or "*",
+                    "days": parse_weekdays(days),
+                    "start": start,
+                    "end": end,
+                    "max_running": int(limit) if limit else None,
+                })
+            self.scheduler.configure(windows, self.schedule_pause_new_check.isChecked())
+        except Exception as e:
+            QMessageBox.warning(self, "定时下载", str(e))
+            return
+        schedule_log.info("定时下载时段已更新: %s 个时段", len(windows))
+        self.update_schedule_status()
+        self.process_outbox()
+        self.process_due_retries()
+        self.process_fanout_releases()
+    
+    def update_schedule_status(self):
+        """显示各服务器当前是否处于下载时段"""
+        if not hasattr(self, 'schedule_status_label'):
+            return
+        lines = []
+        for client in self.server_pool.clients():
+            server = client.server_key
+            window = self.scheduler.open_window(server)
+            if window == {}:
+                lines.append(f"{server}: 未配置时段，不受限制")
+            elif window is None:
+                lines.append(f"{server}: 时段外，下次开始于 {self.scheduler.describe_next_opening(server)}")
+            elif window.get("max_running"):
+                lines.append(f"{server}: 时段内，运行中 {self.scheduler.running.get(server, 0)}/{window['max_running']}")
+            else:
+                lines.append(f"{server}: 时段内")
+        self.schedule_status_label.setText("\n".join(lines))
+    
+    def update_statistics_view(self):
+        """统计选项卡可见时显示增量维护的统计结果"""
+        if self.tabs.currentWidget() is not self.statistics_page or not hasattr(self, 'stats_window_combo'):
+            return
+        statistics = self.task_history.statistics
+        summary = statistics.summary(self.stats_window_combo.currentIndex())
+        running = statistics.running
+        
+        def format_values(values, running_info):
+            duration = values["median_duration"]
+            return {
+                "count": str(values["count"]),
+                "success_ratio": "-" if values["success_ratio"] is None else f"{values['success_ratio'] * 100:.1f}%",
+                "bytes": self.format_bytes(values["bytes"]),
+                "tasks_per_hour": "-" if values["tasks_per_hour"] is None else f"{values['tasks_per_hour']:.1f}",
+                "gb_per_hour": "-" if values["gb_per_hour"] is None else f"{values['gb_per_hour']:.2f}",
+                "median_duration": "-" if duration is None else f"{int(duration // 60)}分{int(duration % 60)}秒",
+                "running": str(running_info["count"]),
+                "speed": f"{self.format_bytes(running_info['speed'])}/s",
+            }
+        
+        total_running = {
+            "count": sum(info["count"] for info in running.values()),
+            "speed": sum(info["speed"] for info in running.values()),
+        }
+        for key, text in format_values(summary["totals"], total_running).items():
+            self.stats_labels[key].setText(text)
+        
+        columns = ["count", "success_ratio", "bytes", "tasks_per_hour", "gb_per_hour", "median_duration", "running", "speed"]
+        servers = sorted(summary["servers"].items(), key=lambda item: str(item[0]))
+        self.stats_server_table.setRowCount(len(servers))
+        for row, (server, values) in enumerate(servers):
+            texts = format_values(values, running.get(server, {"count": 0, "speed": 0}))
+            self.stats_server_table.setItem(row, 0, QTableWidgetItem(str(server)))
+            for column, key in enumerate(columns, start=1):
+                self.stats_server_table.setItem(row, column, QTableWidgetItem(texts[key]))
+    
+    def create_local_pool_tab(self):
+        """创建本地服务池选项卡"""
+        pool_tab = QWidget()
+        layout = QVBoxLayout(pool_tab)
+        
+        settings_group = QGroupBox("实例设置")
+        settings_layout = QGridLayout(settings_group)
+        settings_layout.setColumnStretch(1, 1)
+        
+        settings_layout.addWidget(QLabel("实例数量:"), 0, 0)
+        self.pool_count_input = QLineEdit("1")
+        self.pool_count_input.setValidator(QIntValidator(1, 64, self))
+        settings_layout.addWidget(self.pool_count_input, 0, 1)
+        settings_layout.addWidget(QLabel("端口从连接设置中的端口开始依次分配"), 1, 1)
+        
+        settings_layout.addWidget(QLabel("各实例工作目录:"), 2, 0, Qt.AlignTop)
+        self.pool_work_dirs_input = QTextEdit()
+        self.pool_work_dirs_input.setAcceptRichText(False)
+        self.pool_work_dirs_input.setPlaceholderText("每行一个目录，依次对应各实例（可分布在不同磁盘）；留空则使用任务中的工作目录")
+        self.pool_work_dirs_input.setMaximumHeight(100)
+        settings_layout.addWidget(self.pool_work_dirs_input, 2, 1)
+        
+        btn_layout = QHBoxLayout()
+        pool_start_btn = QPushButton("启动服务池")
+        pool_start_btn.setIcon(QIcon.fromTheme("media-playback-start"))
+        pool_start_btn.clicked.connect(self.start_bbdown_server)
+        self.pool_scale_btn = QPushButton("应用实例数")
+        self.pool_scale_btn.setIcon(QIcon.fromTheme("view-refresh"))
+        self.pool_scale_btn.clicked.connect(self.scale_local_pool)
+        pool_stop_btn = QPushButton("停止服务池")
+        pool_stop_btn.setIcon(QIcon.fromTheme("media-playback-stop"))
+        pool_stop_btn.clicked.connect(self.stop_bbdown_server)
+        btn_layout.addWidget(pool_start_btn)
+        btn_layout.addWidget(self.pool_scale_btn)
+        btn_layout.addWidget(pool_stop_btn)
+        btn_layout.addStretch()
+        settings_layout.addLayout(btn_layout, 3, 0, 1, 2)
+        
+        self.pool_table = QTableWidget()
+        self.pool_table.setColumnCount(7)
+        self.pool_table.setHorizontalHeaderLabels(["端口", "状态", "PID", "已运行", "重启次数", "运行中任务", "工作目录"])
+        self.pool_table.horizontalHeader().setSectionResizeMode(6, QHeaderView.Stretch)
+        self.pool_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.pool_table.verticalHeader().setVisible(False)
+        
+        layout.addWidget(settings_group)
+        layout.addWidget(self.pool_table)
+        
+        # 工作目录所在磁盘的空间监控
+        disk_group = QGroupBox("磁盘空间")
+        disk_layout = QVBoxLayout(disk_group)
+        reserve_layout = QHBoxLayout()
+        reserve_layout.addWidget(QLabel("剩余空间（扣除运行中任务预计占用）低于"))
+        self.disk_reserve_input = QLineEdit(str(self.disk_monitor.reserve_bytes // 1024 ** 3))
+        self.disk_reserve_input.setValidator(QIntValidator(0, 100000, self))
+        self.disk_reserve_input.setMaximumWidth(80)
+        self.disk_reserve_input.editingFinished.connect(self.apply_disk_reserve)
+        reserve_layout.addWidget(self.disk_reserve_input)
+        reserve_layout.addWidget(QLabel("GB 时暂停提交新任务（重试、分片、离线队列），空间释放后自动恢复"))
+        reserve_layout.addStretch()
+        disk_layout.addLayout(reserve_layout)
+        
+        self.disk_table = QTableWidget()
+        self.disk_table.setColumnCount(7)
+        self.disk_table.setHorizontalHeaderLabels(["磁盘", "可用/总空间", "运行中任务", "写入速度", "预计占用", "预计降至阈值", "状态"])
+        self.disk_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        self.disk_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.disk_table.verticalHeader().setVisible(False)
+        self.disk_table.setMaximumHeight(150)
+        disk_layout.addWidget(self.disk_table)
+        layout.addWidget(disk_group)
+        
+        self.tabs.addTab(pool_tab, "本地服务池")
+    
+    def create_server_log_tab(self):
+        """创建服务器日志选项卡"""
+        log_tab = QWidget()
+        layout = QVBoxLayout(log_tab)
+        
+        toolbar = QHBoxLayout()
+        self.log_search_input = QLineEdit()
+        self.log_search_input.setPlaceholderText("搜索日志")
+        self.log_search_input.returnPressed.connect(lambda: self.find_in_server_log(False))
+        find_prev_btn = QPushButton("上一个")
+        find_prev_btn.clicked.connect(lambda: self.find_in_server_log(True))
+        find_next_btn = QPushButton("下一个")
+        find_next_btn.clicked.connect(lambda: self.find_in_server_log(False))
+        self.log_to_file_check = QCheckBox("保存到文件（自动轮转）")
+        self.log_to_file_check.toggled.connect(self.toggle_server_log_file)
+        clear_btn = QPushButton("清空")
+        clear_btn.setIcon(QIcon.fromTheme("edit-clear"))
+        clear_btn.clicked.connect(self.clear_server_log)
+        # 本程序自身的日志写入 ~/.bbdown_gui/logs/bbdown_gui.log，级别可随时调整
+        self.app_log_level_combo = QComboBox()
+        self.app_log_level_combo.addItems(LOG_LEVELS)
+        self.app_log_level_combo.setCurrentText(logging.getLevelName(log.getEffectiveLevel()))
+        self.app_log_level_combo.setToolTip("程序日志级别（日志文件位于 ~/.bbdown_gui/logs/bbdown_gui.log）")
+        self.app_log_level_combo.currentTextChanged.connect(set_log_level)
+        self.record_traffic_check = QCheckBox("录制API流量")
+        self.record_traffic_check.setToolTip("把与BBDown服务器之间的请求和响应录制到文件，可用 --replay 离线回放")
+        self.record_traffic_check.setChecked(BBDownAPIClient.recorder is not None)
+        self.record_traffic_check.toggled.connect(self.toggle_traffic_recording)
+        toolbar.addWidget(self.log_search_input)
+        toolbar.addWidget(find_prev_btn)
+        toolbar.addWidget(find_next_btn)
+        toolbar.addStretch()
+        toolbar.addWidget(QLabel("程序日志级别:"))
+        toolbar.addWidget(self.app_log_level_combo)
+        toolbar.addWidget(self.record_traffic_check)
+        toolbar.addWidget(self.log_to_file_check)
+        toolbar.addWidget(clear_btn)
+        
+        # 只追加新行，超过上限的旧行由控件自动丢弃
+        self.server_log_view = QPlainTextEdit()
+        self.server_log_view.setReadOnly(True)
+        self.server_log_view.setMaximumBlockCount(self.server_log.entries.maxlen)
+        self.server_log_view.setLineWrapMode(QPlainTextEdit.NoWrap)
+        self.server_log_view.setFont(QFont("Consolas" if sys.platform == "win32" else "Monospace", 9))
+        
+        layout.addLayout(toolbar)
+        layout.addWidget(self.server_log_view)
+        
+        self.server_log_timer = QTimer()
+        self.server_log_timer.timeout.connect(self.append_server_log)
+        self.server_log_timer.start(300)
+        
+        self.tabs.addTab(log_tab, "服务器日志")
+    
+    def append_server_log(self):
+        """将缓冲区中的新日志追加到日志面板"""
+        entries = self.server_log.since(self._server_log_seq)
+        if not entries:
+            return
+        self._server_log_seq = entries[-1][0]
+        scrollbar = self.server_log_view.verticalScrollBar()
+        at_bottom = scrollbar.value() >= scrollbar.maximum() - 2
+        self.server_log_view.appendPlainText("\n".join(ServerLogBuffer.format_entry(entry) for entry in entries))
+        if at_bottom:
+            scrollbar.setValue(scrollbar.maximum())
+    
+    def find_in_server_log(self, backward):
+        """在日志面板中查找，到达末尾后从头开始"""
+        text = self.log_search_input.text()
+        if not text:
+            return
+        flags = QTextDocument.FindBackward if backward else QTextDocument.FindFlags()
+        if not self.server_log_view.find(text, flags):
+            cursor = self.server_log_view.textCursor()
+            cursor.movePosition(QTextCursor.End if backward else QTextCursor.Start)
+            self.server_log_view.setTextCursor(cursor)
+            self.server_log_view.find(text, flags)
+    
+    def toggle_server_log_file(self, enabled):
+        """开启或关闭服务器日志文件"""
+        path = os.path.join(get_gui_data_dir(), "logs", "bbdown_server.log") if enabled else None
+        try:
+            self.server_log.set_log_file(path)
+        except OSError as e:
+            QMessageBox.warning(self, "错误", f"无法打开日志文件: {str(e)}")
+            self.log_to_file_check.setChecked(False)
+    
+    def clear_server_log(self):
+        self.server_log.clear()
+        self.server_log_view.clear()
+    
+    def toggle_traffic_recording(self, enabled):
+        """开始或停止录制API流量"""
+        if not enabled:
+            recorder, BBDownAPIClient.recorder = BBDownAPIClient.recorder, None
+            if recorder:
+                recorder.close()
+                QMessageBox.information(self, "录制API流量", f"已录制 {recorder.count} 个请求到：\n{recorder.path}")
+            return
+        path, _ = QFileDialog.getSaveFileName(
+            self, "录制API流量", f"bbdown_traffic_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl.gz",
+            "gzip JSON Lines (*.jsonl.gz)"
+        )
+        if path:
+            try:
+                BBDownAPIClient.recorder = TrafficRecorder(path)
+                return
+            except OSError as e:
+                QMessageBox.warning(self, "错误", f"无法创建录制文件: {str(e)}")
+        self.record_traffic_check.blockSignals(True)
+        self.record_traffic_check.setChecked(False)
+        self.record_traffic_check.blockSignals(False)
+    
+    def read_local_pool_settings(self):
+        """读取服务池设置，返回 (基础端口, 实例数, 工作目录列表)，输入无效时返回None"""
+        try:
+            port = int(self.port_input.text().strip())
+            count = int(self.pool_count_input.text().strip() or 1)
+            if not (1 <= port <= 65535 - count + 1):
+                raise ValueError
+        except ValueError:
+            QMessageBox.warning(self, "输入错误", "端口必须是1-65535之间的整数")
+            return None
+        work_dirs = [line.strip() for line in self.pool_work_dirs_input.toPlainText().splitlines()]
+        return port, max(1, count), work_dirs
+    
+    def scale_local_pool(self):
+        """按新的实例数增减运行中的服务池实例"""
+        if not self.local_pool.is_running():
+            self.start_bbdown_server()
+            return
+        settings = self.read_local_pool_settings()
+        if not settings:
+            return
+        self.local_pool.configure(self.bbdown_path, *settings)
+        self.pool_scale_btn.setEnabled(False)
+        self.pool_scale_thread = BBDownManagerThread("start", self.bbdown_path, self.local_pool)
+        self.pool_scale_thread.finished.connect(self.handle_scale_finished)
+        self.pool_scale_thread.start()
+    
+    def handle_scale_finished(self, success, message):
+        """处理服务池实例数调整结果"""
+        self.pool_scale_btn.setEnabled(True)
+        self.update_server_status()
+        if not success:
+            QMessageBox.warning(self, "警告", message)
+        self.start_refresh_tasks()
+    
+    def local_pool_host(self):
+        """服务池实例的主机名，与本地主服务器保持一致以避免重复注册"""
+        return self.api_client.host if self.api_client.host in ('localhost', '127.0.0.1', '::1') else 'localhost'
+    
+    def sync_local_pool_servers(self):
+        """将服务池中的实例注册到服务器列表，已停止的实例移除"""
+        host = self.local_pool_host()
+        registered = set()
+        for port, supervisor in self.local_pool.instances.items():
+            if supervisor.state in ("stopped", "failed"):
+                continue
+            client = self.server_pool.add(host, port)
+            if client is not self.api_client:
+                registered.add(client.server_key)
+        for key in self._pool_server_keys - registered:
+            self.server_pool.remove(key)
+        self._pool_server_keys = registered
+    
+    def choose_task_server(self, pending=None):
+        """为新任务选择服务器：服务池有多个实例时选择运行中任务最少的实例
+
+        pending 为调用方本批次中已分配但尚未提交的任务数（按服务器）
+        返回 (客户端, 实例默认工作目录或None)
+        """
+        pending = pending or {}
+        candidates = [self.api_client] + [self.server_pool.get(key) for key in sorted(self._pool_server_keys)]
+        load = {}
+        for task in self.last_tasks.get("Running", []):
+            load[task.get("_Server")] = load.get(task.get("_Server"), 0) + 1
+        client = min(
+            candidates,
+            key=lambda c: (load.get(c.server_key, 0) + self._recent_placements.get(c.server_key, 0)
+                           + pending.get(c.server_key, 0))
+        )
+        work_dir = None
+        if client.port in self.local_pool.instances:
+            work_dir = self.local_pool.work_dir_for(client.port)
+        return client, work_dir
+    
+    def note_task_placed(self, server_key):
+        """记录已提交到服务器的任务，刷新前连续提交时计入负载，避免集中到同一实例"""
+        self._recent_placements[server_key] = self._recent_placements.get(server_key, 0) + 1
+    
+    def create_verification_group(self):
+        """创建下载结果校验组"""
+        verification_group = QGroupBox("下载结果校验（仅本机服务器）")
+        layout = QVBoxLayout(verification_group)
+        
+        top_layout = QHBoxLayout()
+        self.verify_outputs_check = QCheckBox("任务完成后检查输出文件的大小、容器结构并计算SHA-256")
+        self.verify_outputs_check.setChecked(True)
+        self.verification_status_label = QLabel()
+        top_layout.addWidget(self.verify_outputs_check)
+        top_layout.addStretch()
+        top_layout.addWidget(self.verification_status_label)
+        layout.addLayout(top_layout)
+        
+        self.verification_table = QTableWidget()
+        self.verification_table.setColumnCount(3)
+        self.verification_table.setHorizontalHeaderLabels(["标题", "结果", "问题"])
+        self.verification_table.horizontalHeader().setSectionResizeMode(2, QHeaderView.Stretch)
+        self.verification_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.verification_table.setMaximumHeight(150)
+        layout.addWidget(self.verification_table)
+        
+        self.requeue_outputs_btn = QPushButton("重新提交校验未通过的任务")
+        self.requeue_outputs_btn.setIcon(QIcon.fromTheme("view-refresh"))
+        self.requeue_outputs_btn.clicked.connect(self.requeue_failed_outputs)
+        layout.addWidget(self.requeue_outputs_btn)
+        
+        self.update_verification_table()
+        return verification_group
+    
+    def create_library_group(self):
+        """创建本地文件库组"""
+        library_group = QGroupBox("本地文件库")
+        layout = QVBoxLayout(library_group)
+        
+        info = QLabel("自动索引本机任务的工作目录，按文件命名模板识别已下载的视频，添加任务和批量导入时提示重复")
+        info.setWordWrap(True)
+        layout.addWidget(info)
+        
+        self.library_roots_input = QTextEdit()
+        self.library_roots_input.setAcceptRichText(False)
+        self.library_roots_input.setPlaceholderText("其他需要索引的目录，每行一个（如旧的下载目录、移动硬盘）")
+        self.library_roots_input.setMaximumHeight(60)
+        layout.addWidget(self.library_roots_input)
+        
+        bottom_layout = QHBoxLayout()
+        self.library_status_label = QLabel("正在读取索引...")
+        self.library_scan_btn = QPushButton("立即扫描")
+        self.library_scan_btn.setIcon(QIcon.fromTheme("view-refresh"))
+        self.library_scan_btn.clicked.connect(self.apply_library_roots)
+        bottom_layout.addWidget(self.library_status_label)
+        bottom_layout.addStretch()
+        bottom_layout.addWidget(self.library_scan_btn)
+        layout.addLayout(bottom_layout)
+        return library_group
+    
+    def create_export_group(self):
+        """创建任务历史导出组"""
+        export_group = QGroupBox("导出任务历史")
+        layout = QHBoxLayout(export_group)
+        
+        self.export_since_input = QLineEdit()
+        self.export_since_input.setPlaceholderText("开始日期 YYYY-MM-DD")
+        self.export_until_input = QLineEdit()
+        self.export_until_input.setPlaceholderText("结束日期 YYYY-MM-DD")
+        self.export_server_combo = QComboBox()
+        self.export_server_combo.setEditable(True)
+        self.export_server_combo.addItem("全部服务器")
+        self.export_server_combo.addItems(sorted({server for server, _ in self.task_history.submissions}))
+        self.export_status_combo = QComboBox()
+        self.export_status_combo.addItem("全部状态", None)
+        self.export_status_combo.addItem("成功", "success")
+        self.export_status_combo.addItem("失败", "failed")
+        self.export_btn = QPushButton("导出...")
+        self.export_btn.setIcon(QIcon.fromTheme("document-save-as"))
+        self.export_btn.clicked.connect(self.export_task_history)
+        
+        layout.addWidget(self.export_since_input)
+        layout.addWidget(self.export_until_input)
+        layout.addWidget(self.export_server_combo)
+        layout.addWidget(self.export_status_combo)
+        layout.addWidget(self.export_btn)
+        return export_group
+    
+    def export_task_history(self):
+        """在后台把任务历史导出为CSV/JSONL/Parquet文件"""
+        try:
+            filters = {
+                "since": parse_export_date(self.export_since_input.text()),
+                "until": parse_export_date(self.export_until_input.text(), end_of_day=True),
+                "status": self.export_status_combo.currentData(),
+            }
+        except Exception as e:
+            QMessageBox.warning(self, "导出任务历史", str(e))
+            return
+        server = self.export_server_combo.currentText().strip()
+        if server and server != "全部服务器":
+            filters["servers"] = {server}
+        
+        path, selected = QFileDialog.getSaveFileName(
+            self, "导出任务历史", f"bbdown_history_{datetime.now().strftime('%Y%m%d')}.csv",
+            "CSV (*.csv);;JSON Lines (*.jsonl);;Parquet (*.parquet)"
+        )
+        if not path:
+            return
+        fmt = os.path.splitext(path)[1].lstrip(".").lower()
+        if fmt not in EXPORT_FORMATS:
+            fmt = {"JSON": "jsonl", "Parquet": "parquet"}.get(selected.split(" ")[0], "csv")
+            path += "." + fmt
+        
+        self.export_btn.setEnabled(False)
+        self.export_thread = HistoryExportThread(self.task_history.path, path, fmt, filters)
+        self.export_thread.progress.connect(lambda count: self.export_btn.setText(f"已导出 {count} 条"))
+        self.export_thread.finished.connect(lambda count, error: self.handle_export_finished(count, error, path))
+        self.export_thread.start()
+    
+    def handle_export_finished(self, count, error, path):
+        self.export_btn.setEnabled(True)
+        self.export_btn.setText("导出...")
+        if error:
+            QMessageBox.warning(self, "导出任务历史", f"导出失败: {error}")
+        else:
+            QMessageBox.information(self, "导出任务历史", f"已导出 {count} 条记录到\n{path}")
+    
+    def create_rule_removal_group(self):
+        """创建按条件移除已完成任务组"""
+        rule_group = QGroupBox("按条件移除已完成任务")
+        layout = QHBoxLayout(rule_group)
+        
+        self.rule_older_input = QLineEdit()
+        self.rule_older_input.setValidator(QIntValidator(0, 36500, self))
+        self.rule_older_input.setPlaceholderText("完成超过N天")
+        self.rule_larger_input = QLineEdit()
+        self.rule_larger_input.setValidator(QIntValidator(0, 10000000, self))
+        self.rule_larger_input.setPlaceholderText("大小超过N MB")
+        self.rule_title_input = QLineEdit()
+        self.rule_title_input.setPlaceholderText("标题匹配（正则表达式）")
+        self.rule_status_combo = QComboBox()
+        self.rule_status_combo.addItem("全部状态", None)
+        self.rule_status_combo.addItem("成功", "success")
+        self.rule_status_combo.addItem("失败", "failed")
+        self.rule_select_btn = QPushButton("选中匹配的任务")
+        self.rule_select_btn.clicked.connect(self.select_finished_by_rules)
+        self.rule_remove_btn = QPushButton("移除匹配的任务")
+        self.rule_remove_btn.setIcon(QIcon.fromTheme("edit-delete"))
+        self.rule_remove_btn.clicked.connect(self.remove_finished_by_rules)
+        
+        layout.addWidget(self.rule_older_input)
+        layout.addWidget(self.rule_larger_input)
+        layout.addWidget(self.rule_title_input, 1)
+        layout.addWidget(self.rule_status_combo)
+        layout.addWidget(self.rule_select_btn)
+        layout.addWidget(self.rule_remove_btn)
+        return rule_group
+    
+    def match_finished_rules(self):
+        """返回符合条件的已完成任务，条件无效时提示并返回None"""
+        older = self.rule_older_input.text().strip()
+        larger = self.rule_larger_input.text().strip()
+        title = self.rule_title_input.text().strip()
+        status = self.rule_status_combo.currentData()
+        if not (older or larger or title or status):
+            QMessageBox.warning(self, "按条件移除", "请至少设置一个条件")
+            return None
+        try:
+            return select_tasks_by_rules(
+                self.last_tasks.get("Finished", []),
+                older_than_days=int(older) if older else None,
+                larger_than_bytes=int(larger) * 1024 * 1024 if larger else None,
+                title_pattern=title or None,
+                status=status,
+            )
+        except Exception as e:
+            QMessageBox.warning(self, "按条件移除", str(e))
+            return None
+    
+    def select_finished_by_rules(self):
+        """在已完成任务表中选中符合条件的任务，便于确认后移除"""
+        tasks = self.match_finished_rules()
+        if tasks is None:
+            return
+        selected = {id(task) for task in tasks}
+        last_column = self.finished_table.columnCount() - 1
+        self.finished_table.clearSelection()
+        for row, task in enumerate(self.last_tasks.get("Finished", [])):
+            if id(task) in selected:
+                self.finished_table.setRangeSelected(QTableWidgetSelectionRange(row, 0, row, last_column), True)
+        QMessageBox.information(self, "按条件移除", f"已在仪表盘的已完成任务表中选中 {len(tasks)} 个任务")
+    
+    def remove_finished_by_rules(self):
+        tasks = self.match_finished_rules()
+        if tasks is not None:
+            self.remove_finished_batch(tasks)
+    
+    def remove_selected_finished(self):
+        finished = self.last_tasks.get("Finished", [])
+        rows = sorted({index.row() for index in self.finished_table.selectionModel().selectedRows()})
+        self.remove_finished_batch([finished[row] for row in rows if row < len(finished)])
+    
+    def remove_finished_batch(self, tasks):
+        """并发数受限地批量移除已完成任务，全部结束后只更新一次表格"""
+        if not tasks:
+            QMessageBox.information(self, "移除任务", "没有选中或匹配的任务")
+            return
+        if getattr(self, 'bulk_remove_thread', None) and self.bulk_remove_thread.isRunning():
+            QMessageBox.information(self, "移除任务", "上一批任务仍在移除中")
+            return
+        titles = "\n".join(f"• {task.get('Title') or task.get('Aid')}" for task in tasks[:10])
+        more = f"\n……等共 {len(tasks)} 个任务" if len(tasks) > 10 else ""
+        reply = QMessageBox.question(
+            self, "移除任务", f"确认移除以下已完成任务吗？\n{titles}{more}",
+            QMessageBox.Yes | QMessageBox.No, QMessageBox.No
+        )
+        if reply != QMessageBox.Yes:
+            return
+        # 服务器已从列表中移除的任务不能发给主服务器（Aid只在各自服务器内唯一），直接算作失败
+        jobs, orphaned = [], []
+        for task in tasks:
+            client = self.server_pool.find(task.get("_Server", self.api_client.server_key))
+            if client:
+                jobs.append((client, task))
+            else:
+                orphaned.append(task)
+        if not jobs:
+            self.handle_bulk_remove_finished([], orphaned)
+            return
+        for button in (self.remove_selected_btn, self.rule_remove_btn):
+            button.setEnabled(False)
+        self.bulk_remove_thread = BulkRemoveThread(jobs)
+        self.bulk_remove_thread.progress.connect(
+            lambda done, total: self.remove_selected_btn.setText(f"移除中 {done}/{total}")
+        )
+        self.bulk_remove_thread.finished.connect(
+            lambda removed, failed: self.handle_bulk_remove_finished(removed, failed + orphaned)
+        )
+        self.bulk_remove_thread.start()
+    
+    def handle_bulk_remove_finished(self, removed, failed):
+        """从本地任务列表中去掉已移除的任务，重绘一次表格，再刷新一次"""
+        self.remove_selected_btn.setText("移除选中的任务")
+        for button in (self.remove_selected_btn, self.rule_remove_btn):
+            button.setEnabled(True)
+        # 移除期间任务列表可能已刷新，按任务标识而不是对象匹配
+        default_server = self.api_client.server_key
+        identity = lambda task: (task.get("_Server", default_server), task.get("Aid"), task.get("TaskCreateTime"))
+        removed_keys = {identity(task) for task in removed}
+        finished = [task for task in self.last_tasks.get("Finished", []) if identity(task) not in removed_keys]
+        self.last_tasks = dict(self.last_tasks, Finished=finished)
+        self._snapshot_dirty = True
+        self.update_task_table(self.finished_table, finished, True)
+        self.update_task_index(self.last_tasks.get("Running", []), finished)
+        if failed:
+            lines = "\n".join(
+                f"• {task.get('Title') or task.get('Aid')}"
+                + ("" if self.server_pool.find(task.get("_Server", default_server)) else f"（服务器 {task.get('_Server')} 已不在列表中）")
+                for task in failed[:10]
+            )
+            QMessageBox.warning(
+                self, "移除任务", f"已移除 {len(removed)} 个任务，{len(failed)} 个移除失败：\n{lines}"
+            )
+        else:
+            QMessageBox.information(self, "移除任务", f"已移除 {len(removed)} 个任务")
+        self.start_refresh_tasks()
+    
+    def create_retry_group(self):
+        """创建失败任务自动重试设置组"""
+        retry_group = QGroupBox("失败任务自动重试")
+        layout = QGridLayout(retry_group)
+        layout.setColumnStretch(1, 1)
+        
+        self.auto_retry_check = QCheckBox("自动重新提交失败任务（使用原始提交参数）")
+        self.auto_retry_check.setChecked(self.retrier.enabled)
+        self.auto_retry_check.toggled.connect(self.update_retry_settings)
+        layout.addWidget(self.auto_retry_check, 0, 0, 1, 3)
+        
+        layout.addWidget(QLabel("最大重试次数:"), 1, 0)
+        self.retry_budget_input = QLineEdit(str(self.retrier.max_attempts))
+        self.retry_budget_input.setValidator(QIntValidator(0, 100, self))
+        self.retry_budget_input.editingFinished.connect(self.update_retry_settings)
+        layout.addWidget(self.retry_budget_input, 1, 1)
+        
+        layout.addWidget(QLabel("初始退避(秒):"), 2, 0)
+        self.retry_delay_input = QLineEdit(str(self.retrier.base_delay))
+        self.retry_delay_input.setValidator(QIntValidator(1, 86400, self))
+        self.retry_delay_input.editingFinished.connect(self.update_retry_settings)
+        layout.addWidget(self.retry_delay_input, 2, 1)
+        
+        self.retry_now_btn = QPushButton("立即重试失败任务")
+        self.retry_now_btn.setIcon(QIcon.fromTheme("view-refresh"))
+        self.retry_now_btn.clicked.connect(self.retry_failed_now)
+        layout.addWidget(self.retry_now_btn, 1, 2, 2, 1)
+        
+        # 失败原因分组
+        self.failure_group_table = QTableWidget()
+        self.failure_group_table.setColumnCount(5)
+        self.failure_group_table.setHorizontalHeaderLabels(["失败原因", "总数", "等待重试", "已重试", "已放弃"])
+        self.failure_group_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        self.failure_group_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.failure_group_table.setMaximumHeight(160)
+        layout.addWidget(self.failure_group_table, 3, 0, 1, 3)
+        self.update_failure_groups()
+        
+        return retry_group
+    
+    def update_retry_settings(self):
+        """同步自动重试设置"""
+        self.retrier.enabled = self.auto_retry_check.isChecked()
+        if self.retry_budget_input.text().strip():
+            self.retrier.max_attempts = int(self.retry_budget_input.text())
+        if self.retry_delay_input.text().strip():
+            self.retrier.base_delay = int(self.retry_delay_input.text())
+        if self.retrier.enabled:
+            # 启用时为已登记但未安排的失败任务安排重试
+            for info in self.retrier.failures.values():
+                if info["state"] == "failed":
+                    self.retrier.schedule(info)
+        self.retrier.mark_dirty()
+        self.retrier.save()
+        self.update_failure_groups()
+    
+    def retry_failed_now(self):
+        """立即重试所有失败任务"""
+        count = self.retrier.schedule_all_now()
+        self.retrier.save()
+        self.update_failure_groups()
+        if count:
+            self.process_due_retries()
+            QMessageBox.information(self, "重试", f"已安排 {count} 个失败任务重新提交")
+        else:
+            QMessageBox.information(self, "重试", "没有可重试的失败任务（缺少原始参数或已达重试上限）")
+    
+    def update_failure_groups(self):
+        """刷新失败原因分组表"""
+        groups = self.retrier.failure_groups()
+        self.failure_group_table.setRowCount(len(groups))
+        for row, (reason, group) in enumerate(sorted(groups.items())):
+            self.failure_group_table.setItem(row, 0, QTableWidgetItem(reason))
+            self.failure_group_table.setItem(row, 1, QTableWidgetItem(str(group["total"])))
+            self.failure_group_table.setItem(row, 2, QTableWidgetItem(str(group["pending"])))
+            self.failure_group_table.setItem(row, 3, QTableWidgetItem(str(group["retried"])))
+            self.failure_group_table.setItem(row, 4, QTableWidgetItem(str(group["given_up"])))
+    
+    def process_due_retries(self):
+        """重新提交已到期的失败任务"""
+        # 只提交到任务原来的服务器；该服务器暂不在列表中（如服务池实例尚未启动）或熔断中时留到下次，
+        # 不消耗重试次数，也不占用下载时段的并发名额
+        def admit(info):
+            client = self.server_pool.find(info["server"])
+            return (client is not None and client.is_available()
+                    and self.admits_submission(info["server"], info["payload"]))
+        due = self.retrier.pop_due(admit=admit)
+        if due:
+            self.retrier.save()
+        for info in due:
+            payload = info["payload"]
+            client = self.server_pool.find(info["server"])
+            self.run_api_task(
+                client, "submit_task", payload,
+                callback=lambda result, info=info, client=client, submitted_at=time.time():
+                    self.handle_retry_result(result, info, client, submitted_at)
+            )
+    
+    def handle_retry_result(self, result, info, client, submitted_at=None):
+        """处理重试提交结果"""
+        if result == "unknown":
+            # 无法确认服务器是否已接收，交给离线队列确认后再决定是否重新提交
+            self.outbox.enqueue(client.server_key, info["payload"], source="retry", submitted_at=submitted_at)
+            self.update_outbox_status()
+        self.retrier.on_resubmitted(info, result)
+        self.retrier.save()
+        if result == "ok":
+            self.task_history.record_submission(client.server_key, info["payload"], attempt=info["attempt"], source="retry")
+            self.update_submitted_index()
+            # 移除旧的失败记录，避免已完成列表中重复出现
+            self.run_api_task(client, "remove_task", info["aid"])
+            self.start_refresh_tasks()
+        self.update_failure_groups()
+    
+    def run_api_task(self, client, task_type, *args, callback=None, **kwargs):
+        """启动后台API线程，并在线程结束前保持引用"""
+        thread = APITaskThread(client, task_type, *args, **kwargs)
+        self._background_threads.add(thread)
+        if callback:
+            thread.finished.connect(callback)
+        thread.finished.connect(lambda _, t=thread: (t.wait(), self._background_threads.discard(t)))
+        thread.start()
+        return thread
+    
     def create_auth_tab(self):
         auth_tab = QWidget()
         layout = QVBoxLayout(auth_tab)
@@ -1265,14 +6635,16 @@ class BBDownGUI(QMainWindow):
         
         layout.addStretch()
         
-        self.tabs.addTab(auth_tab, "账号凭据管理")
+        self.cookie_display.setPlainText(self._credentials.get("web", ""))
+        self.token_display.setPlainText(self._credentials.get("tv", ""))
+        return auth_tab
     
     def start_refresh_tasks(self):
         """使用线程启动任务刷新"""
         if hasattr(self, 'refresh_thread') and self.refresh_thread.isRunning():
             return
             
-        self.refresh_thread = APITaskThread(self.api_client, "get_tasks")
+        self.refresh_thread = APITaskThread(self.server_pool, "get_tasks")
         self.refresh_thread.finished.connect(self.handle_refresh_result)
         self.refresh_thread.start()
     
@@ -1280,18 +6652,297 @@ class BBDownGUI(QMainWindow):
         """处理刷新结果"""
         if tasks is None:
             return
+        self._recent_placements.clear()
+        running_counts = {}
+        for task in tasks.get("Running", []):
+            server = task.get("_Server", self.api_client.server_key)
+            running_counts[server] = running_counts.get(server, 0) + 1
+        self.scheduler.update_running(running_counts)
+        self.update_schedule_status()
+        if self._showing_snapshot:
+            # 表格中是快照数据，无论结果是否与上次相同都要重新渲染
+            self.clear_snapshot_state()
+            self.last_tasks = {}
             
         # 优化UI更新 - 只在数据变化时更新
         if tasks != self.last_tasks:
             self.last_tasks = tasks
+            self._snapshot_dirty = True
             running_tasks = tasks.get("Running", [])
             finished_tasks = tasks.get("Finished", [])
             
+            # 更新分片任务状态，分片的失败由分片管理单独处理
+            chunk_tasks = self.fanout.update_from_tasks(running_tasks, finished_tasks)
+            
+            # 记录新结束的任务（同时计入统计），失败任务交给重试器
+            self.record_finished_tasks(finished_tasks, skip=chunk_tasks)
+            self.update_task_index(running_tasks, finished_tasks)
+            self.task_history.statistics.update_running(running_tasks, self.api_client.server_key)
+            
+            # 多台服务器时显示服务器列
+            multi_server = len(self.server_pool.clients()) > 1
+            self.running_table.setColumnHidden(9, not multi_server)
+            self.finished_table.setColumnHidden(9, not multi_server)
+            
             # 更新运行中任务表
             self.update_task_table(self.running_table, running_tasks, False)
             
             # 更新已完成任务表
             self.update_task_table(self.finished_table, finished_tasks, True)
+            
+            if self.fanout.jobs:
+                self.update_fanout_table()
+                self.process_fanout_releases()
+        
+        # 窗口随时间滚动，即使任务列表没有变化也要更新
+        self.update_statistics_view()
+    
+    def record_finished_tasks(self, finished_tasks, skip=()):
+        """将新结束的任务写入历史，并登记失败任务"""
+        if not self.task_history.loaded:
+            # 历史尚未加载完，无法判断哪些任务已记录过，加载完成后再补记
+            return
+        has_new_failure = False
+        completed_count = len(self.task_history.completed)
+        for task in finished_tasks:
+            server = task.get("_Server", self.api_client.server_key)
+            if not self.task_history.record_finished(server, task):
+                continue
+            if task.get("IsSuccessful", False):
+                self.queue_output_verification(server, task)
+            if (server, task.get("Aid"), task.get("TaskCreateTime")) in skip:
+                continue
+            if not task.get("IsSuccessful", False):
+                if self.retrier.on_task_failed(server, task):
+                    has_new_failure = True
+        if has_new_failure:
+            self.retrier.save()
+            self.update_failure_groups()
+        # 新完成的任务并入历史索引
+        for url, aid, pages in self.task_history.completed[completed_count:]:
+            self.video_index.add("history", url, aid, pages)
+    
+    def queue_output_verification(self, server, task):
+        """本机服务器完成的任务交给校验线程池检查输出文件"""
+        if not self.verify_outputs_check.isChecked():
+            return
+        work_dir = self.local_work_dir(server, url=task.get("Url"))
+        if not work_dir or not os.path.isdir(work_dir):
+            return
+        job = {key: task.get(key) for key in ("Aid", "Title", "Url", "TaskCreateTime", "TaskFinishTime", "TotalDownloadedBytes")}
+        job.update(server=server, work_dir=work_dir)
+        self.output_verifier.submit(job)
+        self.update_verification_table()
+    
+    def local_work_dir(self, server, payload=None, url=None):
+        """推断本机服务器上任务的工作目录：提交参数、服务池实例目录、当前表单，远程服务器返回None"""
+        host, _, port = server.rpartition(":")
+        if host not in LOCAL_HOSTS:
+            return None
+        if payload is None and url:
+            submission = self.task_history.get_submission(server, url)
+            payload = submission["payload"] if submission else None
+        work_dir = payload.get("WorkDir") if payload else None
+        if not work_dir and port.isdigit():
+            work_dir = self.local_pool.work_dir_for(int(port))
+        if not work_dir and hasattr(self, 'options_form'):
+            work_dir = self.options_form.work_dir.text().strip()
+        return work_dir or None
+    
+    def handle_output_verified(self, record):
+        """保存校验结果"""
+        self.output_verifier.pending -= 1
+        if record["status"] != "skipped":
+            self.task_history.record_verification(record)
+        if record["status"] in ("failed", "missing"):
+            verify_log.warning("下载结果校验未通过: %s %s", record.get('Title'), record['problems'])
+        self.update_verification_table()
+    
+    def update_verification_table(self):
+        """刷新校验未通过的任务列表"""
+        failed = self.task_history.failed_verifications()
+        pending = self.output_verifier.pending
+        self.verification_status_label.setText(
+            f"校验中 {pending} 个任务" if pending else "没有正在校验的任务"
+        )
+        self.verification_table.setRowCount(len(failed))
+        for row, record in enumerate(failed):
+            self.verification_table.setItem(row, 0, QTableWidgetItem(record.get("Title") or record.get("Url") or ""))
+            self.verification_table.setItem(row, 1, QTableWidgetItem("缺少文件" if record["status"] == "missing" else "校验失败"))
+            self.verification_table.setItem(row, 2, QTableWidgetItem("; ".join(record.get("problems", []))))
+        self.requeue_outputs_btn.setEnabled(bool(failed))
+    
+    def requeue_failed_outputs(self):
+        """按原始提交参数重新提交校验未通过的任务"""
+        jobs = []
+        records = []
+        missing_servers = set()
+        for record in self.task_history.failed_verifications():
+            submission = self.task_history.get_submission(record["server"], record.get("Url"))
+            if not submission:
+                continue
+            # 只提交到任务原来的服务器，服务器已被移除的任务不改投到其他服务器
+            client = self.server_pool.find(record["server"])
+            if client is None:
+                missing_servers.add(record["server"])
+                continue
+            jobs.append((client, submission["payload"]))
+            records.append(record)
+        if missing_servers:
+            verify_log.warning("以下服务器已不在列表中，跳过其校验失败任务: %s", ", ".join(sorted(missing_servers)))
+        if not jobs:
+            QMessageBox.information(self, "重新提交", "这些任务的服务器已不在列表中：" + "、".join(sorted(missing_servers))
+                                    if missing_servers else "找不到这些任务的原始提交参数")
+            return
+        self.requeue_skipped = sorted(missing_servers)
+        self.requeue_outputs_btn.setEnabled(False)
+        self.requeue_thread = BulkAddThread(jobs)
+        self.requeue_thread.finished.connect(lambda results: self.handle_requeue_finished(results, records))
+        self.requeue_thread.start()
+    
+    def handle_requeue_finished(self, results, records):
+        """处理重新提交结果"""
+        submitted = 0
+        for (client, payload, result, submitted_at), record in zip(results, records):
+            if result == "ok":
+                self.task_history.record_submission(client.server_key, payload, source="verify")
+            elif result == "unavailable":
+                self.outbox.enqueue(client.server_key, payload, source="verify")
+            elif result == "unknown":
+                self.outbox.enqueue(client.server_key, payload, source="verify", submitted_at=submitted_at)
+            else:
+                continue
+            submitted += 1
+            self.task_history.record_verification(dict(record, status="requeued"))
+        self.update_submitted_index()
+        self.update_outbox_status()
+        self.update_verification_table()
+        message = f"已重新提交 {submitted}/{len(results)} 个任务"
+        if self.requeue_skipped:
+            message += "\n以下服务器已不在列表中，未重新提交其任务：" + "、".join(self.requeue_skipped)
+        QMessageBox.information(self, "重新提交", message)
+        self.start_refresh_tasks()
+    
+    def library_roots(self):
+        """本机服务器上任务的工作目录"""
+        roots = set(self.monitored_work_dirs())
+        for (server, _), record in list(self.task_history.submissions.items()):
+            roots.add(self.local_work_dir(server, payload=record.get("payload")))
+        return [root for root in roots if root and os.path.isdir(root)]
+    
+    def library_patterns(self):
+        """识别文件名使用的命名模板：BBDown默认模板、历史提交和当前表单中的模板"""
+        patterns = set(DEFAULT_FILE_PATTERNS) | self.task_history.file_patterns()
+        if hasattr(self, 'options_form'):
+            options = self.options_form.get_options()
+            patterns.update(options[name] for name in ("FilePattern", "MultiFilePattern") if options.get(name))
+        # 含BV/av号的模板更可靠，优先匹配
+        return sorted(patterns, key=lambda pattern: ("<bvid>" not in pattern and "<aid>" not in pattern, pattern))
+    
+    def start_library_scan(self, extra_roots=None):
+        """在后台增量扫描本地文件库"""
+        if self.library_thread and self.library_thread.isRunning():
+            return
+        self.library_thread = LibraryScanThread(
+            self.library_index, self.library_roots(), self.library_patterns(),
+            dict(self.task_history.titles), extra_roots
+        )
+        self.library_thread.indexed.connect(self.handle_library_indexed)
+        self.library_thread.progress.connect(
+            lambda count: self.library_status_label.setText(f"正在扫描，已检查 {count} 个目录...")
+        )
+        self.library_thread.finished.connect(self.handle_library_scan_finished)
+        self.library_scan_btn.setEnabled(False)
+        self.library_thread.start()
+    
+    def apply_library_roots(self):
+        """按输入的目录重新扫描"""
+        roots = [line.strip() for line in self.library_roots_input.toPlainText().splitlines() if line.strip()]
+        missing = [root for root in roots if not os.path.isdir(root)]
+        if missing:
+            QMessageBox.warning(self, "本地文件库", "以下目录不存在：\n" + "\n".join(missing))
+            return
+        self.start_library_scan(roots)
+    
+    def handle_library_indexed(self, items):
+        """把本地文件放入查重索引"""
+        self.video_index.replace_source("library", [(key, None, pages, path) for key, pages, path in items])
+        if not self.library_roots_input.toPlainText().strip() and self.library_index.extra_roots:
+            self.library_roots_input.setPlainText("\n".join(self.library_index.extra_roots))
+        self._library_video_count = len({key for key, _, _ in items})
+        self.update_library_status()
+    
+    def handle_library_scan_finished(self, complete):
+        self.library_scan_btn.setEnabled(True)
+        if not complete:
+            library_log.info("本地文件库扫描未完成，下次从断点继续")
+        self.update_library_status()
+    
+    def update_library_status(self):
+        scanned_at = self.library_index.last_scanned()
+        text = f"已索引 {self.library_index.file_count()} 个媒体文件，识别出 {self._library_video_count} 个视频"
+        if scanned_at:
+            text += f"，上次扫描 {datetime.fromtimestamp(scanned_at).strftime('%m-%d %H:%M')}"
+        self.library_status_label.setText(text)
+    
+    def handle_history_loaded(self, store):
+        """任务历史加载完成：填充统计和查重索引，补记加载期间结束的任务，再开始扫描本地文件库"""
+        self.task_history.adopt(store)
+        self.rebuild_history_index()
+        self.update_statistics_view()
+        if not self._showing_snapshot:
+            self.record_finished_tasks(self.last_tasks.get("Finished", []), skip=self.fanout.claimed)
+        self.start_library_scan()
+    
+    def rebuild_history_index(self):
+        """根据任务历史重建查重索引中的历史和已提交部分"""
+        self.video_index.replace_source("history", [
+            (url, aid, pages, url) for url, aid, pages in self.task_history.completed
+        ])
+        self.update_submitted_index()
+    
+    def update_submitted_index(self):
+        """已提交但尚未出现结果的任务"""
+        self.task_history.expire_open_submissions()
+        self.video_index.replace_source("submitted", [
+            (url, None, parse_page_selection(record["payload"].get("SelectPage")), url)
+            for url, record in self.task_history.open_submissions.items()
+        ])
+    
+    def update_task_index(self, running_tasks, finished_tasks):
+        """用最新的任务列表更新查重索引"""
+        self.video_index.replace_source("running", [
+            (task.get("Url"), task.get("Aid"), None, task.get("Title") or task.get("Url")) for task in running_tasks
+        ])
+        # 失败的任务允许重新提交，不计入重复
+        self.video_index.replace_source("finished", [
+            (task.get("Url"), task.get("Aid"), None, task.get("Title") or task.get("Url"))
+            for task in finished_tasks if task.get("IsSuccessful", False)
+        ])
+        self.update_submitted_index()
+    
+    def collect_queued_payloads(self):
+        """收集本地排队等待提交的任务请求体"""
+        payloads = [info["payload"] for info in self.retrier.pending.values() if info.get("payload")]
+        payloads.extend(self.fanout.queued_payloads())
+        with self.outbox.lock:
+            payloads.extend(entry["payload"] for entry in self.outbox.entries)
+        return payloads
+    
+    def refresh_duplicate_sources(self, check_archive=False):
+        """查重前更新排队任务和BBDown存档；批量导入时只需调用一次"""
+        self.video_index.replace_source("queued", [
+            (payload["Url"], None, parse_page_selection(payload.get("SelectPage")), payload["Url"])
+            for payload in self.collect_queued_payloads()
+        ])
+        if check_archive and getattr(self, 'bbdown_path', None):
+            archive_file = os.path.join(os.path.dirname(self.bbdown_path), BBDOWN_ARCHIVE_FILE)
+            self.video_index.load_archive_file(archive_file)
+    
+    def find_duplicate_tasks(self, url, select_page=None, check_archive=False):
+        """在运行中、已完成、历史、排队任务及BBDown存档中查找重复"""
+        self.refresh_duplicate_sources(check_archive)
+        return self.video_index.find_duplicates(url, select_page)
     
     def update_task_table(self, table, tasks, is_finished):
         """优化表格更新性能"""
@@ -1340,23 +6991,214 @@ class BBDownGUI(QMainWindow):
             table.setItem(row, 7, status_item)
             
             # 操作按钮
+            server = task.get("_Server")
             if is_finished:
                 btn = QPushButton("移除")
                 btn.setIcon(QIcon.fromTheme("edit-delete"))
-                btn.clicked.connect(lambda _, aid=task.get("Aid"): self.remove_task(aid))
+                btn.clicked.connect(lambda _, aid=task.get("Aid"), server=server: self.remove_task(aid, server))
             else:
                 btn = QPushButton("详情")
                 btn.setIcon(QIcon.fromTheme("dialog-information"))
-                btn.clicked.connect(lambda _, aid=task.get("Aid"): self.show_task_details(aid))
+                btn.clicked.connect(lambda _, aid=task.get("Aid"), server=server: self.show_task_details(aid, server))
             
             # 将按钮添加到表格
             table.setCellWidget(row, 8, btn)
+            table.setItem(row, 9, QTableWidgetItem(server or ""))
         
         # 启用UI更新
         table.blockSignals(False)
         table.setUpdatesEnabled(True)
         table.viewport().update()  # 强制重绘
     
+    def process_outbox(self):
+        """有服务器恢复时在后台提交离线队列"""
+        self.update_outbox_status()
+        if self.outbox_flush_thread and self.outbox_flush_thread.isRunning():
+            return
+        servers = self.outbox.servers()
+        clients = [self.server_pool.find(server) for server in servers]
+        if not any(client and client.is_available() for client in clients):
+            return
+        # 工作目录要读取表单等界面状态，在界面线程中先解析好，后台线程只使用这些值
+        work_dirs = {
+            self.outbox.dedup_key(entry["server"], entry["payload"]):
+                self.local_work_dir(entry["server"], payload=entry["payload"])
+            for entry in list(self.outbox.entries)
+        }
+        admit = lambda server, payload: self.admits_work_dir(
+            server, work_dirs.get(self.outbox.dedup_key(server, payload))
+        )
+        self.outbox_flush_thread = OutboxFlushThread(self.outbox, self.server_pool.find, admit)
+        self.outbox_flush_thread.finished.connect(self.handle_outbox_flushed)
+        self.outbox_flush_thread.start()
+    
+    def handle_outbox_flushed(self, sent, rejected):
+        """处理离线队列提交结果"""
+        for server, payload, source in sent:
+            self.note_task_placed(server)
+            self.task_history.record_submission(server, payload, source=source)
+        if sent:
+            self.update_submitted_index()
+            self.start_refresh_tasks()
+        self.update_outbox_status()
+        if rejected:
+            QMessageBox.warning(
+                self, "离线队列",
+                f"{len(rejected)} 个排队任务被服务器拒绝：\n" + "\n".join(payload["Url"] for _, payload, _ in rejected[:10])
+            )
+    
+    def update_outbox_status(self):
+        """显示服务器熔断状态和离线队列长度"""
+        parts = []
+        down = [client.server_key for client in self.server_pool.clients() if not client.is_available()]
+        if down:
+            parts.append(f"服务器 {', '.join(down)} 不可用，请求已暂停，正在后台探测恢复")
+        paused = [disk["path"] for disk in self.disk_monitor.snapshot() if disk["status"] == "paused"]
+        if paused:
+            parts.append(f"{', '.join(paused)} 剩余空间不足，已暂停放行新任务")
+        closed = sorted(server for server in self.outbox.servers() if not self.scheduler.is_open(server))
+        if closed:
+            parts.append(f"{', '.join(closed)} 不在下载时段内，排队任务将在时段开始后提交")
+        queued = len(self.outbox.entries)
+        if queued:
+            parts.append(f"离线队列中有 {queued} 个任务，服务器恢复、空间释放或进入下载时段后自动提交")
+        self.outbox_label.setText("；".join(parts))
+        self.outbox_label.setVisible(bool(parts))
+    
+    def admits_submission(self, server, payload, scheduled=True):
+        """目标工作目录所在磁盘空间是否足够开始新任务（远程服务器不检查），scheduled时还需处于下载时段内"""
+        return self.admits_work_dir(server, self.local_work_dir(server, payload=payload), scheduled)
+    
+    def admits_work_dir(self, server, work_dir, scheduled=True):
+        """同admits_submission，但使用已解析的工作目录，不读取界面状态，可在后台线程中调用"""
+        if not self.disk_monitor.admits(work_dir):
+            return False
+        return not scheduled or self.scheduler.admit(server)
+    
+    def monitored_work_dirs(self):
+        """收集需要监控的工作目录：服务池实例、当前表单和所有等待放行的任务"""
+        work_dirs = {self.local_pool.work_dir_for(port) for port in self.local_pool.ports()}
+        if hasattr(self, 'options_form'):
+            work_dirs.add(self.options_form.work_dir.text().strip())
+        pending = [(entry["server"], entry["payload"]) for entry in list(self.outbox.entries)]
+        pending += [(info["server"], info["payload"]) for info in self.retrier.pending.values()]
+        pending += [(chunk["server"], job.payload_for(chunk)) for job, chunk in self.fanout.releasable_chunks()]
+        for server, payload in pending:
+            work_dirs.add(self.local_work_dir(server, payload=payload))
+        return [work_dir for work_dir in work_dirs if work_dir]
+    
+    def start_disk_sample(self):
+        """在后台线程采样磁盘空间（网络磁盘可能很慢）"""
+        if self.disk_sample_thread and self.disk_sample_thread.isRunning():
+            return
+        running = []
+        for task in self.last_tasks.get("Running", []):
+            server = task.get("_Server", self.api_client.server_key)
+            work_dir = self.local_work_dir(server, url=task.get("Url"))
+            if work_dir:
+                running.append((work_dir, task))
+        work_dirs = self.monitored_work_dirs() + [work_dir for work_dir, _ in running]
+        self.disk_sample_thread = DiskSampleThread(self.disk_monitor, work_dirs, running)
+        self.disk_sample_thread.finished.connect(self.handle_disk_sampled)
+        self.disk_sample_thread.start()
+    
+    def handle_disk_sampled(self, changes):
+        """磁盘状态变化时提示，空间释放后立即放行等待的任务"""
+        resumed = False
+        for disk, previous in changes:
+            if disk["status"] == "paused":
+                disk_log.warning("磁盘空间不足，暂停放行新任务: %s 剩余 %s", disk['path'], self.format_bytes(disk['free']))
+            elif previous == "paused":
+                disk_log.info("磁盘空间已恢复: %s 剩余 %s", disk['path'], self.format_bytes(disk['free']))
+                resumed = True
+        self.update_disk_table()
+        self.update_outbox_status()
+        if resumed:
+            self.process_outbox()
+            self.process_due_retries()
+            self.process_fanout_releases()
+    
+    def apply_disk_reserve(self):
+        """修改暂停阈值后立即重新采样"""
+        text = self.disk_reserve_input.text().strip()
+        if text:
+            self.disk_monitor.reserve_bytes = int(text) * 1024 ** 3
+            self.start_disk_sample()
+    
+    def update_disk_table(self):
+        """刷新磁盘空间表"""
+        disks = self.disk_monitor.snapshot()
+        status_names = {"ok": "正常", "warning": "空间紧张", "paused": "已暂停放行"}
+        status_colors = {"ok": QColor(200, 255, 200), "warning": QColor(255, 235, 180), "paused": QColor(255, 200, 200)}
+        self.disk_table.setRowCount(len(disks))
+        for row, disk in enumerate(disks):
+            eta = disk["eta"]
+            if eta is None:
+                eta_text = "-"
+            elif eta <= 0:
+                eta_text = "已低于阈值"
+            else:
+                eta_text = f"{int(eta // 3600)}小时{int(eta % 3600 // 60)}分" if eta >= 3600 else f"{int(eta // 60)}分{int(eta % 60)}秒"
+            status_item = QTableWidgetItem(status_names[disk["status"]])
+            status_item.setBackground(status_colors[disk["status"]])
+            values = [
+                disk["path"],
+                f"{self.format_bytes(disk['free'])} / {self.format_bytes(disk['total'])}",
+                str(disk["tasks"]),
+                f"{self.format_bytes(int(disk['rate']))}/s",
+                self.format_bytes(int(disk["projected"])),
+                eta_text,
+            ]
+            for column, value in enumerate(values):
+                self.disk_table.setItem(row, column, QTableWidgetItem(value))
+            self.disk_table.setItem(row, 6, status_item)
+            self.disk_table.item(row, 0).setToolTip("\n".join(disk["dirs"]))
+    
+    def restore_snapshot(self):
+        """启动时显示上次的连接设置和任务列表，标记为过期数据"""
+        snapshot = self.snapshot_store.load()
+        if not snapshot:
+            return
+        host, port = snapshot.get("host"), snapshot.get("port")
+        if host and isinstance(port, int):
+            self.host_input.setText(host)
+            self.port_input.setText(str(port))
+            self.relay_check.setChecked(bool(snapshot.get("relay")))
+            self.set_api_client(host, port, self.relay_check.isChecked())
+        
+        tasks = snapshot["tasks"]
+        multi_server = len({task.get("_Server") for name in tasks for task in tasks[name]}) > 1
+        self.running_table.setColumnHidden(9, not multi_server)
+        self.finished_table.setColumnHidden(9, not multi_server)
+        self.update_task_table(self.running_table, tasks.get("Running", []), False)
+        self.update_task_table(self.finished_table, tasks.get("Finished", []), True)
+        for table in (self.running_table, self.finished_table):
+            table.setStyleSheet("QTableWidget { color: #888; }")
+        saved_at = datetime.fromtimestamp(snapshot.get("saved_at", 0)).strftime("%Y-%m-%d %H:%M:%S")
+        self.snapshot_label.setText(f"当前显示的是 {saved_at} 保存的任务快照，正在等待服务器返回最新数据...")
+        self.snapshot_label.setVisible(True)
+        self._showing_snapshot = True
+    
+    def clear_snapshot_state(self):
+        """收到服务器数据后取消过期标记"""
+        self._showing_snapshot = False
+        self.snapshot_label.setVisible(False)
+        for table in (self.running_table, self.finished_table):
+            table.setStyleSheet("")
+    
+    def save_snapshot(self, force=False):
+        """任务列表有变化时保存快照"""
+        if not self._snapshot_dirty and not force:
+            return
+        try:
+            self.snapshot_store.save(
+                self.api_client.host, self.api_client.port, self.last_tasks,
+                relay=isinstance(self.api_client, RelayAPIClient)
+            )
+            self._snapshot_dirty = False
+        except OSError as e:
+            task_log.warning("保存任务快照失败: %s", e)
+    
     def get_progress_color(self, progress):
         """根据进度返回不同的背景颜色"""
         if progress < 0.3:
@@ -1389,14 +7231,19 @@ class BBDownGUI(QMainWindow):
     def add_new_task(self):
         """添加新任务"""
         # 从表单获取选项
-        options = self.options_form.get_options()
+        options = self.ensure_options_form().get_options()
         
         if "Url" not in options or not options["Url"]:
             QMessageBox.warning(self, "输入错误", "URL不能为空")
             return
         
+        # 选择服务器，服务池实例可提供默认工作目录
+        client, default_work_dir = self.choose_task_server()
+        if default_work_dir and not options.get("WorkDir"):
+            options["WorkDir"] = default_work_dir
+        
         # 检查工作目录是否为空（必填项）
-        work_dir = self.options_form.work_dir.text().strip()
+        work_dir = options.get("WorkDir", "")
         if not work_dir:
             # 检查是否为非localhost连接
             current_host = self.host_input.text().strip().lower()
@@ -1409,22 +7256,311 @@ class BBDownGUI(QMainWindow):
                 QMessageBox.warning(self, "输入错误", "工作目录不能为空")
                 return
         
+        # 提交前查重，避免重复下载
+        duplicates = self.find_duplicate_tasks(
+            options["Url"], options.get("SelectPage"), options.get("SaveArchivesToFile", False)
+        )
+        if duplicates:
+            lines = "\n".join(f"• [{source}] {label}" for source, label in duplicates[:10])
+            reply = QMessageBox.question(
+                self, "重复任务",
+                f"该视频已存在于以下任务中：\n{lines}\n\n是否仍然添加？",
+                QMessageBox.Yes | QMessageBox.No,
+                QMessageBox.No
+            )
+            if reply != QMessageBox.Yes:
+                return
+        
+        # 分片提交
+        if self.fanout_options.isChecked():
+            self.add_fanout_job(options)
+            return
+        
+        # 服务器不可用时直接放入离线队列，不等待超时
+        payload = client.build_task_payload(options["Url"], options)
+        if not self.admits_submission(client.server_key, payload, scheduled=False):
+            reply = QMessageBox.question(
+                self, "磁盘空间不足",
+                f"工作目录 {payload.get('WorkDir')} 所在磁盘的剩余空间不足以开始新任务。\n\n"
+                "是否加入离线队列，等空间释放后自动提交？",
+                QMessageBox.Yes | QMessageBox.No,
+                QMessageBox.Yes
+            )
+            if reply == QMessageBox.Yes:
+                self.outbox.enqueue(client.server_key, payload)
+                self.update_outbox_status()
+            return
+        if self.scheduler.pause_new and not self.scheduler.admit(client.server_key):
+            self.outbox.enqueue(client.server_key, payload)
+            self.update_outbox_status()
+            QMessageBox.information(
+                self, "定时下载",
+                f"当前不在下载时段内或已达并发上限，任务已加入队列，"
+                f"将在时段内自动提交（下次开始于 {self.scheduler.describe_next_opening(client.server_key)}）"
+            )
+            return
+        if not client.is_available():
+            self.handle_add_task_result("unavailable", client, payload)
+            return
+        
         # 使用线程添加任务
-        self.add_task_thread = APITaskThread(self.api_client, "add_task", options["Url"], options)
-        self.add_task_thread.finished.connect(self.handle_add_task_result)
+        submitted_at = time.time()
+        self.add_task_thread = APITaskThread(client, "submit_task", payload)
+        self.add_task_thread.finished.connect(
+            lambda result: self.handle_add_task_result(result, client, payload, submitted_at)
+        )
         self.add_task_thread.start()
     
-    def handle_add_task_result(self, success):
+    def add_fanout_job(self, options):
+        """将多P视频按分页选择拆分为多个分片任务提交"""
+        if not parse_page_selection(options.get("SelectPage")):
+            QMessageBox.warning(
+                self, "输入错误",
+                f"分片提交需要在下载控制中填写明确的分页选择，如 1-120（最多 {MAX_SELECTED_PAGES} 页）"
+            )
+            return
+        try:
+            servers = parse_server_list(self.fanout_servers.text())
+        except ValueError as e:
+            QMessageBox.warning(self, "输入错误", str(e))
+            return
+        
+        # 注册分片服务器，使其参与任务轮询
+        server_keys = [self.server_pool.add(host, port).server_key for host, port in servers]
+        if not server_keys:
+            server_keys = [self.api_client.server_key]
+        
+        if not self.fanout_chunk_size.hasAcceptableInput():
+            QMessageBox.warning(self, "输入错误", "每个分片的分P数需要在 1 到 10000 之间")
+            return
+        chunk_size = int(self.fanout_chunk_size.text())
+        existing = self.last_tasks.get("Running", []) + self.last_tasks.get("Finished", [])
+        job = self.fanout.create_job(options["Url"], options, chunk_size, server_keys, existing)
+        
+        self.update_fanout_table()
+        self.process_fanout_releases()
+        QMessageBox.information(
+            self, "成功",
+            f"已拆分为 {len(job.chunks)} 个分片，分布在 {len(job.servers())} 台服务器上"
+        )
+    
+    def process_fanout_releases(self):
+        """提交可以开始的分片"""
+        releasing = False
+        for job, chunk in self.fanout.releasable_chunks():
+            payload = job.payload_for(chunk)
+            if not self.admits_submission(chunk["server"], payload):
+                continue
+            chunk["state"] = "submitting"
+            releasing = True
+            client = self.server_pool.get(chunk["server"])
+            self.run_api_task(
+                client, "submit_task", payload,
+                callback=lambda result, chunk=chunk, client=client, payload=payload, submitted_at=time.time():
+                    self.handle_fanout_submit_result(result, chunk, client, payload, submitted_at)
+            )
+        if releasing:
+            self.fanout.save()
+    
+    def handle_fanout_submit_result(self, result, chunk, client, payload, submitted_at=None):
+        """处理分片提交结果"""
+        if result == "unknown":
+            # 无法确认服务器是否已接收，交给离线队列确认；分片进度按任务列表匹配，视为已提交
+            self.outbox.enqueue(client.server_key, payload, source="fanout", submitted_at=submitted_at)
+            self.update_outbox_status()
+            chunk["state"] = "submitted"
+        elif result == "ok":
+            chunk["state"] = "submitted"
+            self.task_history.record_submission(client.server_key, payload, source="fanout")
+            self.update_submitted_index()
+            self.start_refresh_tasks()
+        else:
+            chunk["state"] = "failed"
+        self.fanout.save()
+        self.update_fanout_table()
+    
+    def update_fanout_table(self):
+        """刷新分片任务表"""
+        jobs = list(self.fanout.jobs.values())
+        self.fanout_group.setVisible(bool(jobs))
+        self.fanout_table.setRowCount(len(jobs))
+        for row, job in enumerate(jobs):
+            progress = job.progress()
+            self.fanout_table.setItem(row, 0, QTableWidgetItem(job.title))
+            self.fanout_table.setItem(row, 1, QTableWidgetItem(f"{job.count('done')}/{len(job.chunks)}"))
+            progress_item = QTableWidgetItem(f"{progress * 100:.2f}%")
+            progress_item.setBackground(self.get_progress_color(progress))
+            self.fanout_table.setItem(row, 2, progress_item)
+            self.fanout_table.setItem(row, 3, QTableWidgetItem(job.state_text()))
+            self.fanout_table.setItem(row, 4, QTableWidgetItem(", ".join(job.servers())))
+            
+            if job.count("failed"):
+                btn = QPushButton("重试失败分片")
+                btn.setIcon(QIcon.fromTheme("view-refresh"))
+                btn.clicked.connect(lambda _, job_id=job.job_id: self.retry_fanout_job(job_id))
+            else:
+                btn = QPushButton("移除")
+                btn.setIcon(QIcon.fromTheme("edit-delete"))
+                btn.clicked.connect(lambda _, job_id=job.job_id: self.remove_fanout_job(job_id))
+            self.fanout_table.setCellWidget(row, 5, btn)
+    
+    def retry_fanout_job(self, job_id):
+        """重新提交失败的分片"""
+        self.fanout.retry_failed(job_id)
+        self.process_fanout_releases()
+        self.update_fanout_table()
+    
+    def remove_fanout_job(self, job_id):
+        """从列表中移除分片任务（不影响服务器上的任务）"""
+        self.fanout.remove_job(job_id)
+        self.update_fanout_table()
+    
+    def bulk_import_tasks(self):
+        """从文本文件批量导入任务（每行一个URL或BV/av号），自动跳过重复项"""
+        path, _ = QFileDialog.getOpenFileName(self, "选择任务列表文件", "", "文本文件 (*.txt);;所有文件 (*)")
+        if not path:
+            return
+        
+        options = self.ensure_options_form().get_options()
+        options.pop("Url", None)
+        
+        try:
+            with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+                lines = [line.strip() for line in f]
+        except Exception as e:
+            QMessageBox.critical(self, "错误", f"读取文件失败: {str(e)}")
+            return
+        
+        payloads = []
+        seen_keys = set()
+        duplicate_count = 0
+        self.refresh_duplicate_sources(options.get("SaveArchivesToFile", False))
+        for line in lines:
+            if not line or line.startswith("#"):
+                continue
+            key, page = normalize_video_id(line)
+            if key:
+                if (key, page) in seen_keys or self.video_index.find_duplicates(line, options.get("SelectPage")):
+                    duplicate_count += 1
+                    continue
+                seen_keys.add((key, page))
+            payloads.append(line)
+        
+        if not payloads:
+            QMessageBox.information(self, "批量导入", f"没有需要导入的新任务（跳过重复 {duplicate_count} 个）")
+            return
+        
+        reply = QMessageBox.question(
+            self, "批量导入",
+            f"将提交 {len(payloads)} 个任务，跳过重复 {duplicate_count} 个。\n\n确认导入吗？",
+            QMessageBox.Yes | QMessageBox.No,
+            QMessageBox.Yes
+        )
+        if reply != QMessageBox.Yes:
+            return
+        
+        # 逐个分配服务器，任务均匀分布到服务池各实例
+        # 与添加单个任务一样，在选定服务器后检查工作目录：未填写且所选服务器没有默认工作目录的任务不提交
+        jobs = []
+        pending = {}
+        no_work_dir = []
+        for url in payloads:
+            client, default_work_dir = self.choose_task_server(pending)
+            task_options = dict(options)
+            if default_work_dir and not task_options.get("WorkDir"):
+                task_options["WorkDir"] = default_work_dir
+            if not task_options.get("WorkDir"):
+                no_work_dir.append(url)
+                continue
+            pending[client.server_key] = pending.get(client.server_key, 0) + 1
+            jobs.append((client, client.build_task_payload(url, task_options)))
+        if not jobs:
+            QMessageBox.warning(self, "输入错误", "工作目录不能为空")
+            return
+        
+        # 目标磁盘空间不足（或设置了时段外暂停新任务时不在时段内）的任务直接进入离线队列，之后再提交
+        held, ready = [], []
+        for client, payload in jobs:
+            if self.admits_submission(client.server_key, payload, scheduled=self.scheduler.pause_new):
+                ready.append((client, payload))
+            else:
+                held.append((client, payload))
+                self.outbox.enqueue(client.server_key, payload, source="import")
+        jobs = ready
+        
+        self.bulk_import_btn.setEnabled(False)
+        self.bulk_add_thread = BulkAddThread(jobs)
+        self.bulk_add_thread.progress.connect(
+            lambda done, total: self.bulk_import_btn.setText(f"导入中 {done}/{total}")
+        )
+        self.bulk_add_thread.finished.connect(
+            lambda results: self.handle_bulk_import_finished(results, len(held), no_work_dir)
+        )
+        self.bulk_add_thread.start()
+    
+    def handle_bulk_import_finished(self, results, held=0, no_work_dir=()):
+        """处理批量导入结果"""
+        self.bulk_import_btn.setEnabled(True)
+        self.bulk_import_btn.setText("批量导入...")
+        failed = []
+        queued = 0
+        for client, payload, result, submitted_at in results:
+            if result in ("ok", "unknown"):
+                self.note_task_placed(client.server_key)
+            if result == "ok":
+                self.task_history.record_submission(client.server_key, payload, source="import")
+            elif result == "unavailable":
+                self.outbox.enqueue(client.server_key, payload, source="import")
+                queued += 1
+            elif result == "unknown":
+                self.outbox.enqueue(client.server_key, payload, source="import", submitted_at=submitted_at)
+                queued += 1
+            else:
+                failed.append(payload["Url"])
+        self.update_submitted_index()
+        self.update_outbox_status()
+        message = f"成功提交 {len(results) - len(failed) - queued} 个任务"
+        if queued:
+            message += f"，{queued} 个因服务器不可用或无法确认是否已接收加入离线队列"
+        if held:
+            message += f"，{held} 个因磁盘空间不足或不在下载时段内加入离线队列"
+        if no_work_dir:
+            message += f"，{len(no_work_dir)} 个因未填写工作目录且所选服务器没有默认工作目录未提交"
+        if failed:
+            message += f"，失败 {len(failed)} 个：\n" + "\n".join(failed[:10])
+        QMessageBox.information(self, "批量导入", message)
+        self.start_refresh_tasks()
+    
+    def handle_add_task_result(self, result, client, payload, submitted_at=None):
         """处理添加任务结果"""
-        if success:
+        if result in ("ok", "unknown"):
+            self.note_task_placed(client.server_key)
+        if result == "ok":
+            # 保存原始提交参数，供失败重试使用
+            self.task_history.record_submission(client.server_key, payload)
+            self.update_submitted_index()
             QMessageBox.information(self, "成功", "任务已添加")
             self.start_refresh_tasks()
+        elif result == "unavailable":
+            if self.outbox.enqueue(client.server_key, payload):
+                QMessageBox.information(self, "服务器不可用", "任务已加入离线队列，服务器恢复后将自动提交")
+            else:
+                QMessageBox.information(self, "服务器不可用", "该任务已在离线队列中")
+            self.update_outbox_status()
+        elif result == "unknown":
+            # 服务器可能已经接收，离线队列会先确认任务列表再决定是否重新提交
+            self.outbox.enqueue(client.server_key, payload, submitted_at=submitted_at)
+            self.update_outbox_status()
+            QMessageBox.information(
+                self, "未收到响应",
+                "服务器没有响应，暂时无法确认任务是否已添加。\n任务已加入离线队列，服务器恢复后会先确认，未添加时再自动提交"
+            )
         else:
             QMessageBox.warning(self, "错误", "添加任务失败，请检查URL和参数")
     
     def remove_all_finished(self):
         # 使用线程移除任务
-        self.remove_thread = APITaskThread(self.api_client, "remove_finished_tasks")
+        self.remove_thread = APITaskThread(self.server_pool, "remove_finished_tasks")
         self.remove_thread.finished.connect(self.handle_remove_finished)
         self.remove_thread.start()
     
@@ -1438,7 +7574,7 @@ class BBDownGUI(QMainWindow):
     
     def remove_failed_tasks(self):
         # 使用线程移除失败任务
-        self.remove_failed_thread = APITaskThread(self.api_client, "remove_failed_tasks")
+        self.remove_failed_thread = APITaskThread(self.server_pool, "remove_failed_tasks")
         self.remove_failed_thread.finished.connect(self.handle_remove_failed)
         self.remove_failed_thread.start()
     
@@ -1457,7 +7593,7 @@ class BBDownGUI(QMainWindow):
             return
         
         # 使用线程移除任务
-        self.remove_task_thread = APITaskThread(self.api_client, "remove_task", aid)
+        self.remove_task_thread = APITaskThread(self.server_pool, "remove_task", aid)
         self.remove_task_thread.finished.connect(self.handle_remove_task)
         self.remove_task_thread.start()
     
@@ -1470,9 +7606,13 @@ class BBDownGUI(QMainWindow):
         else:
             QMessageBox.critical(self, "错误", "移除任务失败")
     
-    def remove_task(self, aid):
+    def remove_task(self, aid, server=None):
+        client = self.server_pool.find(server) if server else self.api_client
+        if client is None:
+            QMessageBox.warning(self, "错误", f"服务器 {server} 已不在列表中，无法移除任务 {aid}")
+            return
         # 使用线程移除任务
-        self.remove_task_thread = APITaskThread(self.api_client, "remove_task", aid)
+        self.remove_task_thread = APITaskThread(client, "remove_task", aid)
         self.remove_task_thread.finished.connect(lambda success: self.handle_remove_task_by_aid(success, aid))
         self.remove_task_thread.start()
     
@@ -1484,9 +7624,13 @@ class BBDownGUI(QMainWindow):
         else:
             QMessageBox.critical(self, "错误", f"移除任务 {aid} 失败")
     
-    def show_task_details(self, aid):
+    def show_task_details(self, aid, server=None):
+        client = self.server_pool.find(server) if server else self.api_client
+        if client is None:
+            QMessageBox.warning(self, "错误", f"服务器 {server} 已不在列表中，无法获取任务 {aid} 的详情")
+            return
         # 使用线程获取任务详情
-        self.task_detail_thread = APITaskThread(self.api_client, "get_task", aid)
+        self.task_detail_thread = APITaskThread(client, "get_task", aid)
         self.task_detail_thread.finished.connect(lambda task: self.handle_task_details(task, aid))
         self.task_detail_thread.start()
     
@@ -1520,34 +7664,71 @@ class BBDownGUI(QMainWindow):
     
     def check_existing_bbdown(self):
         """检查是否已存在BBDown可执行文件"""
-        print("[DEBUG] 开始检查现有BBDown文件")
-        from PyQt5.QtWidgets import QApplication
-        
-        bbdown_dir = os.path.join(os.path.expanduser("~"), ".bbdown", "current")
-        if os.path.exists(bbdown_dir):
-            print(f"[DEBUG] BBDown目录存在: {bbdown_dir}")
-            for root, dirs, files in os.walk(bbdown_dir):
-                # 处理事件循环，避免界面冻结
-                QApplication.processEvents()
-                for file in files:
-                    if file.lower().startswith('bbdown') and (file.endswith('.exe') or '.' not in file):
-                        print(f"[DEBUG] 找到BBDown可执行文件: {file}")
-                        self.bbdown_path = os.path.join(root, file)
-                        self.start_bbdown_btn.setEnabled(True)
-                        self.delete_bbdown_btn.setEnabled(True)
-                        self.download_bbdown_btn.setText("重新下载BBDown")
-                        print("[DEBUG] BBDown状态更新完成 - 已存在")
-                        # 找到BBDown后加载认证数据
-                        self.load_existing_auth_data()
-                        return
-        
-        print("[DEBUG] 未找到BBDown可执行文件")
+        install_log.debug("开始检查现有BBDown文件")
+        
+        # 安装清单有效时只需一次stat；否则在后台完整查找，不阻塞界面
+        current = BBDownInstallManager().cached_current()
+        if current is None:
+            self.bbdown_path = None
+            self.download_bbdown_btn.setText("正在查找BBDown...")
+            self.download_bbdown_btn.setEnabled(False)
+            self.start_bbdown_btn.setEnabled(False)
+            self.delete_bbdown_btn.setEnabled(False)
+            self.discovery_thread = BBDownDiscoveryThread()
+            self.discovery_thread.finished.connect(self.apply_bbdown_install)
+            self.discovery_thread.start()
+            return
+        self.apply_bbdown_install(current)
+    
+    def apply_bbdown_install(self, current):
+        """根据当前安装更新BBDown相关按钮状态"""
+        self.download_bbdown_btn.setEnabled(True)
+        self.rollback_bbdown_btn.setEnabled(BBDownInstallManager().previous() is not None)
+        if current:
+            install_log.debug("找到BBDown可执行文件: %s", current['path'])
+            self.bbdown_path = current["path"]
+            self.start_bbdown_btn.setEnabled(True)
+            self.delete_bbdown_btn.setEnabled(True)
+            self.download_bbdown_btn.setText("更新BBDown" if current.get("version") else "重新下载BBDown")
+            self.download_bbdown_btn.setToolTip(f"当前版本: {current.get('version') or '未知'}")
+            install_log.debug("BBDown状态更新完成 - 已存在")
+            # 监控BBDown目录中的认证数据，已有凭据会立即加载
+            self.credential_watcher.set_directory(os.path.dirname(self.bbdown_path))
+            return
+        
+        install_log.debug("未找到BBDown可执行文件")
+        self.credential_watcher.set_directory(None)
         self.bbdown_path = None
         self.start_bbdown_btn.setEnabled(False)
         self.stop_bbdown_btn.setEnabled(False)
         self.delete_bbdown_btn.setEnabled(False)
         self.download_bbdown_btn.setText("下载BBDown")
-        print("[DEBUG] BBDown状态更新完成 - 不存在")
+        self.download_bbdown_btn.setToolTip("")
+        install_log.debug("BBDown状态更新完成 - 不存在")
+    
+    def rollback_bbdown(self):
+        """回滚到上一个BBDown版本"""
+        reply = QMessageBox.question(
+            self, "确认回滚",
+            "确定要回滚到上一个BBDown版本吗？正在运行的服务端需要重新启动后才会使用回滚后的版本。",
+            QMessageBox.Yes | QMessageBox.No,
+            QMessageBox.No
+        )
+        if reply != QMessageBox.Yes:
+            return
+        
+        self.rollback_bbdown_btn.setEnabled(False)
+        self.bbdown_rollback_thread = BBDownManagerThread("rollback")
+        self.bbdown_rollback_thread.finished.connect(self.handle_rollback_finished)
+        self.bbdown_rollback_thread.start()
+    
+    def handle_rollback_finished(self, success, message):
+        """处理回滚结果"""
+        if success:
+            QMessageBox.information(self, "成功", message)
+        else:
+            QMessageBox.critical(self, "错误", message)
+        self.check_existing_bbdown()
     
     def download_bbdown(self):
         """下载BBDown"""
@@ -1562,7 +7743,7 @@ class BBDownGUI(QMainWindow):
         self.progress_dialog.show()
         
         # 启动下载线程
-        self.bbdown_manager_thread = BBDownManagerThread("download")
+        self.bbdown_manager_thread = BBDownManagerThread("download", in_use=self.local_pool.executables_in_use())
         self.bbdown_manager_thread.progress.connect(self.update_download_progress)
         self.bbdown_manager_thread.finished.connect(self.handle_download_finished)
         self.bbdown_manager_thread.start()
@@ -1577,82 +7758,84 @@ class BBDownGUI(QMainWindow):
     
     def handle_download_finished(self, success, message):
         """处理下载完成"""
-        print(f"[DEBUG] 进入handle_download_finished，success={success}, message={message}")
+        install_log.debug("进入handle_download_finished，success=%s, message=%s", success, message)
         
         # 关闭进度对话框
         if hasattr(self, 'progress_dialog'):
-            print("[DEBUG] 检测到进度对话框存在，准备关闭")
+            install_log.debug("检测到进度对话框存在，准备关闭")
             try:
-                print("[DEBUG] 断开进度对话框的信号连接")
+                install_log.debug("断开进度对话框的信号连接")
                 # 先断开所有信号连接，防止关闭时触发其他事件
                 try:
                     self.progress_dialog.canceled.disconnect()
                 except:
                     pass
                 
-                print("[DEBUG] 设置进度对话框为非模态")
+                install_log.debug("设置进度对话框为非模态")
                 self.progress_dialog.setModal(False)
                 
-                print("[DEBUG] 隐藏进度对话框")
+                install_log.debug("隐藏进度对话框")
                 self.progress_dialog.hide()
                 
-                print("[DEBUG] 调用progress_dialog.close()")
+                install_log.debug("调用progress_dialog.close()")
                 self.progress_dialog.close()
-                print("[DEBUG] progress_dialog.close()执行完成")
+                install_log.debug("progress_dialog.close()执行完成")
                 
-                print("[DEBUG] 使用deleteLater()安全删除对话框")
+                install_log.debug("使用deleteLater()安全删除对话框")
                 self.progress_dialog.deleteLater()
                 
-                print("[DEBUG] 清空progress_dialog引用")
+                install_log.debug("清空progress_dialog引用")
                 self.progress_dialog = None
-                print("[DEBUG] progress_dialog处理完成")
+                install_log.debug("progress_dialog处理完成")
             except Exception as e:
-                print(f"[ERROR] 关闭进度对话框时发生错误: {str(e)}")
-                print(f"[ERROR] 错误类型: {type(e).__name__}")
+                install_log.error("关闭进度对话框时发生错误: %s", e)
+                install_log.error("错误类型: %s", type(e).__name__)
                 # 即使出错也要清空引用
                 self.progress_dialog = None
         else:
-            print("[DEBUG] 没有检测到progress_dialog属性")
+            install_log.debug("没有检测到progress_dialog属性")
         
         # 重新启用按钮
-        print("[DEBUG] 重新启用下载按钮")
+        install_log.debug("重新启用下载按钮")
         self.download_bbdown_btn.setEnabled(True)
         
         if success:
-            print("[DEBUG] 下载成功，准备异步显示成功消息框")
+            install_log.debug("下载成功，准备异步显示成功消息框")
             # 使用QTimer异步显示消息框和检查状态，避免阻塞主线程
             from PyQt5.QtCore import QTimer
             QTimer.singleShot(50, lambda: self.show_success_message_and_check(message))
-            print("[DEBUG] 成功处理已安排异步执行")
+            install_log.debug("成功处理已安排异步执行")
         else:
-            print("[DEBUG] 下载失败，准备异步显示错误消息框")
+            install_log.debug("下载失败，准备异步显示错误消息框")
             from PyQt5.QtCore import QTimer
             QTimer.singleShot(50, lambda: self.show_error_message(message))
-            print("[DEBUG] 错误处理已安排异步执行")
+            install_log.debug("错误处理已安排异步执行")
         
-        print("[DEBUG] handle_download_finished方法执行完成")
+        install_log.debug("handle_download_finished方法执行完成")
     
     def show_success_message_and_check(self, message):
         """异步显示成功消息并检查BBDown状态"""
-        print("[DEBUG] 显示成功消息框")
+        install_log.debug("显示成功消息框")
         QMessageBox.information(self, "成功", message)
-        print("[DEBUG] 成功消息框已关闭，准备检查BBDown状态")
+        install_log.debug("成功消息框已关闭，准备检查BBDown状态")
         # 再次异步执行状态检查
         from PyQt5.QtCore import QTimer
         QTimer.singleShot(100, self.check_existing_bbdown)
-        print("[DEBUG] BBDown状态检查已安排执行")
+        install_log.debug("BBDown状态检查已安排执行")
     
     def show_error_message(self, message):
         """异步显示错误消息"""
-        print("[DEBUG] 显示错误消息框")
+        install_log.debug("显示错误消息框")
         QMessageBox.critical(self, "错误", message)
-        print("[DEBUG] 错误消息框已关闭")
+        install_log.debug("错误消息框已关闭")
     
     def cancel_download(self):
-        """取消下载"""
+        """取消下载（保留已下载部分以便续传）"""
         if hasattr(self, 'bbdown_manager_thread') and self.bbdown_manager_thread.isRunning():
-            self.bbdown_manager_thread.terminate()
-            self.bbdown_manager_thread.wait()
+            self.bbdown_manager_thread.cancel_event.set()
+            if not self.bbdown_manager_thread.wait(5000):
+                self.bbdown_manager_thread.terminate()
+                self.bbdown_manager_thread.wait()
         
         self.download_bbdown_btn.setEnabled(True)
     
@@ -1662,6 +7845,16 @@ class BBDownGUI(QMainWindow):
             QMessageBox.warning(self, "错误", "请先下载BBDown")
             return
         
+        settings = self.read_local_pool_settings()
+        if not settings:
+            return
+        
+        # 服务端进程由本地服务池持有，实例数在“本地服务池”选项卡中调整
+        if self.local_pool.is_running():
+            QMessageBox.information(self, "提示", f"BBDown服务器已在运行（{self.local_pool.describe()}）")
+            return
+        self.local_pool.configure(self.bbdown_path, *settings)
+        
         # 禁用按钮防止重复点击
         self.start_bbdown_btn.setEnabled(False)
         
@@ -1673,7 +7866,7 @@ class BBDownGUI(QMainWindow):
         self.start_progress_dialog.show()
         
         # 启动服务器线程
-        self.bbdown_start_thread = BBDownManagerThread("start", self.bbdown_path)
+        self.bbdown_start_thread = BBDownManagerThread("start", self.bbdown_path, self.local_pool)
         self.bbdown_start_thread.progress.connect(self.update_start_progress)
         self.bbdown_start_thread.finished.connect(self.handle_start_finished)
         self.bbdown_start_thread.start()
@@ -1692,8 +7885,12 @@ class BBDownGUI(QMainWindow):
         
         # 重新启用按钮
         self.start_bbdown_btn.setEnabled(True)
+        self.update_server_status()
         
         if success:
+            # 新启动的服务端立即可用，无需等待熔断器的后台探测
+            for client in self.server_pool.clients():
+                client.breaker.record_success()
             QMessageBox.information(self, "成功", message)
             # 启动成功后启用停止按钮
             self.stop_bbdown_btn.setEnabled(True)
@@ -1714,46 +7911,66 @@ class BBDownGUI(QMainWindow):
         if reply != QMessageBox.Yes:
             return
         
-        try:
-            # 尝试通过API优雅关闭
-            try:
-                response = requests.post(f"{self.api_client.base_url}/shutdown", timeout=5)
-                if response.status_code == 200:
-                    QMessageBox.information(self, "成功", "BBDown服务器已停止")
-                    self.stop_bbdown_btn.setEnabled(False)
-                    return
-            except:
-                pass
-            
-            # 如果API关闭失败，尝试通过进程管理停止
-            system = platform.system().lower()
-            if system == "windows":
-                # Windows系统使用taskkill
-                subprocess.run(["taskkill", "/f", "/im", "BBDown.exe"], 
-                             capture_output=True, text=True)
-            else:
-                # Unix系统使用pkill
-                subprocess.run(["pkill", "-f", "BBDown"], 
-                             capture_output=True, text=True)
-            
-            # 等待一下确保进程已停止
-            import time
-            time.sleep(2)
-            
-            # 检查服务器是否已停止
-            try:
-                response = requests.get(f"{self.api_client.base_url}/get-tasks/", timeout=2)
-                if response.status_code == 200:
-                    QMessageBox.warning(self, "警告", "服务器可能仍在运行，请手动检查")
-                else:
-                    QMessageBox.information(self, "成功", "BBDown服务器已停止")
-                    self.stop_bbdown_btn.setEnabled(False)
-            except:
-                QMessageBox.information(self, "成功", "BBDown服务器已停止")
-                self.stop_bbdown_btn.setEnabled(False)
-                
-        except Exception as e:
-            QMessageBox.critical(self, "错误", f"停止服务器失败: {str(e)}")
+        # 在后台线程停止：由本程序启动的按PID停止，否则尝试API和进程名
+        self.stop_bbdown_btn.setEnabled(False)
+        if self.local_pool.is_running():
+            self.bbdown_stop_thread = BBDownManagerThread("stop", supervisor=self.local_pool)
+        else:
+            self.bbdown_stop_thread = BBDownManagerThread("stop_external", base_url=self.api_client.base_url)
+        self.bbdown_stop_thread.finished.connect(self.handle_stop_finished)
+        self.bbdown_stop_thread.start()
+    
+    def handle_stop_finished(self, success, message):
+        """处理停止完成"""
+        if success:
+            QMessageBox.information(self, "成功", message)
+        else:
+            self.stop_bbdown_btn.setEnabled(True)
+            QMessageBox.warning(self, "警告", message)
+        self.update_server_status()
+    
+    def update_server_status(self):
+        """更新服务端进程状态显示"""
+        self.sync_local_pool_servers()
+        statuses = [supervisor.status() for _, supervisor in sorted(self.local_pool.instances.items())]
+        self.update_pool_table(statuses)
+        if not statuses:
+            self.server_status_label.setText("")
+            return
+        if len(statuses) == 1:
+            status = statuses[0]
+            uptime = int(status["uptime"])
+            text = f"{SERVER_STATE_NAMES.get(status['state'], status['state'])} · 端口 {status['port']}"
+            if status["pid"]:
+                text += f" · PID {status['pid']} · 已运行 {uptime // 3600:02d}:{uptime % 3600 // 60:02d}:{uptime % 60:02d}"
+            text += f" · 重启 {status['restarts']} 次"
+        else:
+            running = sum(1 for status in statuses if status["state"] == "running")
+            restarts = sum(status["restarts"] for status in statuses)
+            text = f"本地服务池 · 运行中 {running}/{len(statuses)} 个实例 · 重启 {restarts} 次"
+        self.server_status_label.setText(text)
+        self.stop_bbdown_btn.setEnabled(self.local_pool.is_running())
+    
+    def update_pool_table(self, statuses):
+        """刷新本地服务池实例表"""
+        load = {}
+        for task in self.last_tasks.get("Running", []):
+            load[task.get("_Server")] = load.get(task.get("_Server"), 0) + 1
+        self.pool_table.setRowCount(len(statuses))
+        for row, status in enumerate(statuses):
+            uptime = int(status["uptime"])
+            server_key = f"{self.local_pool_host()}:{status['port']}"
+            values = [
+                str(status["port"]),
+                SERVER_STATE_NAMES.get(status["state"], status["state"]),
+                str(status["pid"] or "-"),
+                f"{uptime // 3600:02d}:{uptime % 3600 // 60:02d}:{uptime % 60:02d}" if status["pid"] else "-",
+                str(status["restarts"]),
+                str(load.get(server_key, 0)),
+                self.local_pool.work_dir_for(status["port"]) or "（任务指定）",
+            ]
+            for column, value in enumerate(values):
+                self.pool_table.setItem(row, column, QTableWidgetItem(value))
     
     def delete_bbdown_files(self):
         """删除BBDown服务端文件"""
@@ -1767,44 +7984,31 @@ class BBDownGUI(QMainWindow):
         if reply != QMessageBox.Yes:
             return
         
-        try:
-            # 首先尝试停止服务器
-            try:
-                requests.post(f"{self.api_client.base_url}/shutdown", timeout=2)
-            except:
-                pass
-            
-            # 强制停止进程
-            system = platform.system().lower()
-            if system == "windows":
-                subprocess.run(["taskkill", "/f", "/im", "BBDown.exe"], 
-                             capture_output=True, text=True)
-            else:
-                subprocess.run(["pkill", "-f", "BBDown"], 
-                             capture_output=True, text=True)
-            
-            # 等待进程完全停止
-            import time
-            time.sleep(2)
-            
-            # 删除BBDown目录
-            bbdown_dir = os.path.join(os.path.expanduser("~"), ".bbdown")
-            if os.path.exists(bbdown_dir):
-                import shutil
-                shutil.rmtree(bbdown_dir)
-                QMessageBox.information(self, "成功", "BBDown文件已删除")
-                
-                # 重置按钮状态
-                self.bbdown_path = None
-                self.start_bbdown_btn.setEnabled(False)
-                self.stop_bbdown_btn.setEnabled(False)
-                self.delete_bbdown_btn.setEnabled(False)
-                self.download_bbdown_btn.setText("下载BBDown")
-            else:
-                QMessageBox.information(self, "提示", "BBDown文件目录不存在")
-                
-        except Exception as e:
-            QMessageBox.critical(self, "错误", f"删除文件失败: {str(e)}")
+        # 停止服务器和删除文件都在后台线程中进行，不阻塞界面
+        self.delete_bbdown_btn.setEnabled(False)
+        self.start_bbdown_btn.setEnabled(False)
+        self.stop_bbdown_btn.setEnabled(False)
+        self.bbdown_delete_thread = BBDownManagerThread(
+            "delete", supervisor=self.local_pool, base_url=self.api_client.base_url
+        )
+        self.bbdown_delete_thread.finished.connect(self.handle_delete_finished)
+        self.bbdown_delete_thread.start()
+    
+    def handle_delete_finished(self, success, message):
+        """处理删除BBDown文件结果"""
+        self.update_server_status()
+        if not success:
+            self.delete_bbdown_btn.setEnabled(True)
+            self.start_bbdown_btn.setEnabled(bool(self.bbdown_path and os.path.exists(self.bbdown_path)))
+            QMessageBox.critical(self, "错误", message)
+            return
+        QMessageBox.information(self, "成功" if message == "BBDown文件已删除" else "提示", message)
+        # 重置按钮状态
+        self.bbdown_path = None
+        self.start_bbdown_btn.setEnabled(False)
+        self.stop_bbdown_btn.setEnabled(False)
+        self.delete_bbdown_btn.setEnabled(False)
+        self.download_bbdown_btn.setText("下载BBDown")
     
     def web_login(self):
         """Web接口登录"""
@@ -1837,20 +8041,13 @@ class BBDownGUI(QMainWindow):
         self.web_login_btn.setEnabled(False)
         self.web_login_btn.setText("等待登录完成...")
         
-        # 记录登录开始时间和数据文件路径
-        bbdown_dir = os.path.dirname(self.bbdown_path)
-        self.web_data_file = os.path.join(bbdown_dir, "BBDown.data")
-        self.web_login_start_time = time.time()
+        # 记录登录开始时间，凭据文件更新后由凭据监控通知
+        self.begin_login_wait("web")
         
         # 创建登录线程
         self.web_login_thread = LoginThread(self.bbdown_path, "login")
         self.web_login_thread.finished.connect(self.handle_web_login_finished)
         self.web_login_thread.start()
-        
-        # 启动文件监控定时器
-        self.web_file_timer = QTimer()
-        self.web_file_timer.timeout.connect(self.check_web_login_file)
-        self.web_file_timer.start(2000)  # 每2秒检查一次
     
     def tv_login(self):
         """App/TV接口登录"""
@@ -1883,230 +8080,94 @@ class BBDownGUI(QMainWindow):
         self.tv_login_btn.setEnabled(False)
         self.tv_login_btn.setText("等待登录完成...")
         
-        # 记录登录开始时间和数据文件路径
-        bbdown_dir = os.path.dirname(self.bbdown_path)
-        self.tv_data_file = os.path.join(bbdown_dir, "BBDownTV.data")
-        self.tv_login_start_time = time.time()
+        # 记录登录开始时间，凭据文件更新后由凭据监控通知
+        self.begin_login_wait("tv")
         
         # 创建登录线程
         self.tv_login_thread = LoginThread(self.bbdown_path, "logintv")
         self.tv_login_thread.finished.connect(self.handle_tv_login_finished)
         self.tv_login_thread.start()
-        
-        # 启动文件监控定时器
-        self.tv_file_timer = QTimer()
-        self.tv_file_timer.timeout.connect(self.check_tv_login_file)
-        self.tv_file_timer.start(2000)  # 每2秒检查一次
+    
+    def begin_login_wait(self, kind):
+        """开始等待登录写入凭据文件，5分钟后超时"""
+        started_at = time.time()
+        self._login_started[kind] = started_at
+        QTimer.singleShot(300 * 1000, lambda: self.handle_login_timeout(kind, started_at))
+    
+    def end_login_wait(self, kind):
+        self._login_started.pop(kind, None)
+        if kind == "web":
+            self.web_login_btn.setEnabled(True)
+            self.web_login_btn.setText("Web接口登录")
+        else:
+            self.tv_login_btn.setEnabled(True)
+            self.tv_login_btn.setText("App/TV接口登录")
+    
+    def handle_login_timeout(self, kind, started_at):
+        """登录等待超时"""
+        if self._login_started.get(kind) != started_at:
+            return
+        self.end_login_wait(kind)
+        QMessageBox.warning(self, "超时", "等待登录超时，请重试")
     
     def handle_web_login_finished(self, success, message):
         """处理Web登录完成"""
-        self.web_login_btn.setEnabled(True)
-        self.web_login_btn.setText("Web接口登录")
-        
         if success:
-            # 读取BBDown.data文件
-            bbdown_dir = os.path.dirname(self.bbdown_path)
-            data_file = os.path.join(bbdown_dir, "BBDown.data")
-            
-            try:
-                if os.path.exists(data_file):
-                    with open(data_file, 'r', encoding='utf-8') as f:
-                        cookie_data = f.read().strip()
-                    
-                    # 更新显示区域
-                    self.cookie_display.setPlainText(cookie_data)
-                    
-                    # 自动填入添加任务选项卡的cookie输入框
-                    if hasattr(self, 'options_form') and hasattr(self.options_form, 'cookie'):
-                        self.options_form.cookie.setText(cookie_data)
-                    
-                    QMessageBox.information(self, "成功", "Web接口登录成功，Cookie已自动填入添加任务选项卡")
-                else:
-                    QMessageBox.warning(self, "警告", "登录可能成功，但未找到BBDown.data文件")
-            except Exception as e:
-                QMessageBox.warning(self, "错误", f"读取登录数据失败: {str(e)}")
+            # 登录命令已结束，立即检查凭据文件（通常已由文件事件处理）
+            if "web" in self._login_started:
+                self.credential_watcher.refresh("web")
+                QTimer.singleShot(1000, lambda: self.handle_login_without_credential("web"))
         else:
+            self.end_login_wait("web")
             QMessageBox.warning(self, "错误", f"Web接口登录失败: {message}")
     
     def handle_tv_login_finished(self, success, message):
         """处理TV登录完成"""
-        self.tv_login_btn.setEnabled(True)
-        self.tv_login_btn.setText("App/TV接口登录")
-        
         if success:
-            # 读取BBDownTV.data文件
-            bbdown_dir = os.path.dirname(self.bbdown_path)
-            data_file = os.path.join(bbdown_dir, "BBDownTV.data")
-            
-            try:
-                if os.path.exists(data_file):
-                    with open(data_file, 'r', encoding='utf-8') as f:
-                        token_data = f.read().strip()
-                    
-                    # 更新显示区域
-                    self.token_display.setPlainText(token_data)
-                    
-                    # 自动填入添加任务选项卡的Access Token输入框
-                    if hasattr(self, 'options_form') and hasattr(self.options_form, 'access_token'):
-                        self.options_form.access_token.setText(token_data)
-                    
-                    QMessageBox.information(self, "成功", "App/TV接口登录成功，Access Token已自动填入添加任务选项卡")
-                else:
-                    QMessageBox.warning(self, "警告", "登录可能成功，但未找到BBDownTV.data文件")
-            except Exception as e:
-                QMessageBox.warning(self, "错误", f"读取登录数据失败: {str(e)}")
+            if "tv" in self._login_started:
+                self.credential_watcher.refresh("tv")
+                QTimer.singleShot(1000, lambda: self.handle_login_without_credential("tv"))
         else:
+            self.end_login_wait("tv")
             QMessageBox.warning(self, "错误", f"App/TV接口登录失败: {message}")
     
-    def check_web_login_file(self):
-        """检查Web登录数据文件是否更新"""
-        try:
-            if os.path.exists(self.web_data_file):
-                # 检查文件修改时间是否在登录开始之后
-                file_mtime = os.path.getmtime(self.web_data_file)
-                if file_mtime > self.web_login_start_time:
-                    # 停止定时器
-                    self.web_file_timer.stop()
-                    
-                    # 读取文件内容
-                    with open(self.web_data_file, 'r', encoding='utf-8') as f:
-                        cookie_data = f.read().strip()
-                    
-                    if cookie_data:
-                        # 更新显示区域
-                        self.cookie_display.setPlainText(cookie_data)
-                        
-                        # 自动填入添加任务选项卡的cookie输入框
-                        if hasattr(self, 'options_form') and hasattr(self.options_form, 'cookie'):
-                            self.options_form.cookie.setText(cookie_data)
-                        
-                        # 恢复按钮状态
-                        self.web_login_btn.setEnabled(True)
-                        self.web_login_btn.setText("Web接口登录")
-                        
-                        QMessageBox.information(self, "成功", "Web接口登录成功，Cookie已自动填入添加任务选项卡")
-                        return
-            
-            # 检查超时（5分钟）
-            if time.time() - self.web_login_start_time > 300:
-                self.web_file_timer.stop()
-                self.web_login_btn.setEnabled(True)
-                self.web_login_btn.setText("Web接口登录")
-                QMessageBox.warning(self, "超时", "等待登录超时，请重试")
-                
-        except Exception as e:
-            self.web_file_timer.stop()
-            self.web_login_btn.setEnabled(True)
-            self.web_login_btn.setText("Web接口登录")
-            QMessageBox.warning(self, "错误", f"检查登录文件失败: {str(e)}")
-    
-    def check_tv_login_file(self):
-        """检查TV登录数据文件是否更新"""
-        try:
-            if os.path.exists(self.tv_data_file):
-                # 检查文件修改时间是否在登录开始之后
-                file_mtime = os.path.getmtime(self.tv_data_file)
-                if file_mtime > self.tv_login_start_time:
-                    # 停止定时器
-                    self.tv_file_timer.stop()
-                    
-                    # 读取文件内容
-                    with open(self.tv_data_file, 'r', encoding='utf-8') as f:
-                        token_data = f.read().strip()
-                    
-                    if token_data:
-                        # 更新显示区域
-                        self.token_display.setPlainText(token_data)
-                        
-                        # 自动填入添加任务选项卡的Access Token输入框
-                        if hasattr(self, 'options_form') and hasattr(self.options_form, 'access_token'):
-                            self.options_form.access_token.setText(token_data)
-                        
-                        # 恢复按钮状态
-                        self.tv_login_btn.setEnabled(True)
-                        self.tv_login_btn.setText("App/TV接口登录")
-                        
-                        QMessageBox.information(self, "成功", "App/TV接口登录成功，Access Token已自动填入添加任务选项卡")
-                        return
-            
-            # 检查超时（5分钟）
-            if time.time() - self.tv_login_start_time > 300:
-                self.tv_file_timer.stop()
-                self.tv_login_btn.setEnabled(True)
-                self.tv_login_btn.setText("App/TV接口登录")
-                QMessageBox.warning(self, "超时", "等待登录超时，请重试")
-                
-        except Exception as e:
-            self.tv_file_timer.stop()
-            self.tv_login_btn.setEnabled(True)
-            self.tv_login_btn.setText("App/TV接口登录")
-            QMessageBox.warning(self, "错误", f"检查登录文件失败: {str(e)}")
-    
-    def load_existing_auth_data(self):
-        """启动时自动读取已有的认证数据文件"""
-        print("[DEBUG] 开始加载认证数据")
-        if not self.bbdown_path or not os.path.exists(self.bbdown_path):
-            print(f"[DEBUG] BBDown路径不存在或未设置: {self.bbdown_path}")
+    def handle_login_without_credential(self, kind):
+        """登录命令成功结束但凭据文件没有更新"""
+        if kind not in self._login_started:
             return
-        
-        bbdown_dir = os.path.dirname(self.bbdown_path)
-        print(f"[DEBUG] BBDown目录: {bbdown_dir}")
-        
-        # 读取Web接口认证数据
-        web_data_file = os.path.join(bbdown_dir, "BBDown.data")
-        print(f"[DEBUG] 检查Web认证数据文件: {web_data_file}")
-        if os.path.exists(web_data_file):
-            print("[DEBUG] Web认证数据文件存在，开始读取")
-            try:
-                with open(web_data_file, 'r', encoding='utf-8') as f:
-                    web_data = f.read().strip()
-                print(f"[DEBUG] 读取到Web认证数据长度: {len(web_data)}")
-                if web_data:
-                    # 更新Cookie显示区域
-                    if hasattr(self, 'cookie_display'):
-                        self.cookie_display.setPlainText(web_data)
-                        print("[DEBUG] 已更新Cookie显示区域")
-                    # 自动填充到添加任务选项卡
-                    if hasattr(self, 'options_form') and hasattr(self.options_form, 'cookie'):
-                        self.options_form.cookie.setText(web_data)
-                        print("[DEBUG] 已填充Cookie到添加任务选项卡")
-                        # 自动勾选网络设置组
-                        self.auto_check_network_group()
-                    print("已自动加载Web接口认证数据")
-                else:
-                    print("[DEBUG] Web认证数据文件为空")
-            except Exception as e:
-                print(f"读取Web接口认证数据失败: {str(e)}")
+        self.end_login_wait(kind)
+        QMessageBox.warning(self, "警告", f"登录可能成功，但未找到{CREDENTIAL_FILES[kind]}文件的更新")
+    
+    def apply_credential(self, kind, content, mtime):
+        """凭据文件更新：刷新显示并自动填入添加任务选项卡（尚未创建的选项卡在创建时填入）"""
+        self._credentials[kind] = content
+        if kind == "web":
+            if hasattr(self, 'cookie_display'):
+                self.cookie_display.setPlainText(content)
+            auth_log.info("已自动加载Web接口认证数据")
         else:
-            print("[DEBUG] Web认证数据文件不存在")
-        
-        # 读取TV接口认证数据
-        tv_data_file = os.path.join(bbdown_dir, "BBDownTV.data")
-        print(f"[DEBUG] 检查TV认证数据文件: {tv_data_file}")
-        if os.path.exists(tv_data_file):
-            print("[DEBUG] TV认证数据文件存在，开始读取")
-            try:
-                with open(tv_data_file, 'r', encoding='utf-8') as f:
-                    tv_data = f.read().strip()
-                print(f"[DEBUG] 读取到TV认证数据长度: {len(tv_data)}")
-                if tv_data:
-                    # 更新Access Token显示区域
-                    if hasattr(self, 'token_display'):
-                        self.token_display.setPlainText(tv_data)
-                        print("[DEBUG] 已更新Access Token显示区域")
-                    # 自动填充到添加任务选项卡
-                    if hasattr(self, 'options_form') and hasattr(self.options_form, 'access_token'):
-                        self.options_form.access_token.setText(tv_data)
-                        print("[DEBUG] 已填充Access Token到添加任务选项卡")
-                        # 自动勾选网络设置组
-                        self.auto_check_network_group()
-                    print("已自动加载App/TV接口认证数据")
-                else:
-                    print("[DEBUG] TV认证数据文件为空")
-            except Exception as e:
-                print(f"读取App/TV接口认证数据失败: {str(e)}")
+            if hasattr(self, 'token_display'):
+                self.token_display.setPlainText(content)
+            auth_log.info("已自动加载App/TV接口认证数据")
+        if hasattr(self, 'options_form'):
+            self.fill_credential_options(kind, content)
+        
+        # 登录过程中写入的凭据视为登录成功
+        started_at = self._login_started.get(kind)
+        if started_at is not None and mtime > started_at:
+            self.end_login_wait(kind)
+            if kind == "web":
+                QMessageBox.information(self, "成功", "Web接口登录成功，Cookie已自动填入添加任务选项卡")
+            else:
+                QMessageBox.information(self, "成功", "App/TV接口登录成功，Access Token已自动填入添加任务选项卡")
+    
+    def fill_credential_options(self, kind, content):
+        """将凭据填入任务选项表单"""
+        if kind == "web":
+            self.options_form.cookie.setText(content)
         else:
-            print("[DEBUG] TV认证数据文件不存在")
+            self.options_form.access_token.setText(content)
+        self.auto_check_network_group()
     
     def auto_check_network_group(self):
         """自动勾选网络设置组"""
@@ -2116,8 +8177,40 @@ class BBDownGUI(QMainWindow):
                 if child.title() == "网络设置":
                     if not child.isChecked():
                         child.setChecked(True)
-                        print("[DEBUG] 已自动勾选网络设置组")
+                        auth_log.debug("已自动勾选网络设置组")
                     break
+    
+    def closeEvent(self, event):
+        """退出时询问是否停止本程序启动的服务端；保留时服务端在后台继续下载，输出仍写入日志目录"""
+        if self.local_pool.is_running():
+            reply = QMessageBox.question(
+                self, "退出",
+                f"本程序启动的BBDown服务端（{self.local_pool.describe()}）仍在运行。\n\n"
+                "是否停止服务端？停止将中断所有正在进行的下载任务；\n"
+                f"选择“否”将保留服务端在后台继续运行，输出写入 {os.path.join(get_gui_data_dir(), 'server_logs')}",
+                QMessageBox.Yes | QMessageBox.No | QMessageBox.Cancel,
+                QMessageBox.No
+            )
+            if reply == QMessageBox.Cancel:
+                event.ignore()
+                return
+            if reply == QMessageBox.Yes:
+                self.local_pool.stop()
+            else:
+                self.local_pool.detach()
+        self.save_snapshot()
+        self.retrier.save()
+        if self.history_thread and self.history_thread.isRunning():
+            # 正在压缩历史文件时等待其完成
+            self.history_thread.wait()
+        if self.library_thread and self.library_thread.isRunning():
+            # 中断扫描并保存断点，下次启动时继续
+            self.library_thread.requestInterruption()
+            self.library_thread.wait(3000)
+        self.server_log.set_log_file(None)
+        if BBDownAPIClient.recorder:
+            BBDownAPIClient.recorder.close()
+        super().closeEvent(event)
 
 
 class LoginThread(QThread):
@@ -2178,6 +8271,287 @@ class LoginThread(QThread):
         except Exception as e:
             self.finished.emit(False, f"登录过程出错: {str(e)}")
 
+# 界面性能检查：在离屏模式下对本地模拟服务器运行GUI，测量刷新耗时、事件循环延迟、控件和内存增长
+# 计时阈值按开发机实测值留出余量（新增2000个任务时事件循环停顿实测约1.5秒）；
+# 计时结果依赖机器，CI（tests/test_perf.py）按 PERF_TIMING_TOLERANCE 放宽计时阈值后判定，控件和内存增长不放宽
+PERF_TIMING_TOLERANCE = 1.5
+PERF_THRESHOLDS = {
+    "refresh_p95_ms": 250,       # 稳定刷新时刷新处理函数耗时的95分位
+    "table_update_p95_ms": 200,  # 单次更新任务表耗时的95分位
+    "large_update_ms": 2000,     # 一次性新增大量已完成任务时的刷新处理耗时
+    "event_loop_lag_ms": 2000,   # 应用大量更新期间事件循环的最长停顿（含新增行的布局和绘制）
+    "widget_growth": 0,          # 反复刷新后控件数量的增长
+    "rss_growth_mb": 50,         # 反复刷新后常驻内存的增长
+}
+
+class PerfTaskSource:
+    """为性能检查生成逐步变化的任务列表：每次查询推进运行中任务的进度，部分任务结束并由新任务补上"""
+    
+    def __init__(self, running=100, finished=1000, seed=0):
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.next_aid = 0
+        self.max_finished = finished
+        self.running = [self._new_task() for _ in range(running)]
+        self.finished = [self._finish(self._new_task()) for _ in range(finished)]
+    
+    def _new_task(self):
+        self.next_aid += 1
+        return {
+            "Aid": str(self.next_aid),
+            "Title": f"性能检查任务 {self.next_aid} " + "标题" * self.random.randint(1, 20),
+            "Url": f"https://www.bilibili.com/video/av{self.next_aid}",
+            "TaskCreateTime": int(time.time()),
+            "TaskFinishTime": None,
+            "Progress": 0.0,
+            "DownloadSpeed": 0,
+            "TotalDownloadedBytes": 0,
+            "IsSuccessful": False,
+        }
+    
+    def _finish(self, task):
+        task.update(
+            TaskFinishTime=int(time.time()), DownloadSpeed=0,
+            IsSuccessful=self.random.random() > 0.1, Progress=1.0,
+        )
+        return task
+    
+    def step(self):
+        """推进一次：进度和速度变化，约2%的运行中任务结束，已完成列表保持原有长度"""
+        for task in self.running:
+            task["Progress"] = min(0.99, task["Progress"] + self.random.random() * 0.05)
+            task["DownloadSpeed"] = self.random.randint(0, 8 * 1024 ** 2)
+            task["TotalDownloadedBytes"] += task["DownloadSpeed"]
+        for index in range(len(self.running)):
+            if self.random.random() < 0.02:
+                self.finished.append(self._finish(self.running[index]))
+                self.running[index] = self._new_task()
+        del self.finished[:max(0, len(self.finished) - self.max_finished)]
+    
+    def grow(self, count):
+        """一次性新增大量已完成任务"""
+        with self.lock:
+            self.finished.extend(self._finish(self._new_task()) for _ in range(count))
+            self.max_finished = len(self.finished)
+    
+    def get_tasks(self):
+        with self.lock:
+            self.step()
+            return {"Running": self.running, "Finished": self.finished}
+
+class PerfRequestHandler(BaseHTTPRequestHandler):
+    """模拟BBDown的任务查询接口"""
+    protocol_version = "HTTP/1.1"
+    source = None
+    
+    def log_message(self, format, *args):
+        pass
+    
+    def do_GET(self):
+        tasks = self.source.get_tasks()
+        data = {"/get-tasks/": tasks, "/get-tasks/running": tasks["Running"],
+                "/get-tasks/finished": tasks["Finished"]}.get(self.path)
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8') if data is not None else b""
+        self.send_response(200 if data is not None else 404)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def current_rss():
+    """当前进程的常驻内存（字节），Linux读取 /proc，其他平台使用峰值，无法读取时返回None"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0
+
+def measure_gui_performance(app, window, cycles, grow=None, large=0, warmup=20, timeout=60):
+    """驱动GUI刷新并收集性能指标；grow(count) 用于新增大量任务以测量大更新，超过timeout秒仍未完成时抛出异常"""
+    refresh_times, table_times = [], []
+    handle_refresh_result = window.handle_refresh_result
+    update_task_table = window.update_task_table
+    on_refreshed = []  # 刷新处理完成后调用
+    
+    def timed_refresh(tasks):
+        started = time.perf_counter()
+        handle_refresh_result(tasks)
+        refresh_times.append(time.perf_counter() - started)
+        for callback in on_refreshed:
+            callback()
+    
+    def timed_table_update(*args):
+        started = time.perf_counter()
+        update_task_table(*args)
+        table_times.append(time.perf_counter() - started)
+    
+    # 刷新处理函数在连接信号时按实例属性查找，替换后定时刷新和手动刷新都会计时
+    window.handle_refresh_result = timed_refresh
+    window.update_task_table = timed_table_update
+    
+    def refresh_once():
+        # 查询在计时之外完成，只测量界面处理
+        timed_refresh(window.server_pool.get_tasks())
+        app.sendPostedEvents(None, QEvent.DeferredDelete)
+        app.processEvents()
+    
+    for _ in range(warmup):
+        refresh_once()
+    widgets_before, rss_before = len(app.allWidgets()), current_rss()
+    del refresh_times[:], table_times[:]
+    for _ in range(cycles):
+        refresh_once()
+    results = {
+        "refresh_p50_ms": percentile(refresh_times, 0.5) * 1000,
+        "refresh_p95_ms": percentile(refresh_times, 0.95) * 1000,
+        "refresh_max_ms": max(refresh_times, default=0) * 1000,
+        "table_update_p95_ms": percentile(table_times, 0.95) * 1000,
+        "widgets": len(app.allWidgets()),
+        "widget_growth": len(app.allWidgets()) - widgets_before,
+    }
+    rss_after = current_rss()
+    if rss_before is not None and rss_after is not None:
+        results["rss_growth_mb"] = (rss_after - rss_before) / 1024 ** 2
+    
+    if grow and large:
+        # 通过正常的后台刷新路径应用大更新，同时用5毫秒定时器测量事件循环的停顿
+        grow(large)
+        gaps = []
+        last_tick = [time.perf_counter()]
+        
+        def tick():
+            now = time.perf_counter()
+            gaps.append(now - last_tick[0])
+            last_tick[0] = now
+        
+        ticker = QTimer()
+        ticker.timeout.connect(tick)
+        ticker.start(5)
+        loop = QEventLoop()
+        timed_out = []
+        # 在启动刷新前挂上回调，不会错过很快结束的刷新；刷新处理后再等200毫秒，计入布局和绘制
+        on_refreshed.append(lambda: QTimer.singleShot(200, loop.quit))
+        QTimer.singleShot(int(timeout * 1000), lambda: (timed_out.append(True), loop.quit()))
+        del refresh_times[:]
+        window.start_refresh_tasks()
+        loop.exec_()
+        ticker.stop()
+        del on_refreshed[:]
+        if timed_out:
+            window.handle_refresh_result = handle_refresh_result
+            window.update_task_table = update_task_table
+            raise Exception(f"新增 {large} 个任务后的刷新在 {timeout} 秒内没有完成")
+        results["large_update_ms"] = max(refresh_times, default=0) * 1000
+        results["event_loop_lag_ms"] = max(0, max(gaps, default=0) - 0.005) * 1000
+    
+    window.handle_refresh_result = handle_refresh_result
+    window.update_task_table = update_task_table
+    return results
+
+def run_gui_perf_session(cycles=1000, tasks=300, large=2000, replay=None, speed=1.0, server=None):
+    """离屏启动GUI连接进程内的模拟服务器（或回放录制）并测量，返回各项指标
+
+    使用临时数据目录，不读写用户的任务历史和设置
+    """
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    data_home = tempfile.mkdtemp(prefix="bbdown_perf_")
+    saved_home = {name: os.environ.get(name) for name in ("HOME", "USERPROFILE")}
+    os.environ["HOME"] = os.environ["USERPROFILE"] = data_home
+    
+    grow = None
+    if replay:
+        ReplayRequestHandler.replay = TrafficReplay(replay, speed, server)
+        httpd = QuietHTTPServer(("127.0.0.1", 0), ReplayRequestHandler)
+        ReplayRequestHandler.replay.start()
+    else:
+        PerfRequestHandler.source = PerfTaskSource(max(1, tasks // 10), tasks)
+        httpd = QuietHTTPServer(("127.0.0.1", 0), PerfRequestHandler)
+        grow = PerfRequestHandler.source.grow
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+    window = BBDownGUI()
+    try:
+        window.show()
+        window.refresh_timer.stop()  # 由检查按固定节奏驱动刷新
+        window.verify_outputs_check.setChecked(False)  # 模拟任务没有输出文件
+        window.set_api_client("127.0.0.1", httpd.server_address[1])
+        return measure_gui_performance(app, window, cycles, grow, large)
+    finally:
+        window.close()
+        httpd.shutdown()
+        httpd.server_close()
+        for name, value in saved_home.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+        shutil.rmtree(data_home, ignore_errors=True)
+
+def perf_limit(thresholds, name, tolerance=1.0):
+    limit = thresholds.get(name)
+    if limit is None or not name.endswith("_ms"):
+        return limit
+    return limit * tolerance
+
+def evaluate_perf_results(results, thresholds, timing="enforce", tolerance=1.0):
+    """按阈值判定性能指标，计时指标（*_ms）的阈值乘以 tolerance
+
+    返回 (未通过的指标, 只报告的指标)；timing 为 report 时超出的计时指标只报告不判定失败
+    """
+    failed, advisory = [], []
+    for name, value in results.items():
+        limit = perf_limit(thresholds, name, tolerance)
+        if limit is not None and value > limit:
+            (advisory if timing == "report" and name.endswith("_ms") else failed).append(name)
+    return failed, advisory
+
+def run_perf_check(args):
+    """命令行性能检查：测量结果超过阈值时返回1"""
+    thresholds = dict(PERF_THRESHOLDS)
+    for item in args.perf_threshold or []:
+        name, _, value = item.partition("=")
+        if name not in thresholds:
+            print(f"未知的性能指标: {name}（可用: {', '.join(thresholds)}）", file=sys.stderr)
+            return 2
+        thresholds[name] = float(value)
+    
+    try:
+        results = run_gui_perf_session(
+            args.perf_cycles, args.perf_tasks, args.perf_large,
+            args.replay, args.speed, args.server[0] if args.server else None,
+        )
+    except Exception as e:
+        print(f"性能检查未通过: {str(e)}", file=sys.stderr)
+        return 1
+    
+    failed, advisory = evaluate_perf_results(results, thresholds, args.perf_timing, args.perf_tolerance)
+    print(f"{'指标':<22}{'结果':>12}{'阈值':>12}")
+    for name, value in results.items():
+        limit = perf_limit(thresholds, name, args.perf_tolerance)
+        note = "  超出阈值（仅报告）" if name in advisory else "  超出阈值" if name in failed else ""
+        print(f"{name:<22}{value:>12.1f}{'' if limit is None else f'{limit:>12g}':>12}{note}")
+    if args.perf_report:
+        write_json_atomic(args.perf_report, {
+            "results": results, "thresholds": thresholds, "failed": failed,
+            "advisory": advisory, "timing": args.perf_timing, "tolerance": args.perf_tolerance,
+        })
+    if failed:
+        print(f"性能检查未通过: {', '.join(failed)}", file=sys.stderr)
+        return 1
+    print("性能检查通过")
+    return 0
+
 
 # 应用启动优化
 if __name__ == "__main__":
@@ -2189,8 +8563,57 @@ if __name__ == "__main__":
         except:
             pass
     
+    # 命令行参数，其余参数交给Qt
+    parser = argparse.ArgumentParser(description="BBDown任务管理器")
+    parser.add_argument("--relay", action="store_true", help="以任务中继模式运行（无界面）：轮询BBDown一次，向所有GUI推送变化")
+    parser.add_argument("--proxy", action="store_true", help="以缓存代理模式运行（无界面）：为任务查询提供ETag/304和压缩，合并并发请求")
+    parser.add_argument("--upstream", default="localhost:58682", help="中继、代理或 --enqueue 使用的BBDown服务器 host:port")
+    parser.add_argument("--listen", default="0.0.0.0:58700", help="中继或代理的监听地址 host:port")
+    parser.add_argument("--interval", type=float, default=2.0, help="中继轮询或定时下载检查间隔（秒）")
+    parser.add_argument("--export", metavar="PATH", help="导出任务历史到文件（无界面），格式由扩展名或 --format 决定")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, help="导出格式，parquet需要安装pyarrow")
+    parser.add_argument("--history", metavar="PATH", help="任务历史文件，默认为 ~/.bbdown_gui/task_history.jsonl")
+    parser.add_argument("--since", metavar="YYYY-MM-DD", help="只导出此日期及之后结束的任务")
+    parser.add_argument("--until", metavar="YYYY-MM-DD", help="只导出此日期及之前结束的任务")
+    parser.add_argument("--server", action="append", metavar="HOST:PORT", help="只导出指定服务器的任务，可重复指定；回放时选择回放哪台服务器的录制")
+    parser.add_argument("--status", choices=("success", "failed"), help="只导出成功或失败的任务")
+    parser.add_argument("--headless", action="store_true", help="以定时下载模式运行（无界面）：按下载时段和并发上限提交队列中的任务")
+    parser.add_argument("--enqueue", action="append", metavar="URL", help="将任务加入队列（提交到 --upstream），可重复指定；配合 --headless 在时段内提交")
+    parser.add_argument("--work-dir", help="--enqueue 加入的任务使用的工作目录")
+    parser.add_argument("--record", metavar="PATH", help="把与BBDown服务器之间的请求和响应录制到文件（.jsonl.gz），可附在问题报告中")
+    parser.add_argument("--replay", metavar="PATH", help="以回放模式运行（无界面）：在 --listen 地址上按录制时间线返回录制的响应")
+    parser.add_argument("--speed", type=float, default=1.0, help="回放速度倍数，如 10 表示以10倍速回放")
+    parser.add_argument("--perf-check", action="store_true", help="离屏运行界面性能检查：对本地模拟服务器（或 --replay 录制）反复刷新，超过阈值时返回非零")
+    parser.add_argument("--perf-cycles", type=int, default=1000, help="性能检查的刷新次数")
+    parser.add_argument("--perf-tasks", type=int, default=300, help="模拟服务器的已完成任务数（运行中任务为其十分之一）")
+    parser.add_argument("--perf-large", type=int, default=2000, help="测量大更新时一次性新增的已完成任务数")
+    parser.add_argument("--perf-threshold", action="append", metavar="NAME=VALUE", help="覆盖性能阈值，如 refresh_p95_ms=100，可重复指定")
+    parser.add_argument("--perf-report", metavar="PATH", help="把性能检查结果写入JSON文件")
+    parser.add_argument("--perf-timing", choices=("enforce", "report"), default="enforce",
+                        help="计时指标超出阈值时判定失败（enforce），或只报告（report）")
+    parser.add_argument("--perf-tolerance", type=float, default=1.0, help="计时阈值的放宽倍数，如 1.5 表示允许超出阈值50%%")
+    parser.add_argument("--log-level", choices=LOG_LEVELS, default="INFO", help="程序日志级别，运行中也可在服务器日志选项卡中调整")
+    args, qt_args = parser.parse_known_args()
+    setup_logging(args.log_level)
+    if args.record:
+        BBDownAPIClient.recorder = TrafficRecorder(args.record)
+        atexit.register(BBDownAPIClient.recorder.close)
+    
+    if args.perf_check:
+        sys.exit(run_perf_check(args))
+    if args.export:
+        sys.exit(run_export(args))
+    if args.relay:
+        sys.exit(run_relay(args.listen, args.upstream, args.interval))
+    if args.proxy:
+        sys.exit(run_proxy(args.listen, args.upstream))
+    if args.replay:
+        sys.exit(run_replay(args.replay, args.listen, args.speed, args.server[0] if args.server else None))
+    if args.headless or args.enqueue:
+        sys.exit(run_scheduler(args))
+    
     # 创建应用实例
-    app = QApplication(sys.argv)
+    app = QApplication(sys.argv[:1] + qt_args)
     
     # 设置应用样式
     app.setStyle("Fusion")
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# 测试在离屏模式下运行，直接导入仓库根目录的 bbdown_gui.py
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
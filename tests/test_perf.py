@@ -0,0 +1,38 @@
+"""界面性能回归检查
+
+离屏启动GUI连接进程内的模拟BBDown服务器，反复刷新后判定各项指标。
+计时指标按 PERF_TIMING_TOLERANCE（可用环境变量 BBDOWN_PERF_TOLERANCE 覆盖）放宽后判定，
+控件和内存增长不放宽；设置 BBDOWN_PERF_REPORT 时把结果写入该JSON文件。
+"""
+import os
+
+import pytest
+
+import bbdown_gui
+
+
+@pytest.fixture(scope="module")
+def tolerance():
+    return float(os.environ.get("BBDOWN_PERF_TOLERANCE", bbdown_gui.PERF_TIMING_TOLERANCE))
+
+
+@pytest.fixture(scope="module")
+def perf_results(tolerance):
+    results = bbdown_gui.run_gui_perf_session()
+    path = os.environ.get("BBDOWN_PERF_REPORT")
+    if path:
+        failed, advisory = bbdown_gui.evaluate_perf_results(
+            results, bbdown_gui.PERF_THRESHOLDS, tolerance=tolerance
+        )
+        bbdown_gui.write_json_atomic(path, {
+            "results": results, "thresholds": bbdown_gui.PERF_THRESHOLDS, "failed": failed,
+            "advisory": advisory, "timing": "enforce", "tolerance": tolerance,
+        })
+    return results
+
+
+@pytest.mark.parametrize("name", sorted(bbdown_gui.PERF_THRESHOLDS))
+def test_within_threshold(perf_results, tolerance, name):
+    assert name in perf_results, f"没有测量到 {name}"
+    limit = bbdown_gui.perf_limit(bbdown_gui.PERF_THRESHOLDS, name, tolerance)
+    assert perf_results[name] <= limit, f"{name} = {perf_results[name]:.1f}，超过阈值 {limit:g}"
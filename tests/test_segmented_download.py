@@ -0,0 +1,141 @@
+"""SegmentedDownloader 对支持Range的HTTP服务器的分段并行下载、断点续传和摘要校验"""
+import hashlib
+import os
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import bbdown_gui
+
+DATA = os.urandom(2 * 1024 * 1024 + 123)
+DIGEST = "sha256:" + hashlib.sha256(DATA).hexdigest()
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    """返回 DATA 的Range服务器，记录请求的区间和并发数，可让指定起点的分段请求中途断开一次"""
+    protocol_version = "HTTP/1.1"
+    server_version = "RangeTest"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        match = re.fullmatch(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+        if not match:
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(DATA)))
+            self.end_headers()
+            self.wfile.write(DATA)
+            return
+        start = int(match.group(1))
+        end = min(int(match.group(2) or len(DATA) - 1), len(DATA) - 1)
+        body = DATA[start:end + 1]
+        with server.lock:
+            server.ranges.append((start, end))
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+            interrupt = start in server.interrupt_at
+            server.interrupt_at.discard(start)
+        try:
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(DATA)}")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            if end > start:
+                time.sleep(0.1)  # 让各分段请求在时间上重叠
+            if interrupt:
+                # 只发送一部分就断开连接，客户端会收到不完整的响应
+                self.wfile.write(body[:len(body) // 3])
+                self.wfile.flush()
+                self.close_connection = True
+                return
+            self.wfile.write(body)
+        finally:
+            with server.lock:
+                server.active -= 1
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), RangeHandler)
+    httpd.daemon_threads = True
+    httpd.lock = threading.Lock()
+    httpd.ranges = []
+    httpd.active = httpd.max_active = 0
+    httpd.interrupt_at = set()
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def url_of(httpd):
+    return f"http://127.0.0.1:{httpd.server_address[1]}/BBDown.zip"
+
+
+def segment_starts(downloader):
+    return [seg["start"] for seg in downloader._plan_segments(len(DATA))]
+
+
+def test_parallel_segments(server, tmp_path):
+    downloader = bbdown_gui.SegmentedDownloader(segments=4, buffer_size=64 * 1024)
+    dest = str(tmp_path / "BBDown.zip")
+    assert downloader.download(url_of(server), dest, len(DATA), DIGEST) == dest
+    with open(dest, 'rb') as f:
+        assert f.read() == DATA
+    # 探测请求之外每个分段各一个请求，且请求同时进行
+    segment_ranges = sorted(r for r in server.ranges if r != (0, 0))
+    assert [start for start, _ in segment_ranges] == segment_starts(downloader)
+    assert segment_ranges[-1][1] == len(DATA) - 1
+    assert server.max_active > 1
+    assert not os.path.exists(dest + ".part") and not os.path.exists(dest + ".part.json")
+
+
+def test_interrupted_segment_resumes(server, tmp_path):
+    downloader = bbdown_gui.SegmentedDownloader(segments=4, buffer_size=64 * 1024)
+    interrupted = segment_starts(downloader)[1]
+    server.interrupt_at.add(interrupted)
+    dest = str(tmp_path / "BBDown.zip")
+    downloader.download(url_of(server), dest, len(DATA), DIGEST)
+    assert not server.interrupt_at
+    with open(dest, 'rb') as f:
+        assert f.read() == DATA
+    # 中断的分段从已收到的位置继续请求，而不是从分段起点重新下载
+    retries = [start for start, _ in server.ranges if interrupted < start < interrupted + len(DATA) // 4]
+    assert len(retries) == 1
+
+
+def test_resume_after_cancel(server, tmp_path):
+    downloader = bbdown_gui.SegmentedDownloader(segments=4, buffer_size=64 * 1024, progress_interval=0)
+    dest = str(tmp_path / "BBDown.zip")
+    cancel = threading.Event()
+
+    def progress(done, total):
+        if done > total // 2:
+            cancel.set()
+
+    with pytest.raises(bbdown_gui.DownloadCancelled):
+        downloader.download(url_of(server), dest, len(DATA), DIGEST, progress, cancel)
+    assert os.path.exists(dest + ".part.json")
+
+    reports = []
+    del server.ranges[:]
+    downloader.download(url_of(server), dest, len(DATA), DIGEST, lambda done, total: reports.append(done))
+    with open(dest, 'rb') as f:
+        assert f.read() == DATA
+    # 续传从上次保存的进度开始，已完成的部分不再请求
+    assert reports[0] > 0
+    assert sum(end - start + 1 for start, end in server.ranges if (start, end) != (0, 0)) < len(DATA)
+
+
+def test_digest_mismatch(server, tmp_path):
+    downloader = bbdown_gui.SegmentedDownloader(segments=4, buffer_size=64 * 1024)
+    dest = str(tmp_path / "BBDown.zip")
+    with pytest.raises(Exception, match="摘要校验失败"):
+        downloader.download(url_of(server), dest, len(DATA), "sha256:" + "0" * 64)
+    assert not os.path.exists(dest) and not os.path.exists(dest + ".part")